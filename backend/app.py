@@ -1,47 +1,82 @@
-
-from flask import Flask, jsonify
+from flask import Flask
 from flask_cors import CORS
-import os
-from datetime import datetime
 from flask_bcrypt import Bcrypt
 
 # Import utility modules
 from utils.logging_config import setup_logging
-from utils.auth import token_required
-from config import DEBUG, SSH_HOSTS, SSH_PORT, SSH_USER
+from utils.db import remember_primary_reads
+from utils.sql_stats import start_request_tracking, add_server_timing, stop_request_tracking
+from utils.metrics import start_request_timer, observe_request, start_metrics_sampler
+from utils.tracing import start_request_trace, add_trace_header, end_request_trace
+from config import DEBUG, SSH_HOSTS, SSH_PORT, SSH_USER, SCHEDULER_ENABLED
 
 # Import route modules
 from routes.user_routes import user_routes
 from routes.teleport_routes import teleport_routes
+from routes.health_routes import health_routes
 
 # Import the task scheduler
 from scheduler import scheduler
 
-# Setup logging
-logger = setup_logging()
+bcrypt = Bcrypt()
+
+def create_app(start_scheduler=SCHEDULER_ENABLED):
+    """Create and configure the Flask application.
+
+    Creating the app does not connect to the database or load the SSH stack;
+    both are set up on first use.
+
+    Args:
+        start_scheduler: Run the task scheduler in this process. Turn this off
+            (SCHEDULER_ENABLED=false) when the scheduler runs on its own with
+            python -m scheduler.
+
+    Returns:
+        The Flask application.
+    """
+    # Setup logging
+    logger = setup_logging()
+
+    # Initialize Flask app
+    app = Flask(__name__)
+    CORS(app)
+    bcrypt.init_app(app)
+
+    # Register blueprints (routes)
+    app.register_blueprint(user_routes)
+    app.register_blueprint(teleport_routes)
+    app.register_blueprint(health_routes)
+
+    # Reads that follow a client's own writes go to the primary, not a replica
+    app.after_request(remember_primary_reads)
+
+    # Per-request statement count and DB time, returned as Server-Timing
+    app.before_request(start_request_tracking)
+    app.after_request(add_server_timing)
+    app.teardown_request(stop_request_tracking)
+
+    # Request latency histograms for /metrics
+    app.before_request(start_request_timer)
+    app.after_request(observe_request)
 
-# Initialize Flask app
-app = Flask(__name__)
-CORS(app)
-bcrypt = Bcrypt(app)
+    # Trace spans for the request, its SQL statements and SSH commands
+    app.before_request(start_request_trace)
+    app.after_request(add_trace_header)
+    app.teardown_request(end_request_trace)
 
-# Register blueprints (routes)
-app.register_blueprint(user_routes)
-app.register_blueprint(teleport_routes)
+    # Log the SSH configuration (excluding sensitive data)
+    logger.info("Loaded SSH configuration: hosts=%s, port=%s, user=%s", SSH_HOSTS, SSH_PORT, SSH_USER)
 
-# Log the SSH configuration (excluding sensitive data)
-logger.info(f"Loaded SSH configuration: hosts={SSH_HOSTS}, port={SSH_PORT}, user={SSH_USER}")
+    if start_scheduler:
+        logger.info("Starting the task scheduler")
+        scheduler.start()
+    else:
+        logger.info("In-process task scheduler disabled (SCHEDULER_ENABLED=false)")
+    start_metrics_sampler()
 
-@app.route('/health', methods=['GET'])
-def health_check():
-    """Health check endpoint."""
-    return jsonify({"status": "healthy", "timestamp": datetime.now().isoformat()})
+    return app
 
-# Start the scheduler when the app starts
-# Replace deprecated @app.before_first_request with proper startup function
-with app.app_context():
-    logger.info("Starting the task scheduler")
-    scheduler.start()
+app = create_app()
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=DEBUG)
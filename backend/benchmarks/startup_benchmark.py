@@ -0,0 +1,74 @@
+"""Measure how long the backend takes to start.
+
+Each run imports the app in a fresh interpreter, so module caches do not hide
+import costs. Run from the backend directory:
+
+    python benchmarks/startup_benchmark.py --runs 10
+
+The database and SSH hosts do not need to be reachable; nothing connects to
+them during startup.
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child interpreter and prints one JSON line
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - started
+from utils import db
+print(json.dumps({{
+    'seconds': elapsed,
+    'paramiko_loaded': 'paramiko' in sys.modules,
+    'engine_created': db._engine is not None
+}}))
+sys.stdout.flush()
+import os
+os._exit(0)
+"""
+
+TARGETS = {
+    'web': ('import app', {'SCHEDULER_ENABLED': 'false'}),
+    'web+scheduler': ('import app', {'SCHEDULER_ENABLED': 'true'}),
+    'scheduler': ('import scheduler', {})
+}
+
+def run_once(statement, env_overrides):
+    """Import the target in a new interpreter and return the probe's result."""
+    env = dict(os.environ, **env_overrides)
+    # Keep log files and traces out of the working tree
+    env.setdefault('LOG_FILE', os.devnull)
+    env.setdefault('TRACE_EXPORTER', 'none')
+    result = subprocess.run(
+        [sys.executable, '-c', _PROBE.format(statement=statement)],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10, help='fresh interpreters per target')
+    parser.add_argument('--target', choices=sorted(TARGETS), action='append',
+                        help='target to measure (default: all)')
+    args = parser.parse_args()
+
+    for name in args.target or TARGETS:
+        statement, env_overrides = TARGETS[name]
+        results = [run_once(statement, env_overrides) for _ in range(args.runs)]
+        times = [r['seconds'] * 1000 for r in results]
+        print(
+            f"{name:<14} median {statistics.median(times):7.1f}ms  "
+            f"min {min(times):7.1f}ms  max {max(times):7.1f}ms  "
+            f"paramiko loaded: {results[-1]['paramiko_loaded']}  "
+            f"engine created: {results[-1]['engine_created']}"
+        )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,5 @@
+from prometheus_client import multiprocess
+
+def child_exit(server, worker):
+    """Drop a dead worker's live gauges so they stop counting towards /metrics."""
+    multiprocess.mark_process_dead(worker.pid)
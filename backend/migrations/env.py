@@ -11,7 +11,7 @@ sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 # Import the Base object from our models
 from models import Base
-from config import DB_CONFIG
+from utils.db import database_url
 
 # This is the Alembic Config object
 config = context.config
@@ -21,8 +21,9 @@ if config.config_file_name is not None:
     fileConfig(config.config_file_name)
 
 # Set the SQLAlchemy URL    
-db_url = f"postgresql://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}/{DB_CONFIG['database']}"
-config.set_main_option('sqlalchemy.url', db_url)
+db_url = database_url().render_as_string(hide_password=False)
+# ConfigParser treats % as interpolation, so escape it in the password
+config.set_main_option('sqlalchemy.url', db_url.replace('%', '%%'))
 
 # Add your model's MetaData object here
 target_metadata = Base.metadata
@@ -0,0 +1,57 @@
+"""Add scheduled task archive and job list indexes
+
+Revision ID: 10_add_task_archive
+Revises: 9_add_task_retries
+Create Date: 2026-10-17 07:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '10_add_task_archive'
+down_revision = '9_add_task_retries'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Create scheduled_tasks_archive table for finished tasks past retention
+    op.create_table(
+        'scheduled_tasks_archive',
+        sa.Column('id', sa.String(50), primary_key=True),
+        sa.Column('user_id', sa.String(50), nullable=False),
+        sa.Column('user_name', sa.String(255), nullable=False),
+        sa.Column('portal', sa.String(50), nullable=False),
+        sa.Column('scheduled_time', sa.DateTime, nullable=False),
+        sa.Column('action', sa.String(10), nullable=False),
+        sa.Column('roles', sa.String, nullable=False),
+        sa.Column('role_list', postgresql.ARRAY(sa.String()), nullable=False, server_default='{}'),
+        sa.Column('status', sa.String(20), nullable=False),  # completed, failed, dead
+        sa.Column('created_at', sa.DateTime),
+        sa.Column('executed_at', sa.DateTime, nullable=True),
+        sa.Column('result', sa.String, nullable=True),
+        sa.Column('attempt_count', sa.Integer, nullable=False, server_default='0'),
+        sa.Column('last_error', sa.String, nullable=True),
+        sa.Column('archived_at', sa.DateTime, nullable=False, server_default=sa.text('CURRENT_TIMESTAMP'))
+    )
+
+    # Create indexes
+    op.create_index('idx_scheduled_tasks_archive_time_id', 'scheduled_tasks_archive', ['scheduled_time', 'id'])
+    op.create_index('idx_scheduled_tasks_archive_user_id', 'scheduled_tasks_archive', ['user_id'])
+    op.create_index('idx_scheduled_tasks_time_id', 'scheduled_tasks', ['scheduled_time', 'id'])
+    op.create_index(
+        'idx_scheduled_tasks_finished', 'scheduled_tasks',
+        [sa.text('coalesce(executed_at, created_at)')],
+        postgresql_where=sa.text("status IN ('completed', 'failed', 'dead')")
+    )
+
+def downgrade():
+    # Drop indexes
+    op.drop_index('idx_scheduled_tasks_finished')
+    op.drop_index('idx_scheduled_tasks_time_id')
+    op.drop_index('idx_scheduled_tasks_archive_user_id')
+    op.drop_index('idx_scheduled_tasks_archive_time_id')
+
+    # Drop table
+    op.drop_table('scheduled_tasks_archive')
@@ -0,0 +1,38 @@
+"""Add join_tokens table for the pre-minted node join token pool
+
+Revision ID: 11_add_join_tokens
+Revises: 10_add_task_archive
+Create Date: 2026-10-17 08:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '11_add_join_tokens'
+down_revision = '10_add_task_archive'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Create join_tokens table, shared by all backend processes
+    op.create_table(
+        'join_tokens',
+        sa.Column('token', sa.String(255), primary_key=True),
+        sa.Column('portal', sa.String(50), nullable=False),
+        sa.Column('roles', sa.String, nullable=False),
+        sa.Column('ca_pin', sa.String, nullable=True),
+        sa.Column('auth_server', sa.String, nullable=True),
+        sa.Column('expires_at', sa.DateTime, nullable=False),
+        sa.Column('created_at', sa.DateTime, server_default=sa.text('CURRENT_TIMESTAMP'))
+    )
+
+    # Create indexes
+    op.create_index('idx_join_tokens_portal_expires', 'join_tokens', ['portal', 'expires_at'])
+
+def downgrade():
+    # Drop indexes
+    op.drop_index('idx_join_tokens_portal_expires')
+
+    # Drop table
+    op.drop_table('join_tokens')
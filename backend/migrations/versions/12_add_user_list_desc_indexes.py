@@ -0,0 +1,39 @@
+"""Add descending user list indexes matching the NULLS LAST sort order
+
+Revision ID: 12_add_user_list_desc_indexes
+Revises: 11_add_join_tokens
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '12_add_user_list_desc_indexes'
+down_revision = '11_add_join_tokens'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Descending sorts keep NULLs last, which a backward scan of the ascending
+    # indexes cannot produce; give them indexes in the same order
+    op.create_index('idx_users_name_desc_id', 'users', [sa.text('name DESC NULLS LAST'), sa.text('id DESC')])
+    op.create_index(
+        'idx_users_portal_name_desc_id', 'users',
+        ['portal', sa.text('name DESC NULLS LAST'), sa.text('id DESC')]
+    )
+    op.create_index(
+        'idx_users_created_date_desc_id', 'users',
+        [sa.text('created_date DESC NULLS LAST'), sa.text('id DESC')]
+    )
+    op.create_index(
+        'idx_users_last_login_desc_id', 'users',
+        [sa.text('last_login DESC NULLS LAST'), sa.text('id DESC')]
+    )
+
+def downgrade():
+    # Drop indexes
+    op.drop_index('idx_users_last_login_desc_id')
+    op.drop_index('idx_users_created_date_desc_id')
+    op.drop_index('idx_users_portal_name_desc_id')
+    op.drop_index('idx_users_name_desc_id')
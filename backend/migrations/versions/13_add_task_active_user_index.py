@@ -0,0 +1,26 @@
+"""Add a per-user index over scheduled and running tasks for claiming
+
+Revision ID: 13_add_task_active_user_index
+Revises: 12_add_user_list_desc_indexes
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '13_add_task_active_user_index'
+down_revision = '12_add_user_list_desc_indexes'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # The scheduler claims whole users and skips users with a running group
+    op.create_index(
+        'idx_scheduled_tasks_active_user', 'scheduled_tasks', ['portal', 'user_name'],
+        postgresql_where=sa.text("status IN ('scheduled', 'running')")
+    )
+
+def downgrade():
+    # Drop indexes
+    op.drop_index('idx_scheduled_tasks_active_user')
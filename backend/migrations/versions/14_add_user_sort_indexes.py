@@ -0,0 +1,33 @@
+"""Add keyset indexes for sorting users by status, manager and portal
+
+Revision ID: 14_add_user_sort_indexes
+Revises: 13_add_task_active_user_index
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '14_add_user_sort_indexes'
+down_revision = '13_add_task_active_user_index'
+branch_labels = None
+depends_on = None
+
+# Sort keys offered by GET /api/users that had no (column, id) index
+SORT_COLUMNS = ('status', 'manager', 'portal')
+
+def upgrade():
+    # One index per direction, matching the NULLS LAST order of each
+    for column in SORT_COLUMNS:
+        op.create_index(f'idx_users_{column}_id', 'users', [column, 'id'])
+        op.create_index(
+            f'idx_users_{column}_desc_id', 'users',
+            [sa.text(f'{column} DESC NULLS LAST'), sa.text('id DESC')]
+        )
+
+def downgrade():
+    # Drop indexes
+    for column in reversed(SORT_COLUMNS):
+        op.drop_index(f'idx_users_{column}_desc_id')
+        op.drop_index(f'idx_users_{column}_id')
@@ -0,0 +1,35 @@
+"""Add user fingerprints and portal sync state
+
+Revision ID: 3_add_sync_fingerprints
+Revises: 2_add_scheduled_tasks
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '3_add_sync_fingerprints'
+down_revision = '2_add_scheduled_tasks'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Existing rows start without a fingerprint; the first sync of each portal fills them in
+    op.add_column('users', sa.Column('spec_fingerprint', sa.String(64), nullable=True))
+
+    # Create portal_sync_state table
+    op.create_table(
+        'portal_sync_state',
+        sa.Column('portal', sa.String(50), primary_key=True),
+        sa.Column('snapshot_hash', sa.String(64), nullable=True),
+        sa.Column('user_count', sa.Integer, nullable=False, server_default='0'),
+        sa.Column('synced_at', sa.DateTime, nullable=True)
+    )
+
+def downgrade():
+    # Drop table
+    op.drop_table('portal_sync_state')
+
+    # Drop column
+    op.drop_column('users', 'spec_fingerprint')
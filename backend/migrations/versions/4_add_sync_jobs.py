@@ -0,0 +1,49 @@
+"""Add sync_jobs table
+
+Revision ID: 4_add_sync_jobs
+Revises: 3_add_sync_fingerprints
+Create Date: 2026-10-17 01:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '4_add_sync_jobs'
+down_revision = '3_add_sync_fingerprints'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Create sync_jobs table
+    op.create_table(
+        'sync_jobs',
+        sa.Column('id', sa.String(50), primary_key=True),
+        sa.Column('portal', sa.String(50), nullable=False),
+        sa.Column('status', sa.String(20), nullable=False, server_default='queued'),  # queued, running, completed, failed
+        sa.Column('phase', sa.String(20), nullable=False, server_default='queued'),
+        sa.Column('processed', sa.Integer, nullable=False, server_default='0'),
+        sa.Column('message', sa.String, nullable=True),
+        sa.Column('counts', sa.JSON, nullable=True),
+        sa.Column('timings', sa.JSON, nullable=True),
+        sa.Column('orphaned_users', sa.JSON, nullable=True),
+        sa.Column('created_at', sa.DateTime, server_default=sa.text('CURRENT_TIMESTAMP')),
+        sa.Column('started_at', sa.DateTime, nullable=True),
+        sa.Column('updated_at', sa.DateTime, server_default=sa.text('CURRENT_TIMESTAMP')),
+        sa.Column('finished_at', sa.DateTime, nullable=True)
+    )
+    
+    # Create indexes
+    op.create_index('idx_sync_jobs_portal_created_at', 'sync_jobs', ['portal', 'created_at'])
+    op.create_index(
+        'uq_sync_jobs_active_portal', 'sync_jobs', ['portal'], unique=True,
+        postgresql_where=sa.text("status IN ('queued', 'running')")
+    )
+
+def downgrade():
+    # Drop indexes
+    op.drop_index('uq_sync_jobs_active_portal')
+    op.drop_index('idx_sync_jobs_portal_created_at')
+    
+    # Drop table
+    op.drop_table('sync_jobs')
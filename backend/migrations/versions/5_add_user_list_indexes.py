@@ -0,0 +1,38 @@
+"""Add indexes for server-side user listing
+
+Revision ID: 5_add_user_list_indexes
+Revises: 4_add_sync_jobs
+Create Date: 2026-10-17 02:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '5_add_user_list_indexes'
+down_revision = '4_add_sync_jobs'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Keyset pagination indexes: sort column with id as the tie-breaker
+    op.create_index('idx_users_name_id', 'users', ['name', 'id'])
+    op.create_index('idx_users_portal_name_id', 'users', ['portal', 'name', 'id'])
+    op.create_index('idx_users_created_date_id', 'users', ['created_date', 'id'])
+    op.create_index('idx_users_last_login_id', 'users', ['last_login', 'id'])
+
+    # Filter indexes
+    op.create_index('idx_users_manager', 'users', ['manager'])
+    op.create_index(
+        'idx_users_lower_name_pattern', 'users',
+        [sa.text('lower(name) text_pattern_ops')]
+    )
+
+def downgrade():
+    # Drop indexes
+    op.drop_index('idx_users_lower_name_pattern')
+    op.drop_index('idx_users_manager')
+    op.drop_index('idx_users_last_login_id')
+    op.drop_index('idx_users_created_date_id')
+    op.drop_index('idx_users_portal_name_id')
+    op.drop_index('idx_users_name_id')
@@ -0,0 +1,41 @@
+"""Add normalized role arrays
+
+Revision ID: 6_add_role_arrays
+Revises: 5_add_user_list_indexes
+Create Date: 2026-10-17 03:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '6_add_role_arrays'
+down_revision = '5_add_user_list_indexes'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Add role arrays alongside the comma-separated roles columns
+    for table in ('users', 'scheduled_tasks'):
+        op.add_column(table, sa.Column(
+            'role_list', postgresql.ARRAY(sa.String()), nullable=False, server_default='{}'
+        ))
+
+        # Backfill from the existing comma-separated strings, dropping empty entries
+        op.execute(f"""
+            UPDATE {table}
+            SET role_list = array_remove(string_to_array(roles, ','), '')
+            WHERE roles IS NOT NULL AND roles <> ''
+        """)
+
+    # Create indexes
+    op.create_index('idx_users_role_list', 'users', ['role_list'], postgresql_using='gin')
+
+def downgrade():
+    # Drop indexes
+    op.drop_index('idx_users_role_list')
+    
+    # Drop columns
+    op.drop_column('scheduled_tasks', 'role_list')
+    op.drop_column('users', 'role_list')
@@ -0,0 +1,26 @@
+"""Add partial index for the scheduler wakeup queries
+
+Revision ID: 7_add_scheduler_wakeup_index
+Revises: 6_add_role_arrays
+Create Date: 2026-10-17 04:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '7_add_scheduler_wakeup_index'
+down_revision = '6_add_role_arrays'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Only pending tasks are ever scanned by the scheduler
+    op.create_index(
+        'idx_scheduled_tasks_pending_time', 'scheduled_tasks', ['scheduled_time'],
+        postgresql_where=sa.text("status = 'scheduled'")
+    )
+
+def downgrade():
+    # Drop indexes
+    op.drop_index('idx_scheduled_tasks_pending_time')
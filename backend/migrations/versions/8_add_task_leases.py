@@ -0,0 +1,34 @@
+"""Add lease columns for claiming scheduled tasks
+
+Revision ID: 8_add_task_leases
+Revises: 7_add_scheduler_wakeup_index
+Create Date: 2026-10-17 05:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '8_add_task_leases'
+down_revision = '7_add_scheduler_wakeup_index'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Worker that claimed a running task and when its claim lapses
+    op.add_column('scheduled_tasks', sa.Column('lease_owner', sa.String(100), nullable=True))
+    op.add_column('scheduled_tasks', sa.Column('lease_expires_at', sa.DateTime, nullable=True))
+
+    # Create indexes
+    op.create_index(
+        'idx_scheduled_tasks_running_lease', 'scheduled_tasks', ['lease_expires_at'],
+        postgresql_where=sa.text("status = 'running'")
+    )
+
+def downgrade():
+    # Drop indexes
+    op.drop_index('idx_scheduled_tasks_running_lease')
+
+    # Drop columns
+    op.drop_column('scheduled_tasks', 'lease_expires_at')
+    op.drop_column('scheduled_tasks', 'lease_owner')
@@ -0,0 +1,42 @@
+"""Add retry bookkeeping to scheduled tasks
+
+Revision ID: 9_add_task_retries
+Revises: 8_add_task_leases
+Create Date: 2026-10-17 06:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '9_add_task_retries'
+down_revision = '8_add_task_leases'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Retry state: attempts made, when the next one is due and the last error seen
+    op.add_column('scheduled_tasks', sa.Column('attempt_count', sa.Integer, nullable=False, server_default='0'))
+    op.add_column('scheduled_tasks', sa.Column('next_attempt_at', sa.DateTime, nullable=True))
+    op.add_column('scheduled_tasks', sa.Column('last_error', sa.String, nullable=True))
+
+    # Pending tasks are now due at their retry time when one is set
+    op.drop_index('idx_scheduled_tasks_pending_time')
+    op.create_index(
+        'idx_scheduled_tasks_pending_due', 'scheduled_tasks',
+        [sa.text('coalesce(next_attempt_at, scheduled_time)')],
+        postgresql_where=sa.text("status = 'scheduled'")
+    )
+
+def downgrade():
+    # Drop indexes
+    op.drop_index('idx_scheduled_tasks_pending_due')
+    op.create_index(
+        'idx_scheduled_tasks_pending_time', 'scheduled_tasks', ['scheduled_time'],
+        postgresql_where=sa.text("status = 'scheduled'")
+    )
+
+    # Drop columns
+    op.drop_column('scheduled_tasks', 'last_error')
+    op.drop_column('scheduled_tasks', 'next_attempt_at')
+    op.drop_column('scheduled_tasks', 'attempt_count')
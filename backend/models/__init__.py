@@ -1,4 +1,6 @@
 
 from .user import User, Base
-from .scheduled_task import ScheduledTask
-
+from .scheduled_task import ScheduledTask, ScheduledTaskArchive
+from .portal_sync_state import PortalSyncState
+from .sync_job import SyncJob
+from .join_token import JoinToken
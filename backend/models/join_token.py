@@ -0,0 +1,26 @@
+
+from sqlalchemy import Column, String, DateTime, Index, func
+from .user import Base
+
+class JoinToken(Base):
+    """A pooled node join token.
+
+    The token is stored in plaintext: it is handed out as is and tctl revokes
+    it by value, so a hash would serve neither. Rows only live until the token
+    is taken or revoked, but anyone who can read this table can join nodes to
+    the portal until then; restrict database access accordingly.
+    """
+    __tablename__ = 'join_tokens'
+
+    token = Column(String(255), primary_key=True)
+    portal = Column(String(50), nullable=False)
+    roles = Column(String, nullable=False)  # Comma-separated, e.g. node
+    ca_pin = Column(String, nullable=True)
+    auth_server = Column(String, nullable=True)
+    expires_at = Column(DateTime, nullable=False)  # UTC
+    created_at = Column(DateTime, default=func.current_timestamp())
+
+    __table_args__ = (
+        # Hand-out takes the usable token of a portal that expires first
+        Index('idx_join_tokens_portal_expires', 'portal', 'expires_at'),
+    )
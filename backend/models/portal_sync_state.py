@@ -0,0 +1,11 @@
+
+from sqlalchemy import Column, String, DateTime, Integer
+from .user import Base
+
+class PortalSyncState(Base):
+    __tablename__ = 'portal_sync_state'
+
+    portal = Column(String(50), primary_key=True)
+    snapshot_hash = Column(String(64), nullable=True)  # Order-independent hash of all user fingerprints
+    user_count = Column(Integer, nullable=False, default=0)
+    synced_at = Column(DateTime, nullable=True)
@@ -1,7 +1,10 @@
 
-from sqlalchemy import Column, String, DateTime, ForeignKey, func
+from sqlalchemy import Column, String, DateTime, Integer, ForeignKey, Index, func, event, text
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
+from sqlalchemy.ext.hybrid import hybrid_property
+from .user import split_roles
 
 Base = declarative_base()
 
@@ -15,7 +18,70 @@ class ScheduledTask(Base):
     scheduled_time = Column(DateTime, nullable=False)
     action = Column(String(10), nullable=False)  # 'add' or 'remove'
     roles = Column(String, nullable=False)  # Comma-separated list of roles
-    status = Column(String(20), nullable=False, default='scheduled')  # scheduled, completed, failed
+    role_list = Column(ARRAY(String), nullable=False, default=list)  # roles as an array
+    status = Column(String(20), nullable=False, default='scheduled')  # scheduled, running, completed, failed, dead
     created_at = Column(DateTime, default=func.current_timestamp())
     executed_at = Column(DateTime, nullable=True)
     result = Column(String, nullable=True)  # Result output or error message
+    lease_owner = Column(String(100), nullable=True)  # Scheduler worker that claimed the task
+    lease_expires_at = Column(DateTime, nullable=True)  # Claim lapses after this time
+    attempt_count = Column(Integer, nullable=False, default=0)  # Executions started so far
+    next_attempt_at = Column(DateTime, nullable=True)  # Retry time after a transient failure
+    last_error = Column(String, nullable=True)  # Error from the most recent failed attempt
+
+    __table_args__ = (
+        # Serves the scheduler's wakeup and due-task queries
+        Index('idx_scheduled_tasks_pending_due', func.coalesce(next_attempt_at, scheduled_time),
+              postgresql_where=text("status = 'scheduled'")),
+        # Serves the scheduler's per-user claim and running-group checks
+        Index('idx_scheduled_tasks_active_user', portal, user_name,
+              postgresql_where=text("status IN ('scheduled', 'running')")),
+        # Serves expired lease recovery
+        Index('idx_scheduled_tasks_running_lease', lease_expires_at,
+              postgresql_where=text("status = 'running'")),
+        # Keyset pagination of the jobs list
+        Index('idx_scheduled_tasks_time_id', scheduled_time, id),
+        # Serves the retention job that archives finished tasks
+        Index('idx_scheduled_tasks_finished', func.coalesce(executed_at, created_at),
+              postgresql_where=text("status IN ('completed', 'failed', 'dead')")),
+    )
+
+    @hybrid_property
+    def due_at(self):
+        """When the task should next run: its retry time if set, otherwise its scheduled time."""
+        return self.next_attempt_at or self.scheduled_time
+
+    @due_at.expression
+    def due_at(cls):
+        return func.coalesce(cls.next_attempt_at, cls.scheduled_time)
+
+@event.listens_for(ScheduledTask, 'before_insert')
+@event.listens_for(ScheduledTask, 'before_update')
+def _refresh_role_list(mapper, connection, target):
+    """Keep role_list in step with ORM writes to roles."""
+    target.role_list = split_roles(target.roles)
+
+class ScheduledTaskArchive(Base):
+    """Finished tasks moved out of scheduled_tasks by the retention job."""
+    __tablename__ = 'scheduled_tasks_archive'
+
+    id = Column(String(50), primary_key=True)
+    user_id = Column(String(50), nullable=False)
+    user_name = Column(String(255), nullable=False)
+    portal = Column(String(50), nullable=False)
+    scheduled_time = Column(DateTime, nullable=False)
+    action = Column(String(10), nullable=False)
+    roles = Column(String, nullable=False)
+    role_list = Column(ARRAY(String), nullable=False, default=list)
+    status = Column(String(20), nullable=False)  # completed, failed, dead
+    created_at = Column(DateTime)
+    executed_at = Column(DateTime, nullable=True)
+    result = Column(String, nullable=True)
+    attempt_count = Column(Integer, nullable=False, default=0)
+    last_error = Column(String, nullable=True)
+    archived_at = Column(DateTime, nullable=False, default=func.current_timestamp())
+
+    __table_args__ = (
+        Index('idx_scheduled_tasks_archive_time_id', scheduled_time, id),
+        Index('idx_scheduled_tasks_archive_user_id', user_id),
+    )
@@ -0,0 +1,26 @@
+
+from sqlalchemy import Column, String, DateTime, Integer, JSON, Index, func
+from .user import Base
+
+class SyncJob(Base):
+    __tablename__ = 'sync_jobs'
+
+    id = Column(String(50), primary_key=True)
+    portal = Column(String(50), nullable=False)
+    status = Column(String(20), nullable=False, default='queued')  # queued, running, completed, failed
+    phase = Column(String(20), nullable=False, default='queued')  # queued, fetching, applying, committing, done
+    processed = Column(Integer, nullable=False, default=0)  # Users processed so far
+    message = Column(String, nullable=True)
+    counts = Column(JSON, nullable=True)  # inserted/updated/unchanged/orphaned counts
+    timings = Column(JSON, nullable=True)  # Per-phase timings in milliseconds
+    orphaned_users = Column(JSON, nullable=True)
+    created_at = Column(DateTime, default=func.current_timestamp())
+    started_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=func.current_timestamp())
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # At most one active job per portal; a second request attaches to it
+        Index('uq_sync_jobs_active_portal', 'portal', unique=True,
+              postgresql_where=status.in_(['queued', 'running'])),
+    )
@@ -1,21 +1,50 @@
 
-from sqlalchemy import Column, String, DateTime, func, CheckConstraint
+import json
+import hashlib
+from sqlalchemy import Column, String, DateTime, func, CheckConstraint, Index, event
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
 
+def split_roles(roles):
+    """Split a comma-separated role string into a list of role names."""
+    return [role for role in roles.split(',') if role] if roles else []
+
+def user_fingerprint(name, roles, status, portal):
+    """Hash the user fields that are synced from Teleport.
+
+    Args:
+        name: Teleport user name.
+        roles: Comma-separated role string as stored in users.roles.
+        status: User status.
+        portal: Portal name.
+    """
+    payload = json.dumps([name, roles or '', status, portal], separators=(',', ':'))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
 class User(Base):
     __tablename__ = 'users'
 
     id = Column(String(50), primary_key=True)
     name = Column(String(255), nullable=False)
     roles = Column(String, nullable=True)
+    role_list = Column(ARRAY(String), nullable=False, default=list)  # roles as an array, GIN-indexed for role queries
     created_date = Column(DateTime, default=func.current_timestamp())
     last_login = Column(DateTime, nullable=True)
     status = Column(String(20), nullable=True)
     manager = Column(String(255), nullable=True)
     portal = Column(String(50), nullable=True)
+    spec_fingerprint = Column(String(64), nullable=True)  # user_fingerprint() of the synced fields
 
     __table_args__ = (
         CheckConstraint(status.in_(['active', 'inactive', 'pending']), name='check_status'),
+        Index('idx_users_role_list', role_list, postgresql_using='gin'),
     )
+
+@event.listens_for(User, 'before_insert')
+@event.listens_for(User, 'before_update')
+def _refresh_derived_columns(mapper, connection, target):
+    """Keep role_list and the fingerprint in step with ORM writes to roles and the synced fields."""
+    target.role_list = split_roles(target.roles)
+    target.spec_fingerprint = user_fingerprint(target.name, target.roles, target.status, target.portal)
@@ -0,0 +1,59 @@
+from flask import Blueprint, jsonify, Response
+from datetime import datetime
+from utils.auth import token_required
+from utils.ssh import get_ssh_pool_stats
+from utils.db import get_db_pool_stats
+from utils.metrics import metrics_response
+from utils.logging_config import get_logging_stats
+from scheduler import scheduler
+from services.token_pool import token_pool
+
+# Create a Blueprint for health and monitoring routes
+health_routes = Blueprint('health_routes', __name__)
+
+@health_routes.route('/health', methods=['GET'])
+def health_check():
+    """Health check endpoint."""
+    return jsonify({"status": "healthy", "timestamp": datetime.now().isoformat()})
+
+@health_routes.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics, aggregated across all gunicorn workers."""
+    body, content_type = metrics_response()
+    return Response(body, content_type=content_type)
+
+@health_routes.route('/health/ssh', methods=['GET'])
+@token_required
+def ssh_pool_stats():
+    """Report statistics for the pooled SSH connections."""
+    return jsonify(get_ssh_pool_stats())
+
+@health_routes.route('/health/db', methods=['GET'])
+@token_required
+def db_pool_stats():
+    """Report database pool utilisation and checkout wait times."""
+    return jsonify(get_db_pool_stats())
+
+@health_routes.route('/health/logging', methods=['GET'])
+@token_required
+def logging_stats():
+    """Report the log queue backlog and records dropped because it was full."""
+    return jsonify(get_logging_stats())
+
+@health_routes.route('/health/token-pool', methods=['GET'])
+@token_required
+def token_pool_stats():
+    """Report pre-minted join tokens available and handed out per portal."""
+    return jsonify(token_pool.stats())
+
+@health_routes.route('/health/scheduler', methods=['GET'])
+@token_required
+def scheduler_stats():
+    """Report task scheduler statistics, including dispatch lag.
+
+    Only meaningful where the scheduler runs in the web process
+    (SCHEDULER_ENABLED); a standalone scheduler logs its own statistics.
+    """
+    stats = scheduler.stats()
+    stats['in_process'] = scheduler.running
+    return jsonify(stats)
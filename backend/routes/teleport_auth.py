@@ -16,16 +16,16 @@ def login():
     username = data.get('username')
     password = data.get('password')
 
-    logging.info(f"Login attempt for user: {username}")
+    logging.debug("Login attempt for user: %s", username)
 
     if username != AUTH_USERNAME or not bcrypt.check_password_hash(AUTH_PASSWORD_HASH, password):
-        logging.warning(f"Failed login attempt for user: {username}")
+        logging.warning("Failed login attempt for user: %s", username)
         return jsonify({'message': 'Invalid username or password'}), 401
 
     # Create JWT token
     token = generate_token(username)
 
-    logging.info(f"JWT token created for user: {username}")
+    logging.info("JWT token created for user: %s", username)
     return jsonify({'token': token})
 
 @teleport_auth_routes.route('/teleport/generate-hash', methods=['POST'])
@@ -1,13 +1,19 @@
 from flask import Blueprint, request, jsonify
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
 import uuid
+import shlex
 from utils.auth import token_required
-from utils.ssh import execute_ssh_command
-from models.user import User
-from models.scheduled_task import ScheduledTask
-from utils.db import get_db_session
+from utils.ssh import execute_ssh_command, execute_ssh_batch, is_transient_error
+from models.user import User, split_roles
+from models.scheduled_task import ScheduledTask, ScheduledTaskArchive
+from utils.db import get_db_session, get_read_session
+from scheduler.task_scheduler import notify_scheduler, retry_delay
+from services.user_queries import apply_user_filters, QueryError
+from services.task_queries import task_to_dict, apply_task_filters, list_tasks, parse_time, UNPAGED_MAX
+from config import SCHEDULE_BULK_MAX_USERS, SCHEDULER_MAX_ATTEMPTS
+from sqlalchemy import select, insert, update, func, bindparam
 
 # Create a Blueprint for teleport scheduler routes
 teleport_scheduler_routes = Blueprint('teleport_scheduler_routes', __name__)
@@ -57,6 +63,8 @@ def schedule_role_change():
                 status='scheduled'
             )
             session.add(scheduled_task)
+            # Wake the scheduler once the task is committed
+            notify_scheduler(session, task_id)
             session.commit()
             
             # Return success response
@@ -68,31 +76,187 @@ def schedule_role_change():
             
         except Exception as e:
             session.rollback()
-            logging.error(f"Database error while scheduling task: {str(e)}")
+            logging.error("Database error while scheduling task: %s", e)
             return jsonify({'success': False, 'message': f"Database error: {str(e)}"}), 500
         finally:
             session.close()
             
     except ValueError as e:
-        logging.error(f"Invalid datetime format: {scheduled_time_str}, error: {str(e)}")
+        logging.error("Invalid datetime format: %s, error: %s", scheduled_time_str, e)
         return jsonify({'success': False, 'message': 'Invalid datetime format'}), 400
 
+@teleport_scheduler_routes.route('/teleport/schedule-role-change-bulk', methods=['POST'])
+@token_required
+def schedule_role_change_bulk():
+    """Schedule the same role change for many users at a specific time.
+
+    Users are given either as a list of user ids (``userIds``) or as a
+    ``filter`` with any of portal, role and manager. They are validated with
+    one query and all tasks are inserted in one batched statement.
+    """
+    data = request.json
+    if not data:
+        return jsonify({'success': False, 'message': 'Missing request data'}), 400
+
+    required_fields = ['scheduledTime', 'action', 'roles']
+    for field in required_fields:
+        if field not in data:
+            return jsonify({'success': False, 'message': f'Missing required field: {field}'}), 400
+
+    user_ids = data.get('userIds')
+    user_filter = data.get('filter')
+    action = data['action']
+    roles = data['roles']
+    scheduled_time_str = data['scheduledTime']
+
+    if (user_ids is None) == (user_filter is None):
+        return jsonify({'success': False, 'message': 'Provide either userIds or filter'}), 400
+    if action not in ('add', 'remove'):
+        return jsonify({'success': False, 'message': "Invalid action. Use 'add' or 'remove'"}), 400
+    if not isinstance(roles, list) or not roles or not all(isinstance(r, str) and r for r in roles):
+        return jsonify({'success': False, 'message': 'roles must be a non-empty list of role names'}), 400
+    if user_ids is not None:
+        if not isinstance(user_ids, list) or not all(isinstance(i, str) for i in user_ids):
+            return jsonify({'success': False, 'message': 'userIds must be a list of user ids'}), 400
+        # Keep the caller's order but schedule each user once
+        user_ids = list(dict.fromkeys(user_ids))
+        if len(user_ids) > SCHEDULE_BULK_MAX_USERS:
+            return jsonify({'success': False, 'message': f'At most {SCHEDULE_BULK_MAX_USERS} users can be scheduled at once'}), 400
+    else:
+        if not isinstance(user_filter, dict) or not any(user_filter.get(key) for key in ('portal', 'role', 'manager')):
+            return jsonify({'success': False, 'message': 'filter must include at least one of portal, role, manager'}), 400
+
+    try:
+        scheduled_time = datetime.fromisoformat(scheduled_time_str.replace('Z', '+00:00'))
+    except (ValueError, AttributeError) as e:
+        logging.error("Invalid datetime format: %s, error: %s", scheduled_time_str, e)
+        return jsonify({'success': False, 'message': 'Invalid datetime format'}), 400
+
+    session = get_db_session()
+    try:
+        # Validate every user with one set-based query
+        query = select(User.id, User.name, User.portal)
+        if user_ids is not None:
+            query = query.where(User.id.in_(user_ids))
+        else:
+            query = apply_user_filters(
+                query,
+                portal=user_filter.get('portal'),
+                role=user_filter.get('role'),
+                manager=user_filter.get('manager')
+            ).order_by(User.portal, User.name).limit(SCHEDULE_BULK_MAX_USERS + 1)
+        users = {row.id: row for row in session.execute(query)}
+
+        if user_ids is None and len(users) > SCHEDULE_BULK_MAX_USERS:
+            return jsonify({'success': False, 'message': f'Filter matches more than {SCHEDULE_BULK_MAX_USERS} users'}), 400
+
+        errors = []
+        if user_ids is not None:
+            errors = [{'userId': user_id, 'message': 'User not found'} for user_id in user_ids if user_id not in users]
+            targets = [users[user_id] for user_id in user_ids if user_id in users]
+        else:
+            targets = list(users.values())
+
+        if not targets:
+            return jsonify({
+                'success': False,
+                'message': 'No valid users to schedule',
+                'task_ids': [],
+                'tasks': [],
+                'errors': errors
+            }), 400
+
+        roles_str = ','.join(roles)
+        rows = [{
+            'id': str(uuid.uuid4()),
+            'user_id': user.id,
+            'user_name': user.name,
+            'portal': user.portal,
+            'scheduled_time': scheduled_time,
+            'action': action,
+            'roles': roles_str,
+            # Core inserts skip the ORM listener that normally fills role_list
+            'role_list': list(roles),
+            'status': 'scheduled'
+        } for user in targets]
+
+        # One batched insert for every task
+        session.execute(insert(ScheduledTask), rows)
+        # Wake the scheduler once for the whole batch
+        notify_scheduler(session)
+        session.commit()
+
+        logging.info("Scheduled %s of %s for %d users on %s", action, roles_str, len(rows), scheduled_time_str)
+
+        return jsonify({
+            'success': True,
+            'message': f"Role change scheduled for {len(rows)} users on {scheduled_time_str}",
+            'task_ids': [row['id'] for row in rows],
+            'tasks': [
+                {'taskId': row['id'], 'userId': row['user_id'], 'userName': row['user_name'], 'portal': row['portal']}
+                for row in rows
+            ],
+            'errors': errors
+        })
+
+    except Exception as e:
+        session.rollback()
+        logging.error("Database error while scheduling bulk tasks: %s", e)
+        return jsonify({'success': False, 'message': f"Database error: {str(e)}"}), 500
+    finally:
+        session.close()
+
+def apply_role_change(current_roles, action, roles_to_change):
+    """Return the role list after applying an 'add' or 'remove' action."""
+    if action == 'add':
+        # Add roles that aren't already present
+        return current_roles + [r for r in roles_to_change if r not in current_roles]
+    # Remove specified roles
+    return [r for r in current_roles if r not in roles_to_change]
+
+def role_update_command(user_name, roles_str):
+    """Return the tctl command that sets a user's full role list."""
+    return f"sudo tctl users update --set-roles {shlex.quote(roles_str)} {shlex.quote(user_name)}"
+
+def _replay_role_changes(roles, tasks):
+    """Apply each task's add/remove action in order to a comma-separated role string."""
+    new_roles = split_roles(roles)
+    for task in tasks:
+        new_roles = apply_role_change(new_roles, task['action'], task['roles'])
+    return new_roles
+
 def execute_task_internal(data):
     """Internal function to execute a role change task without requiring an HTTP request.
-    This is used by the task scheduler.
     
     Args:
         data: Dictionary containing taskId, userName, portal, action, and roles.
         
+    Returns:
+        Dictionary with success status and message.
+    """
+    return execute_task_group_internal([data])
+
+def execute_task_group_internal(tasks):
+    """Execute several role change tasks for one user as a single tctl update.
+    This is used by the task scheduler.
+
+    The add/remove actions are replayed in the given order on top of the user's
+    current roles, one command sets the final role list, and every task is
+    marked with the shared result.
+
+    Args:
+        tasks: List of dictionaries containing taskId, userName, portal, action,
+            and roles, all for the same user and portal, in scheduled order.
+
     Returns:
         Dictionary with success status and message.
     """
     try:
-        task_id = data['taskId']
-        user_name = data['userName']
-        portal = data['portal']
-        action = data['action']
-        roles_to_change = data['roles']
+        task_ids = [task['taskId'] for task in tasks]
+        user_name = tasks[0]['userName']
+        portal = tasks[0]['portal']
+        # Set for tasks claimed by the scheduler; outcomes are only recorded while it holds them
+        lease_owner = tasks[0].get('leaseOwner')
         
         # Get the current user from database to know their current roles
         session = get_db_session()
@@ -101,50 +265,32 @@ def execute_task_internal(data):
             if not user:
                 return {'success': False, 'message': 'User not found in specified portal'}
             
-            # Get current roles as a list
-            current_roles = user.roles.split(',') if user.roles else []
-            
-            # Calculate new roles based on action
-            if action == 'add':
-                # Add roles that aren't already present
-                new_roles = current_roles + [r for r in roles_to_change if r not in current_roles]
-            else:  # remove
-                # Remove specified roles
-                new_roles = [r for r in current_roles if r not in roles_to_change]
+            # Replay every action in order to get the final role list
+            new_roles = _replay_role_changes(user.roles, tasks)
             
             # Join roles into comma-separated string for command
             roles_str = ','.join(new_roles)
             
             # Execute the command via SSH
-            command = f"sudo tctl users update --set-roles {roles_str} {user_name}"
-            output, error = execute_ssh_command(portal, command)
+            output, error = execute_ssh_command(portal, role_update_command(user_name, roles_str), invalidate_reads=True)
             
             if error:
-                logging.error(f"Error executing role change: {error}")
+                logging.error("Error executing role change: %s", error)
                 
-                # Update task status to failed
-                task = session.query(ScheduledTask).filter_by(id=task_id).first()
-                if task:
-                    task.status = 'failed'
-                    task.executed_at = datetime.now()
-                    task.result = error
-                    session.commit()
+                # Retry transient failures, otherwise mark the tasks failed
+                _fail_tasks(session, task_ids, error, lease_owner)
+                session.commit()
                 
                 return {'success': False, 'message': f"Error executing role change: {error}"}
             
             # Update user in database
-            user.roles = ','.join(new_roles)
+            user.roles = roles_str
             
             # Update task status
-            task = session.query(ScheduledTask).filter_by(id=task_id).first()
-            if task:
-                task.status = 'completed'
-                task.executed_at = datetime.now()
-                task.result = output
-            
+            _finish_tasks(session, task_ids, 'completed', output, lease_owner)
             session.commit()
             
-            logging.info(f"Task {task_id} completed successfully")
+            logging.info("Tasks %s completed successfully", ', '.join(task_ids))
             
             return {
                 'success': True,
@@ -154,16 +300,12 @@ def execute_task_internal(data):
         
         except Exception as e:
             session.rollback()
-            logging.error(f"Error during role execution: {str(e)}")
+            logging.error("Error during role execution: %s", e)
             
             # Try to update task status to failed
             try:
-                task = session.query(ScheduledTask).filter_by(id=task_id).first()
-                if task:
-                    task.status = 'failed'
-                    task.executed_at = datetime.now()
-                    task.result = str(e)
-                    session.commit()
+                _finish_tasks(session, task_ids, 'failed', str(e), lease_owner)
+                session.commit()
             except:
                 pass
                 
@@ -172,9 +314,173 @@ def execute_task_internal(data):
             session.close()
             
     except Exception as e:
-        logging.error(f"General error in execute_task_internal: {str(e)}")
+        logging.error("General error in execute_task_group_internal: %s", e)
         return {'success': False, 'message': f"Error: {str(e)}"}
 
+def execute_task_groups_internal(groups):
+    """Execute task groups for several users of one portal in a single SSH batch.
+
+    Every user's tctl update is sent as one remote script, so a portal with many
+    due changes pays for one channel and shell startup instead of one per user.
+
+    Args:
+        groups: List of task groups as accepted by execute_task_group_internal,
+            one per user, all for the same portal.
+
+    Returns:
+        List of result dictionaries, one per group, in the same order.
+    """
+    if len(groups) == 1:
+        return [execute_task_group_internal(groups[0])]
+
+    portal = groups[0][0]['portal']
+    lease_owner = groups[0][0].get('leaseOwner')
+    session = get_db_session()
+    try:
+        # Load every user in the batch with one query
+        names = [group[0]['userName'] for group in groups]
+        users = {
+            user.name: user
+            for user in session.query(User).filter(User.portal == portal, User.name.in_(names))
+        }
+
+        results = [None] * len(groups)
+        updates = []
+        for index, group in enumerate(groups):
+            user = users.get(group[0]['userName'])
+            if not user:
+                results[index] = {'success': False, 'message': 'User not found in specified portal'}
+                continue
+            updates.append((index, user, ','.join(_replay_role_changes(user.roles, group))))
+
+        if updates:
+            commands = [role_update_command(user.name, roles_str) for _, user, roles_str in updates]
+            outputs, batch_error = execute_ssh_batch(portal, commands, invalidate_reads=True)
+
+            # Outcomes are written together below rather than one statement per user
+            failed, finished = [], []
+            for position, (index, user, roles_str) in enumerate(updates):
+                task_ids = [task['taskId'] for task in groups[index]]
+                output, error = (None, batch_error) if batch_error else outputs[position]
+                if error:
+                    logging.error("Error executing role change for %s: %s", user.name, error)
+                    failed.append((task_ids, error))
+                    results[index] = {'success': False, 'message': f"Error executing role change: {error}"}
+                else:
+                    user.roles = roles_str
+                    finished.append((task_ids, output))
+                    results[index] = {'success': True, 'message': f"Roles updated for {user.name}", 'output': output}
+
+            if failed:
+                _fail_task_groups(session, failed, lease_owner)
+            if finished:
+                _finish_task_groups(session, finished, 'completed', lease_owner)
+
+        session.commit()
+        return results
+
+    except Exception as e:
+        session.rollback()
+        logging.error("Error during batched role execution on portal %s: %s", portal, e)
+        return [{'success': False, 'message': f"Execution error: {str(e)}"} for _ in groups]
+    finally:
+        session.close()
+
+def _fail_tasks(session, task_ids, error, lease_owner=None):
+    """Record a failed attempt on every task in a group.
+
+    Transient SSH/network errors send the tasks back to the queue with a
+    jittered exponential backoff until they run out of attempts, after which
+    they are marked dead. Any other error, including permission errors, fails
+    them immediately.
+    """
+    _fail_task_groups(session, [(task_ids, error)], lease_owner)
+
+def _fail_task_groups(session, failures, lease_owner=None):
+    """Record failed attempts for several groups, loading their tasks with one query.
+
+    Args:
+        session: Database session.
+        failures: List of (task_ids, error) pairs.
+        lease_owner: Only update tasks still leased by this scheduler worker, if given.
+    """
+    groups = {task_id: index for index, (task_ids, _) in enumerate(failures) for task_id in task_ids}
+    query = session.query(ScheduledTask).filter(ScheduledTask.id.in_(list(groups)))
+    if lease_owner is not None:
+        query = query.filter(ScheduledTask.lease_owner == lease_owner)
+    tasks = query.all()
+    _warn_lost_leases(len(groups), len(tasks))
+    now = datetime.now()
+
+    # One retry time per group: with separate jitter its tasks would come due
+    # apart, be claimed as separate groups and replay out of scheduled order
+    attempts = {}
+    for task in tasks:
+        index = groups[task.id]
+        attempts[index] = max(attempts.get(index, 0), task.attempt_count)
+    next_attempt_at = {index: now + timedelta(seconds=retry_delay(count)) for index, count in attempts.items()}
+
+    retried = False
+    for task in tasks:
+        index = groups[task.id]
+        error = failures[index][1]
+        task.last_error = error
+        task.lease_owner = None
+        task.lease_expires_at = None
+        if is_transient_error(error) and task.attempt_count < SCHEDULER_MAX_ATTEMPTS:
+            task.status = 'scheduled'
+            task.next_attempt_at = next_attempt_at[index]
+            retried = True
+            logging.warning("Task %s attempt %d failed, retrying at %s", task.id, task.attempt_count, task.next_attempt_at)
+        else:
+            task.status = 'dead' if is_transient_error(error) else 'failed'
+            task.executed_at = now
+            task.result = error
+    if retried:
+        # Make sure the scheduler wakes up for the retry time
+        notify_scheduler(session)
+
+def _warn_lost_leases(expected, updated):
+    if updated < expected:
+        # Another scheduler recovered them and will record its own outcome
+        logging.warning("%d tasks were no longer leased by this worker; their outcome was not recorded",
+                        expected - updated)
+
+def _finish_tasks(session, task_ids, status, result, lease_owner=None):
+    """Record the shared outcome on every task in a group.
+
+    With lease_owner, only tasks still leased by that scheduler worker are updated.
+    """
+    query = session.query(ScheduledTask).filter(ScheduledTask.id.in_(task_ids))
+    if lease_owner is not None:
+        query = query.filter(ScheduledTask.lease_owner == lease_owner)
+    updated = query.update({
+        'status': status,
+        'executed_at': datetime.now(),
+        'result': result
+    }, synchronize_session=False)
+    _warn_lost_leases(len(task_ids), updated)
+
+def _finish_task_groups(session, outcomes, status, lease_owner=None):
+    """Record each group's result on its tasks as one executemany UPDATE.
+
+    Args:
+        session: Database session.
+        outcomes: List of (task_ids, result) pairs.
+        status: Status to set on every task.
+        lease_owner: Only update tasks still leased by this scheduler worker, if given.
+    """
+    table = ScheduledTask.__table__
+    statement = update(table).where(table.c.id == bindparam('task_id'))
+    if lease_owner is not None:
+        statement = statement.where(table.c.lease_owner == lease_owner)
+    now = datetime.now()
+    session.execute(statement.values(status=status, executed_at=now, result=bindparam('task_result')), [
+        {'task_id': task_id, 'task_result': result}
+        for task_ids, result in outcomes
+        for task_id in task_ids
+    ])
+
 @teleport_scheduler_routes.route('/teleport/execute-role-change', methods=['POST'])
 @token_required
 def execute_role_change():
@@ -234,11 +540,10 @@ def execute_role_change_immediate():
             roles_str = ','.join(new_roles)
             
             # Execute the command via SSH
-            command = f"sudo tctl users update --set-roles {roles_str} {user_name}"
-            output, error = execute_ssh_command(portal, command)
+            output, error = execute_ssh_command(portal, role_update_command(user_name, roles_str), invalidate_reads=True)
             
             if error:
-                logging.error(f"Error executing immediate role change: {error}")
+                logging.error("Error executing immediate role change: %s", error)
                 return jsonify({'success': False, 'message': f"Error executing role change: {error}"}), 500
             
             # Update user in database
@@ -263,7 +568,7 @@ def execute_role_change_immediate():
             session.add(scheduled_task)
             session.commit()
             
-            logging.info(f"Immediate role change for {user_name} completed successfully")
+            logging.info("Immediate role change for %s completed successfully", user_name)
             
             return jsonify({
                 'success': True,
@@ -273,54 +578,105 @@ def execute_role_change_immediate():
             
         except Exception as e:
             session.rollback()
-            logging.error(f"Error during immediate role execution: {str(e)}")
+            logging.error("Error during immediate role execution: %s", e)
             return jsonify({'success': False, 'message': f"Execution error: {str(e)}"}), 500
         finally:
             session.close()
             
     except Exception as e:
-        logging.error(f"General error: {str(e)}")
+        logging.error("General error: %s", e)
         return jsonify({'success': False, 'message': f"Error: {str(e)}"}), 500
 
 @teleport_scheduler_routes.route('/teleport/scheduled-jobs', methods=['GET'])
 @token_required
 def get_scheduled_jobs():
-    """Get all scheduled jobs."""
+    """Get scheduled jobs, filtered and optionally paginated in SQL.
+
+    The result text is omitted; fetch a single job for it.
+
+    Query parameters:
+        status: Comma-separated statuses (scheduled, running, completed, failed, dead).
+        portal, userId, userName: Filters.
+        from, to: ISO 8601 bounds on the scheduled time.
+        order: desc (default, newest first) or asc.
+        limit: Page size. When given, the response is a page object with jobs
+            and next_cursor instead of a plain list. Without it the plain list
+            is deprecated and cut off after UNPAGED_MAX tasks, with an
+            X-Truncated header.
+        cursor: next_cursor from the previous page.
+    """
+    order = request.args.get('order', 'desc')
+    limit = request.args.get('limit')
     try:
-        session = get_db_session()
+        session = get_read_session()
         try:
-            # Query all scheduled tasks
-            tasks = session.query(ScheduledTask).all()
-            
-            # Convert to list of dictionaries
-            result = []
-            for task in tasks:
-                result.append({
-                    'id': task.id,
-                    'userId': task.user_id,
-                    'userName': task.user_name,
-                    'portal': task.portal,
-                    'scheduledTime': task.scheduled_time.isoformat(),
-                    'action': task.action,
-                    'roles': task.roles.split(',') if task.roles else [],
-                    'status': task.status,
-                    'createdAt': task.created_at.isoformat() if task.created_at else None,
-                    'executedAt': task.executed_at.isoformat() if task.executed_at else None,
-                    'result': task.result
-                })
-            
-            return jsonify(result)
-            
+            filters = {
+                'status': request.args.get('status'),
+                'portal': request.args.get('portal'),
+                'user_id': request.args.get('userId'),
+                'user_name': request.args.get('userName'),
+                'scheduled_from': parse_time(request.args.get('from'), 'from'),
+                'scheduled_to': parse_time(request.args.get('to'), 'to')
+            }
+
+            if limit is None:
+                # Deprecated plain list for existing clients, bounded like a page
+                if order not in ('asc', 'desc'):
+                    raise QueryError("Invalid order. Use 'asc' or 'desc'")
+                query = apply_task_filters(select(ScheduledTask), **filters)
+                column = ScheduledTask.scheduled_time
+                query = query.order_by(column.asc() if order == 'asc' else column.desc(), ScheduledTask.id)
+                tasks = session.execute(query.limit(UNPAGED_MAX + 1)).scalars().all()
+                response = jsonify([task_to_dict(task) for task in tasks[:UNPAGED_MAX]])
+                if len(tasks) > UNPAGED_MAX:
+                    logging.warning("Unpaginated scheduled job list cut off at %d tasks; pass limit to page through it", UNPAGED_MAX)
+                    response.headers['X-Truncated'] = 'true'
+                return response
+
+            try:
+                limit = int(limit)
+            except ValueError:
+                raise QueryError("Limit must be a number")
+            tasks, next_cursor = list_tasks(
+                session, order=order, limit=limit, cursor=request.args.get('cursor'), **filters
+            )
+            return jsonify({
+                'jobs': [task_to_dict(task) for task in tasks],
+                'next_cursor': next_cursor
+            })
+
+        except QueryError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
         except Exception as e:
-            logging.error(f"Database error while fetching scheduled tasks: {str(e)}")
+            logging.error("Database error while fetching scheduled tasks: %s", e)
             return jsonify({'success': False, 'message': f"Database error: {str(e)}"}), 500
         finally:
             session.close()
             
     except Exception as e:
-        logging.error(f"General error: {str(e)}")
+        logging.error("General error: %s", e)
         return jsonify({'success': False, 'message': f"Error: {str(e)}"}), 500
 
+@teleport_scheduler_routes.route('/teleport/scheduled-jobs/<task_id>', methods=['GET'])
+@token_required
+def get_scheduled_job(task_id):
+    """Get a single scheduled job, including its result, from the live or archive table."""
+    try:
+        session = get_read_session()
+        try:
+            task = session.query(ScheduledTask).filter_by(id=task_id).first()
+            if task is None:
+                task = session.query(ScheduledTaskArchive).filter_by(id=task_id).first()
+            if task is None:
+                return jsonify({'success': False, 'message': 'Scheduled job not found'}), 404
+            return jsonify(task_to_dict(task, include_result=True))
+        finally:
+            session.close()
+
+    except Exception as e:
+        logging.error("Database error while fetching scheduled task %s: %s", task_id, e)
+        return jsonify({'success': False, 'message': f"Database error: {str(e)}"}), 500
+
 @teleport_scheduler_routes.route('/teleport/available-roles', methods=['GET'])
 @token_required
 def get_available_roles():
@@ -330,29 +686,25 @@ def get_available_roles():
         return jsonify({'success': False, 'message': 'Missing portal parameter'}), 400
     
     try:
-        session = get_db_session()
+        session = get_read_session()
         try:
-            # Query all users in the portal and collect their roles
-            users = session.query(User).filter_by(portal=portal).all()
-            
-            # Extract and deduplicate all roles
-            all_roles = set()
-            for user in users:
-                if user.roles:
-                    roles = user.roles.split(',')
-                    all_roles.update(roles)
-            
-            # Sort alphabetically for consistent presentation
-            sorted_roles = sorted(list(all_roles))
+            # Deduplicate and sort the portal's roles in the database
+            role = func.unnest(User.role_list).label('role')
+            roles_query = select(role).where(User.portal == portal).subquery()
+            sorted_roles = [
+                row.role for row in session.execute(
+                    select(roles_query.c.role).distinct().order_by(roles_query.c.role)
+                )
+            ]
             
             return jsonify(sorted_roles)
             
         except Exception as e:
-            logging.error(f"Database error while fetching available roles: {str(e)}")
+            logging.error("Database error while fetching available roles: %s", e)
             return jsonify({'success': False, 'message': f"Database error: {str(e)}"}), 500
         finally:
             session.close()
             
     except Exception as e:
-        logging.error(f"General error: {str(e)}")
+        logging.error("General error: %s", e)
         return jsonify({'success': False, 'message': f"Error: {str(e)}"}), 500
@@ -1,13 +1,13 @@
 
 from flask import Blueprint, request, jsonify
 import logging
-import json
 from utils.auth import token_required
-from utils.ssh import execute_ssh_command
 from models.user import User
 from utils.db import get_db_session
+from services.sync_jobs import start_sync_job, get_sync_job
+from services.token_pool import token_pool, token_to_dict
+from config import SSH_HOSTS
 from sqlalchemy import and_
-from datetime import datetime
 
 # Create a Blueprint for teleport user routes
 teleport_users_routes = Blueprint('teleport_users_routes', __name__)
@@ -15,189 +15,107 @@ teleport_users_routes = Blueprint('teleport_users_routes', __name__)
 @teleport_users_routes.route('/teleport/tkgen', methods=['POST'])
 @token_required
 def run_fixed_command():
-    """Generate a teleport token."""
+    """Hand out a node join token, from the portal's pool of pre-minted tokens."""
     data = request.json
     client = data.get('client')
     
     if not client:
         return jsonify({'message': "Client parameter is required"}), 400
     
-    command = 'sudo tctl tokens add --ttl=30m --type=node'
-    output, error = execute_ssh_command(client, command)
+    token, error = token_pool.take(client)
     
     if error:
         return jsonify({'message': f"Error executing command: {error}"}), 500
     
-    # Process the output to extract details
-    lines = [line.strip() for line in output.strip().split('\n')]
-    
-    invite_token = None
-    expiry = None
-    join_command = {
-        "command": "teleport start",
-        "options": {}
-    }
-    notes = []
-    
-    # Extract invite token
-    try:
-        invite_token = lines[0].split(': ')[1]
-    except IndexError:
-        invite_token = "Not found"
-    
-    # Extract expiry
-    try:
-        expiry = lines[1].split('in ')[1]
-    except IndexError:
-        expiry = "Not found"
-    
-    # Extract command options
-    try:
-        command_lines = lines[5:]
-        for line in command_lines:
-            if '--roles=' in line:
-                join_command["options"]["roles"] = line.split('--roles=')[1].split(' ')[0]
-            if '--token=' in line:
-                join_command["options"]["token"] = line.split('--token=')[1].split(' ')[0]
-            if '--ca-pin=' in line:
-                join_command["options"]["ca_pin"] = line.split('--ca-pin=')[1].split(' ')[0]
-            if '--auth-server=' in line:
-                join_command["options"]["auth_server"] = line.split('--auth-server=')[1].split(' ')[0]
-    except IndexError:
-        pass
-    
-    # Create JSON structure
-    json_output = {
-        "invite_token": invite_token,
-        "expiry": expiry,
-        "join_command": join_command,
-        "notes": notes
-    }
-    
-    return jsonify(json_output), 200
+    return jsonify(token_to_dict(token)), 200
 
 @teleport_users_routes.route('/teleport/fetch-users', methods=['POST'])
 @token_required
 def fetch_users_from_ssh():
-    """Fetch users from Teleport servers via SSH and update the database."""
+    """Start a background sync of users from a Teleport portal.
+
+    Returns 202 with the job id; poll /teleport/sync-jobs/<job_id> for progress.
+    If a sync of the same portal is already running, its job is returned instead.
+    """
     data = request.json
     client = data.get('client')
     
     if not client:
         return jsonify({'message': "Client parameter is required"}), 400
     
-    # Execute the command to fetch users in JSON format
-    command = 'sudo tctl users ls --format=json'
-    output, error = execute_ssh_command(client, command)
+    if client not in SSH_HOSTS:
+        return jsonify({'message': f"Client {client} not recognized"}), 400
     
-    if error:
-        return jsonify({'message': f"Error executing command: {error}"}), 500
+    try:
+        job, attached = start_sync_job(client)
+    except Exception as e:
+        logging.error(f"Error starting sync job for portal {client}: {str(e)}")
+        return jsonify({'message': f"Error starting sync: {str(e)}"}), 500
+    
+    return jsonify({
+        'success': True,
+        'message': f"Sync of {client} portal {'already in progress' if attached else 'started'}",
+        'job_id': job['id'],
+        'status': job['status'],
+        'attached': attached
+    }), 202
+
+@teleport_users_routes.route('/teleport/sync-jobs/<job_id>', methods=['GET'])
+@token_required
+def get_sync_job_status(job_id):
+    """Get the phase, progress and outcome of a sync job."""
+    try:
+        job = get_sync_job(job_id)
+    except Exception as e:
+        logging.error(f"Error fetching sync job {job_id}: {str(e)}")
+        return jsonify({'message': f"Database error: {str(e)}"}), 500
+    
+    if not job:
+        return jsonify({'message': "Sync job not found"}), 404
+    
+    return jsonify(job), 200
+
+@teleport_users_routes.route('/teleport/fetch-users-all', methods=['POST'])
+@token_required
+def fetch_users_from_all_portals():
+    """Start a background sync job for every portal in SSH_HOSTS (or the listed ones).
+
+    Returns 202 with one job per portal; poll /teleport/sync-jobs/<job_id> for
+    each. Portals that already have a sync running return that job instead.
+    """
+    data = request.get_json(silent=True) or {}
+    portals = data.get('portals') or list(SSH_HOSTS.keys())
+    
+    unknown = [portal for portal in portals if portal not in SSH_HOSTS]
+    if unknown:
+        return jsonify({'message': f"Unknown portals: {', '.join(unknown)}"}), 400
     
     try:
-        # Parse the JSON output
-        users_data = json.loads(output)
-        
-        # Get database session
-        db_session = get_db_session()
-        
-        # Get existing users from database for this portal
-        existing_db_users = db_session.query(User).filter(User.portal == client).all()
-        existing_db_user_names = {user.name for user in existing_db_users}
-        
-        # Get users from portal
-        portal_user_names = set()
-        user_count = 0
-        new_user_count = 0
-        updated_user_count = 0
-        
-        for user_data in users_data:
-            if user_data.get('kind') == 'user':
-                name = user_data.get('metadata', {}).get('name')
-                roles = user_data.get('spec', {}).get('roles', [])
-                
-                if name:
-                    portal_user_names.add(name)
-                    user_id = f"{name.replace('@', '_at_')}_{client}"
-                    
-                    # Check if this user exists by ID first, then by name+portal as fallback
-                    existing_user = db_session.query(User).filter(User.id == user_id).first()
-                    if not existing_user:
-                        # Fallback check by name and portal (for legacy data)
-                        existing_user = db_session.query(User).filter(
-                            and_(User.name == name, User.portal == client)
-                        ).first()
-                        # If found by name+portal but different ID, update the ID
-                        if existing_user:
-                            existing_user.id = user_id
-                    
-                    if existing_user:
-                        # Update existing user's roles and status
-                        existing_user.roles = ','.join(roles)
-                        existing_user.status = 'active'  # Mark as active since they exist in portal
-                        existing_user.name = name  # Ensure name is current
-                        existing_user.portal = client  # Ensure portal is current
-                        updated_user_count += 1
-                    else:
-                        # Create new user only if it doesn't exist
-                        created_date = user_data.get('spec', {}).get('created_by', {}).get('time')
-                        try:
-                            created_date_obj = datetime.strptime(created_date, "%Y-%m-%dT%H:%M:%S.%fZ") if created_date else datetime.utcnow()
-                        except ValueError:
-                            created_date_obj = datetime.utcnow()
-                        
-                        manager = user_data.get('spec', {}).get('created_by', {}).get('user', {}).get('name')
-                        
-                        new_user = User(
-                            id=user_id,
-                            name=name,
-                            roles=','.join(roles),
-                            created_date=created_date_obj,
-                            last_login=None,
-                            status='active',
-                            manager=manager,
-                            portal=client
-                        )
-                        db_session.add(new_user)
-                        new_user_count += 1
-                    
-                    user_count += 1
-        
-        # Identify orphaned users (in DB but not in portal)
-        orphaned_user_names = existing_db_user_names - portal_user_names
-        orphaned_users = []
-        
-        for user in existing_db_users:
-            if user.name in orphaned_user_names:
-                orphaned_users.append({
-                    'id': user.id,
-                    'name': user.name,
-                    'roles': user.roles.split(',') if user.roles else [],
-                    'createdDate': user.created_date.isoformat() if user.created_date else None,
-                    'lastLogin': user.last_login.isoformat() if user.last_login else None,
-                    'status': user.status,
-                    'manager': user.manager,
-                    'portal': user.portal
-                })
-        
-        # Commit changes
-        db_session.commit()
-        
-        response_data = {
+        timeout = float(data['timeout']) if data.get('timeout') else None
+    except (TypeError, ValueError):
+        return jsonify({'message': "Timeout must be a number of seconds"}), 400
+    
+    jobs = []
+    for portal in portals:
+        try:
+            job, attached = start_sync_job(portal, timeout=timeout)
+        except Exception as e:
+            logging.error(f"Error starting sync job for portal {portal}: {str(e)}")
+            jobs.append({'portal': portal, 'success': False, 'message': f"Error starting sync: {str(e)}"})
+            continue
+        jobs.append({
+            'portal': portal,
             'success': True,
-            'message': f"Successfully processed {user_count} users from {client} portal. Added {new_user_count} new users and updated {updated_user_count} existing users.",
-            'orphaned_users': orphaned_users
-        }
-        
-        return jsonify(response_data), 200
-        
-    except json.JSONDecodeError:
-        return jsonify({'message': "Error parsing JSON output from SSH command"}), 500
-    except Exception as e:
-        db_session.rollback()
-        logging.error(f"Error processing users: {str(e)}")
-        return jsonify({'message': f"Error processing users: {str(e)}"}), 500
-    finally:
-        db_session.close()
+            'job_id': job['id'],
+            'status': job['status'],
+            'attached': attached
+        })
+    
+    # Only fail the request if no portal could be started
+    if not any(job['success'] for job in jobs):
+        return jsonify({'success': False, 'jobs': jobs}), 500
+    
+    return jsonify({'success': True, 'jobs': jobs}), 202
 
 @teleport_users_routes.route('/teleport/manage-orphaned-users', methods=['POST'])
 @token_required
@@ -221,7 +139,7 @@ def manage_orphaned_users():
             if orphaned_user_ids:
                 updated_count = db_session.query(User).filter(
                     and_(User.portal == portal, User.id.in_(orphaned_user_ids))
-                ).update({'status': 'inactive'}, synchronize_session=False)
+                ).update({'status': 'inactive', 'spec_fingerprint': None}, synchronize_session=False)
                 db_session.commit()
                 
                 return jsonify({
@@ -257,10 +175,12 @@ def manage_orphaned_users():
                 db_session.commit()
                 
                 # Mark kept users as inactive
-                for user_id in user_ids_to_keep:
-                    user = db_session.query(User).filter(User.id == user_id).first()
-                    if user:
-                        user.status = 'inactive'
+                if user_ids_to_keep:
+                    # Bulk updates skip the before_update listener, so clear the
+                    # fingerprint here; the next sync then sees the user as changed
+                    db_session.query(User).filter(User.id.in_(user_ids_to_keep)).update(
+                        {'status': 'inactive', 'spec_fingerprint': None}, synchronize_session=False
+                    )
                 db_session.commit()
                 
                 return jsonify({
@@ -269,10 +189,12 @@ def manage_orphaned_users():
                 }), 200
             else:
                 # Just mark kept users as inactive
-                for user_id in user_ids_to_keep:
-                    user = db_session.query(User).filter(User.id == user_id).first()
-                    if user:
-                        user.status = 'inactive'
+                if user_ids_to_keep:
+                    # Bulk updates skip the before_update listener, so clear the
+                    # fingerprint here; the next sync then sees the user as changed
+                    db_session.query(User).filter(User.id.in_(user_ids_to_keep)).update(
+                        {'status': 'inactive', 'spec_fingerprint': None}, synchronize_session=False
+                    )
                 db_session.commit()
                 
                 return jsonify({
@@ -1,8 +1,11 @@
 from flask import Blueprint, jsonify, request
+from sqlalchemy import func, select
 import logging
-from utils.db import get_db_session, get_db_connection
+from utils.db import get_db_session, get_db_connection, get_read_session
 from utils.auth import token_required
 from models.user import User
+from services.user_sync import user_to_dict
+from services.user_queries import list_users, apply_user_filters, QueryError, SORT_COLUMNS, UNPAGED_MAX
 import psycopg2.extras
 
 # Create a Blueprint for user routes
@@ -11,40 +14,100 @@ user_routes = Blueprint('user_routes', __name__)
 @user_routes.route('/api/users', methods=['GET'])
 @token_required
 def get_users():
-    """Get all users or filter by portal."""
-    portal = request.args.get('portal')
+    """Get users, filtered, sorted and optionally paginated in SQL.
+
+    Query parameters:
+        portal, status, manager, role, name_prefix: Filters.
+        roles: Comma-separated roles; keeps users holding any of them.
+        sort: name (default), createdDate, lastLogin, status, manager, portal or id.
+        order: asc (default) or desc.
+        limit: Page size. When given, the response is a page object with
+            users, next_cursor and total instead of a plain list. Without it
+            the plain list is deprecated and cut off after UNPAGED_MAX users,
+            with an X-Truncated header.
+        cursor: next_cursor from the previous page.
+        count: exact (default), estimate or none.
+    """
+    filters = {
+        'portal': request.args.get('portal'),
+        'status': request.args.get('status'),
+        'manager': request.args.get('manager'),
+        'role': request.args.get('role'),
+        'roles': request.args.get('roles'),
+        'name_prefix': request.args.get('name_prefix')
+    }
+    sort = request.args.get('sort', 'name')
+    order = request.args.get('order', 'asc')
+    limit = request.args.get('limit')
     
-    session = get_db_session()
+    session = get_read_session()
     
     try:
-        query = session.query(User)
-        if portal:
-            query = query.filter(User.portal == portal)
-            
-        users = query.all()
+        if limit is None:
+            # Deprecated plain list for existing clients, bounded like a page
+            query = apply_user_filters(session.query(User), **filters)
+            if sort not in SORT_COLUMNS or order not in ('asc', 'desc'):
+                return jsonify({"success": False, "message": "Invalid sort or order parameter"}), 400
+            column = SORT_COLUMNS[sort]
+            query = query.order_by(column.asc().nulls_last() if order == 'asc' else column.desc().nulls_last(), User.id)
+            users = query.limit(UNPAGED_MAX + 1).all()
+            response = jsonify([user_to_dict(user) for user in users[:UNPAGED_MAX]])
+            if len(users) > UNPAGED_MAX:
+                logging.warning("Unpaginated user list cut off at %d users; pass limit to page through it", UNPAGED_MAX)
+                response.headers['X-Truncated'] = 'true'
+            return response
         
-        # Convert ORM objects to dictionaries
-        result = []
-        for user in users:
-            user_dict = {
-                'id': user.id,
-                'name': user.name,
-                'roles': user.roles.split(',') if user.roles else [],
-                'createdDate': user.created_date.isoformat() if user.created_date else None,
-                'lastLogin': user.last_login.isoformat() if user.last_login else None,
-                'status': user.status,
-                'manager': user.manager,
-                'portal': user.portal
-            }
-            result.append(user_dict)
+        try:
+            users, next_cursor, total = list_users(
+                session,
+                sort=sort,
+                order=order,
+                limit=int(limit),
+                cursor=request.args.get('cursor'),
+                count=request.args.get('count', 'exact'),
+                **filters
+            )
+        except ValueError as e:
+            # QueryError, or a limit that is not a number
+            message = str(e) if isinstance(e, QueryError) else "Limit must be a number"
+            return jsonify({"success": False, "message": message}), 400
         
-        return jsonify(result)
+        return jsonify({
+            'users': [user_to_dict(user) for user in users],
+            'next_cursor': next_cursor,
+            'total': total,
+            'total_is_estimate': request.args.get('count') == 'estimate'
+        })
     except Exception as e:
         logging.error(f"Error fetching users: {e}")
         return jsonify({"error": str(e)}), 500
     finally:
         session.close()
 
+@user_routes.route('/api/users/facets', methods=['GET'])
+@token_required
+def get_user_facets():
+    """Get the distinct portals, managers and roles to offer as list filters."""
+    session = get_read_session()
+    try:
+        portals = session.execute(
+            select(User.portal).where(User.portal.isnot(None)).distinct().order_by(User.portal)
+        ).scalars().all()
+        managers = session.execute(
+            select(User.manager).where(User.manager.isnot(None)).distinct().order_by(User.manager)
+        ).scalars().all()
+        role = func.unnest(User.role_list).label('role')
+        roles_query = select(role).subquery()
+        roles = session.execute(
+            select(roles_query.c.role).distinct().order_by(roles_query.c.role)
+        ).scalars().all()
+        return jsonify({'portals': portals, 'managers': managers, 'roles': roles})
+    except Exception as e:
+        logging.error("Error fetching user facets: %s", e)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        session.close()
+
 @user_routes.route('/api/users/<user_id>', methods=['PUT'])
 @token_required
 def update_user(user_id):
@@ -5,7 +5,13 @@
 cd /app
 alembic upgrade head
 
+# Metrics from all gunicorn workers are aggregated through this directory;
+# clear it so samples from a previous run are not reported
+export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus-metrics}"
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
 # Start the application
 echo "Starting the application"
-gunicorn --bind 0.0.0.0:5500 app:app
+gunicorn --config gunicorn.conf.py --bind 0.0.0.0:5500 --workers "${GUNICORN_WORKERS:-1}" app:app
 
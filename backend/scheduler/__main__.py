@@ -0,0 +1,42 @@
+"""Run the task scheduler as its own process: python -m scheduler
+
+Use this with SCHEDULER_ENABLED=false on the web service so scheduled tasks run
+in one dedicated process instead of in every gunicorn worker.
+"""
+import signal
+import threading
+from prometheus_client import start_http_server
+from utils.logging_config import setup_logging
+from utils.metrics import start_metrics_sampler
+from scheduler import scheduler
+from services.token_pool import token_pool
+from config import SCHEDULER_METRICS_PORT
+
+def main():
+    logger = setup_logging()
+    stopping = threading.Event()
+
+    def handle_signal(signum, frame):
+        logger.info("Received signal %s, stopping the task scheduler", signum)
+        stopping.set()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    logger.info("Starting the task scheduler")
+    scheduler.start()
+    # Keep the shared join token pool topped up, so web workers only hand tokens out
+    token_pool.start()
+    start_metrics_sampler()
+    if SCHEDULER_METRICS_PORT:
+        start_http_server(SCHEDULER_METRICS_PORT)
+        logger.info("Serving scheduler metrics on port %s", SCHEDULER_METRICS_PORT)
+
+    stopping.wait()
+    # Releases unstarted claims and waits for in-flight tasks to finish
+    scheduler.stop()
+    # Revoke pooled tokens so none stay valid after the pool's owner has gone
+    token_pool.stop(revoke=True)
+
+if __name__ == '__main__':
+    main()
@@ -1,129 +1,746 @@
 
+import os
+import uuid
+import zlib
+import random
+import socket
 import threading
 import time
+import heapq
+import select
 import logging
-from datetime import datetime
-# Try to import requests, but provide a fallback if not available
-try:
-    import requests
-except ImportError:
-    requests = None
-    logging.warning("requests module not available, external API calls will not work")
-
-from sqlalchemy import and_
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from sqlalchemy import and_, exists, func, select, text, tuple_
+from sqlalchemy.orm import aliased
 from models.scheduled_task import ScheduledTask
-from utils.db import get_db_session
+from utils.db import get_db_session, create_db_connection
+from services.task_retention import archive_finished_tasks
+from utils.sql_stats import track_queries
+from utils.metrics import SCHEDULER_DISPATCH_LAG, SCHEDULER_EXECUTION_DURATION
+from utils.tracing import trace
+from config import (
+    SCHEDULER_RECONCILE_INTERVAL, SCHEDULER_NOTIFY_CHANNEL, SCHEDULER_HEAP_SIZE,
+    SCHEDULER_LEASE_SECONDS, SCHEDULER_CLAIM_BATCH_SIZE,
+    SCHEDULER_MAX_WORKERS, SCHEDULER_PORTAL_CONCURRENCY, SCHEDULER_DRAIN_TIMEOUT,
+    SCHEDULER_SSH_BATCH_SIZE, SCHEDULER_MAX_ATTEMPTS, SCHEDULER_RETRY_BASE_DELAY, SCHEDULER_RETRY_MAX_DELAY,
+    TASK_RETENTION_DAYS, TASK_RETENTION_INTERVAL, TASK_RETENTION_BATCH_SIZE
+)
+
+def notify_scheduler(session, task_id=''):
+    """Queue a NOTIFY that wakes listening schedulers when the session commits.
+
+    Call this in the same transaction that creates or reschedules a task so the
+    scheduler never wakes up before the change is visible.
+
+    Args:
+        session: Database session holding the uncommitted task change.
+        task_id: Optional task id sent as the notification payload.
+    """
+    session.execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        {'channel': SCHEDULER_NOTIFY_CHANNEL, 'payload': task_id}
+    )
+
+def _user_lock_key(portal, user_name):
+    """Advisory lock key serialising task claims for one user."""
+    return zlib.crc32(f"scheduled_task_user:{portal}:{user_name}".encode())
+
+def retry_delay(attempt):
+    """Seconds to wait before retrying a task whose attempt-th run failed.
+
+    Exponential backoff capped at SCHEDULER_RETRY_MAX_DELAY, with half of the
+    delay randomised so tasks that failed together do not retry together.
+    """
+    delay = min(SCHEDULER_RETRY_MAX_DELAY, SCHEDULER_RETRY_BASE_DELAY * 2 ** max(attempt - 1, 0))
+    return delay / 2 + random.uniform(0, delay / 2)
 
 class TaskScheduler:
-    def __init__(self, check_interval=60):
+    def __init__(self, reconcile_interval=300, notify_channel='scheduled_tasks', heap_size=1000,
+                 lease_seconds=600, claim_batch_size=20, max_workers=8, portal_concurrency=2,
+                 drain_timeout=60, ssh_batch_size=50, retention_days=90, retention_interval=3600,
+                 retention_batch_size=1000):
         """Initialize the task scheduler.
-        
+
         Args:
-            check_interval: How often to check for due tasks, in seconds.
+            reconcile_interval: How often to run a full scan for due tasks, in seconds.
+                Normal wakeups come from the heap and LISTEN/NOTIFY, so this only
+                catches notifications that were missed.
+            notify_channel: Postgres channel to LISTEN on for new or changed tasks.
+            heap_size: Number of upcoming task times to keep in memory.
+            lease_seconds: How long a claimed task stays owned by this worker
+                before another scheduler may recover and run it.
+            claim_batch_size: Maximum number of due tasks claimed at once.
+            max_workers: Number of tasks executed concurrently across all portals.
+            portal_concurrency: Maximum number of tasks running at once against
+                a single portal, so one Teleport auth server is not overloaded.
+            drain_timeout: Seconds stop() waits for in-flight tasks to finish.
+            ssh_batch_size: Maximum number of users whose updates are sent to a
+                portal as one remote script.
+            retention_days: Finished tasks older than this are archived; 0 disables it.
+            retention_interval: How often to run the archiving job, in seconds.
+            retention_batch_size: Tasks moved per archiving transaction.
         """
-        self.check_interval = check_interval
+        self.reconcile_interval = reconcile_interval
+        self.notify_channel = notify_channel
+        self.heap_size = heap_size
+        self.lease_seconds = lease_seconds
+        self.claim_batch_size = claim_batch_size
+        self.max_workers = max_workers
+        self.portal_concurrency = portal_concurrency
+        self.drain_timeout = drain_timeout
+        self.ssh_batch_size = ssh_batch_size
+        self.retention_days = retention_days
+        self.retention_interval = retention_interval
+        self.retention_batch_size = retention_batch_size
+        self.worker_id = None
         self.running = False
         self.thread = None
+        self.listener_thread = None
+        self.heartbeat_thread = None
+        # Set by stop(); ends the lease heartbeat once in-flight tasks have drained
+        self._stopped = threading.Event()
         self.logger = logging.getLogger('TaskScheduler')
-    
+
+        # Min-heap of (due time, task_id) for upcoming tasks
+        self._heap = []
+        self._heap_lock = threading.Lock()
+        # Set by the listener to make the main loop reload the heap
+        self._wakeup = threading.Event()
+        # Executor state: claimed task groups wait in a per-portal queue until
+        # the portal has a free slot, so a busy portal never holds up the others.
+        # _in_flight counts running batches per portal, _in_flight_groups the
+        # task groups inside them.
+        self._executor = None
+        self._dispatch_lock = threading.Lock()
+        self._queued = {}
+        self._in_flight = {}
+        self._in_flight_groups = 0
+        self._futures = set()
+        # Ids of claimed tasks that are queued or running here; only these
+        # leases are renewed, so a task this worker lost track of can expire
+        self._held = set()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'dispatched': 0,
+            'last_dispatch_lag_seconds': None,
+            'max_dispatch_lag_seconds': None,
+            'total_dispatch_lag_seconds': 0.0,
+            'claimed': 0,
+            'coalesced': 0,
+            'batches': 0,
+            'completed': 0,
+            'released': 0,
+            'recovered_leases': 0,
+            'renewed_leases': 0,
+            'last_heartbeat_at': None,
+            'dead': 0,
+            'notifications': 0,
+            'listener_connected': False,
+            'last_reconcile_at': None,
+            'archived': 0,
+            'last_archive_at': None
+        }
+
     def start(self):
-        """Start the scheduler in a background thread."""
+        """Start the scheduler and notification listener in background threads."""
         if self.running:
             self.logger.warning("Scheduler is already running")
             return
-        
+
+        # Identifies this process's claims; set here rather than in __init__ so
+        # workers forked after import each get their own id
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='scheduled-task')
         self.running = True
+        self._stopped.clear()
         self.thread = threading.Thread(target=self._run, daemon=True)
         self.thread.start()
-        self.logger.info("Task scheduler started")
-    
-    def stop(self):
-        """Stop the scheduler thread."""
+        self.listener_thread = threading.Thread(target=self._listen, daemon=True)
+        self.listener_thread.start()
+        self.heartbeat_thread = threading.Thread(target=self._heartbeat, daemon=True)
+        self.heartbeat_thread.start()
+        self.logger.info("Task scheduler started as worker %s", self.worker_id)
+
+    def stop(self, drain_timeout=None):
+        """Stop the scheduler threads, letting in-flight tasks finish.
+
+        Tasks that were claimed but have not started are released back to the
+        queue so another scheduler can run them straight away.
+
+        Args:
+            drain_timeout: Seconds to wait for in-flight tasks, defaults to the
+                value given at construction.
+        """
         self.running = False
+        self._wakeup.set()
         if self.thread:
             self.thread.join(timeout=5.0)
-            self.logger.info("Task scheduler stopped")
-    
+        if self.listener_thread:
+            self.listener_thread.join(timeout=5.0)
+
+        with self._dispatch_lock:
+            unstarted = [task for queue in self._queued.values() for group in queue for task in group]
+            self._queued.clear()
+            self._held.difference_update(task['taskId'] for task in unstarted)
+            in_flight = list(self._futures)
+        if unstarted:
+            self._release_claims([task['taskId'] for task in unstarted])
+
+        if in_flight:
+            self.logger.info("Waiting for %d in-flight tasks to finish", len(in_flight))
+            _, not_done = wait(in_flight, timeout=self.drain_timeout if drain_timeout is None else drain_timeout)
+            if not_done:
+                # Their leases expire and another scheduler recovers them
+                self.logger.warning("%d tasks still running after drain timeout", len(not_done))
+        if self._executor:
+            self._executor.shutdown(wait=False)
+        self._stopped.set()
+        if self.heartbeat_thread:
+            self.heartbeat_thread.join(timeout=5.0)
+        self.logger.info("Task scheduler stopped")
+
     def _run(self):
-        """Main loop that periodically checks for due tasks."""
+        """Main loop that sleeps until the next task is due or a notification arrives."""
+        next_reconcile = 0
+        next_retention = 0
+        while self.running:
+            try:
+                if time.monotonic() >= next_reconcile:
+                    # Safety net for tasks whose notification was missed or
+                    # whose worker died while running them
+                    self._recover_expired_leases()
+                    cutoff = self._check_and_execute_due_tasks()
+                    self._load_upcoming(after=cutoff)
+                    next_reconcile = time.monotonic() + self.reconcile_interval
+                    with self._stats_lock:
+                        self._stats['last_reconcile_at'] = datetime.now().isoformat()
+
+                    if self.retention_days and time.monotonic() >= next_retention:
+                        self._archive_finished_tasks()
+                        next_retention = time.monotonic() + self.retention_interval
+                elif self._wakeup.is_set():
+                    self._wakeup.clear()
+                    self._load_upcoming()
+
+                next_time = self._next_scheduled_time()
+                if next_time is not None and next_time <= datetime.now():
+                    # Tasks still pending after this pass are left to the next
+                    # reconcile scan instead of being retried in a tight loop
+                    cutoff = self._check_and_execute_due_tasks()
+                    self._load_upcoming(after=cutoff)
+                    continue
+            except Exception as e:
+                self.logger.error("Error in scheduler: %s", e)
+                # Avoid spinning if the database is unavailable
+                time.sleep(1)
+
+            self._wakeup.wait(self._sleep_seconds(next_reconcile))
+
+    def _archive_finished_tasks(self):
+        """Keep the hot table small by archiving old finished tasks.
+
+        Runs a bounded number of batches so dispatching is not held up; the
+        rest is picked up on the next run.
+        """
+        archived = archive_finished_tasks(
+            self.retention_days, batch_size=self.retention_batch_size, max_batches=10
+        )
+        with self._stats_lock:
+            self._stats['archived'] += archived
+            self._stats['last_archive_at'] = datetime.now().isoformat()
+
+    def _sleep_seconds(self, next_reconcile):
+        """Return how long to sleep: until the next due task or the next reconcile scan."""
+        timeout = max(0.0, next_reconcile - time.monotonic())
+        next_time = self._next_scheduled_time()
+        if next_time is not None:
+            timeout = min(timeout, max(0.0, (next_time - datetime.now()).total_seconds()))
+        return timeout
+
+    def _next_scheduled_time(self):
+        with self._heap_lock:
+            return self._heap[0][0] if self._heap else None
+
+    def _load_upcoming(self, after=None):
+        """Rebuild the wakeup heap from the earliest pending tasks.
+
+        A task is due at its next_attempt_at when it is waiting to be retried,
+        otherwise at its scheduled_time.
+
+        Args:
+            after: Only load tasks scheduled after this time, if given.
+        """
+        session = get_db_session()
+        try:
+            query = session.query(ScheduledTask.due_at.label('due_at'), ScheduledTask.id).filter(
+                ScheduledTask.status == 'scheduled'
+            )
+            if after is not None:
+                query = query.filter(ScheduledTask.due_at > after)
+            rows = query.order_by(ScheduledTask.due_at).limit(self.heap_size).all()
+        finally:
+            session.close()
+
+        heap = [(row.due_at, row.id) for row in rows]
+        heapq.heapify(heap)
+        with self._heap_lock:
+            self._heap = heap
+        if heap:
+            self.logger.debug("Next task due at %s (%d upcoming)", heap[0][0], len(heap))
+
+    def _listen(self):
+        """LISTEN for task changes and wake the main loop, reconnecting on failure."""
+        backoff = 1
         while self.running:
+            conn = None
             try:
-                self._check_and_execute_due_tasks()
+                # A dedicated connection: LISTEN state must not leak into the raw pool
+                conn = create_db_connection()
+                with conn.cursor() as cursor:
+                    cursor.execute(f'LISTEN "{self.notify_channel}"')
+                with self._stats_lock:
+                    self._stats['listener_connected'] = True
+                self.logger.info("Listening for task notifications on channel %s", self.notify_channel)
+                backoff = 1
+                # Notifications may have been missed while disconnected
+                self._wakeup.set()
+
+                while self.running:
+                    # Wake up periodically to notice stop()
+                    if select.select([conn], [], [], 5.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    if conn.notifies:
+                        with self._stats_lock:
+                            self._stats['notifications'] += len(conn.notifies)
+                        conn.notifies.clear()
+                        self._wakeup.set()
             except Exception as e:
-                self.logger.error(f"Error in scheduler: {str(e)}")
-            
-            # Sleep for the check interval
-            time.sleep(self.check_interval)
-    
+                self.logger.error("Task notification listener error: %s", e)
+            finally:
+                with self._stats_lock:
+                    self._stats['listener_connected'] = False
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+            if self.running:
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+
+    def _record_dispatch_lag(self, task, dispatched_at):
+        """Record how late a task started relative to when it was due."""
+        lag = max(0.0, (dispatched_at - task['dueTime']).total_seconds())
+        SCHEDULER_DISPATCH_LAG.observe(lag)
+        with self._stats_lock:
+            self._stats['dispatched'] += 1
+            self._stats['last_dispatch_lag_seconds'] = lag
+            self._stats['total_dispatch_lag_seconds'] += lag
+            if self._stats['max_dispatch_lag_seconds'] is None or lag > self._stats['max_dispatch_lag_seconds']:
+                self._stats['max_dispatch_lag_seconds'] = lag
+        if lag > 5:
+            self.logger.warning("Task %s dispatched %.1fs after its scheduled time", task['taskId'], lag)
+
+    def stats(self):
+        """Return scheduler statistics, including the measured dispatch lag."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        dispatched = stats['dispatched']
+        stats['avg_dispatch_lag_seconds'] = stats['total_dispatch_lag_seconds'] / dispatched if dispatched else None
+        with self._heap_lock:
+            stats['upcoming'] = len(self._heap)
+            stats['next_scheduled_time'] = self._heap[0][0].isoformat() if self._heap else None
+        with self._dispatch_lock:
+            stats['queue_depth'] = sum(len(queue) for queue in self._queued.values())
+            stats['in_flight'] = self._in_flight_groups
+            stats['portals'] = {
+                portal: {'queued': len(self._queued.get(portal, ())), 'in_flight': self._in_flight.get(portal, 0)}
+                for portal in set(self._queued) | set(self._in_flight)
+            }
+        stats['max_workers'] = self.max_workers
+        stats['portal_concurrency'] = self.portal_concurrency
+        stats['ssh_batch_size'] = self.ssh_batch_size
+        stats['running'] = self.running
+        stats['worker_id'] = self.worker_id
+        return stats
+
+    def _heartbeat(self):
+        """Renew this worker's leases every third of the lease period until stop() finishes."""
+        interval = self.lease_seconds / 3
+        while not self._stopped.wait(interval):
+            try:
+                self._renew_leases()
+            except Exception as e:
+                self.logger.error("Error renewing task leases: %s", e)
+
+    def _renew_leases(self):
+        """Extend the lease of every task this worker holds, queued or running.
+
+        Claimed groups can wait in the per-portal queue for longer than a lease,
+        so leases are renewed for as long as the worker is alive rather than
+        set once at claim time. Only tasks still tracked in memory are renewed:
+        a row left running after its batch finished (e.g. because recording
+        the outcome failed) keeps its old lease, expires and is recovered.
+        """
+        with self._dispatch_lock:
+            held = list(self._held)
+        renewed = 0
+        if held:
+            session = get_db_session()
+            try:
+                renewed = session.query(ScheduledTask).filter(
+                    ScheduledTask.id.in_(held),
+                    ScheduledTask.status == 'running',
+                    ScheduledTask.lease_owner == self.worker_id
+                ).update({
+                    'lease_expires_at': datetime.now() + timedelta(seconds=self.lease_seconds)
+                }, synchronize_session=False)
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+            finally:
+                session.close()
+        with self._stats_lock:
+            self._stats['renewed_leases'] += renewed
+            self._stats['last_heartbeat_at'] = datetime.now().isoformat()
+        return renewed
+
+    def _recover_expired_leases(self):
+        """Return running tasks whose lease has expired to the queue.
+
+        The worker that claimed them most likely died, since live workers renew
+        their leases. Tasks this worker still has queued or running are never
+        recovered; its own rows that it no longer tracks are, since their
+        leases are not renewed. Role updates set the full
+        role list, so running a recovered task again is safe. Tasks that have
+        used all their attempts are marked dead instead, so a task that keeps
+        killing its worker is not retried forever.
+        """
+        with self._dispatch_lock:
+            held = list(self._held)
+        expired = and_(
+            ScheduledTask.status == 'running',
+            ScheduledTask.lease_expires_at < datetime.now()
+        )
+        if held:
+            expired = and_(expired, ScheduledTask.id.not_in(held))
+        session = get_db_session()
+        try:
+            dead = session.query(ScheduledTask).filter(
+                expired, ScheduledTask.attempt_count >= SCHEDULER_MAX_ATTEMPTS
+            ).update({
+                'status': 'dead',
+                'lease_owner': None,
+                'lease_expires_at': None,
+                'executed_at': datetime.now(),
+                'last_error': 'Lease expired before the task finished',
+                'result': 'Lease expired before the task finished'
+            }, synchronize_session=False)
+            recovered = session.query(ScheduledTask).filter(expired).update({
+                'status': 'scheduled',
+                'lease_owner': None,
+                'lease_expires_at': None,
+                'last_error': 'Lease expired before the task finished'
+            }, synchronize_session=False)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+        if dead:
+            self.logger.error("Marked %d tasks dead after their final attempt's lease expired", dead)
+        if recovered:
+            self.logger.warning("Recovered %d tasks with expired leases", recovered)
+        with self._stats_lock:
+            self._stats['recovered_leases'] += recovered
+            self._stats['dead'] += dead
+        return recovered
+
+    def _claim_due_tasks(self, now, limit):
+        """Atomically claim due tasks for this worker, grouped by user.
+
+        Users are picked in order of their earliest due task. Each one is locked
+        with a transaction-level advisory lock on (portal, user_name), and users
+        that another scheduler is claiming, or that already have a running
+        group, are skipped. All of a user's due tasks are therefore claimed
+        together by one worker and a user never has two groups in flight, so
+        role updates for a user are applied one at a time in scheduled order.
+
+        Args:
+            now: Tasks scheduled at or before this time are due.
+            limit: Maximum number of users (task groups) to claim.
+
+        Returns:
+            List of task groups. Each group is a list of task dictionaries for one
+            (portal, user_name), in scheduled order, in the shape used by
+            execute_task_group_internal.
+        """
+        running = aliased(ScheduledTask)
+        user_busy = exists().where(
+            running.portal == ScheduledTask.portal,
+            running.user_name == ScheduledTask.user_name,
+            running.status == 'running'
+        )
+        due = and_(
+            ScheduledTask.status == 'scheduled',
+            ScheduledTask.due_at <= now,
+            ~user_busy
+        )
+        session = get_db_session()
+        try:
+            candidates = session.query(ScheduledTask.portal, ScheduledTask.user_name).filter(
+                due
+            ).group_by(
+                ScheduledTask.portal, ScheduledTask.user_name
+            ).order_by(func.min(ScheduledTask.due_at)).limit(limit).all()
+
+            users = []
+            if candidates:
+                acquired = session.execute(select(*[
+                    func.pg_try_advisory_xact_lock(_user_lock_key(portal, user_name))
+                    for portal, user_name in candidates
+                ])).one()
+                users = [tuple(user) for user, locked in zip(candidates, acquired) if locked]
+
+            tasks = []
+            if users:
+                # Re-checked under the lock: a user claimed by another scheduler
+                # since the candidate query now has running tasks
+                tasks = session.query(ScheduledTask).filter(
+                    due,
+                    tuple_(ScheduledTask.portal, ScheduledTask.user_name).in_(users)
+                ).order_by(
+                    ScheduledTask.scheduled_time, ScheduledTask.created_at
+                ).with_for_update(of=ScheduledTask).all()
+
+            lease_expires_at = datetime.now() + timedelta(seconds=self.lease_seconds)
+            groups = {}
+            for task in tasks:
+                task.status = 'running'
+                task.lease_owner = self.worker_id
+                task.lease_expires_at = lease_expires_at
+                task.attempt_count += 1
+                groups.setdefault((task.portal, task.user_name), []).append({
+                    'taskId': task.id,
+                    'userName': task.user_name,
+                    'portal': task.portal,
+                    'action': task.action,
+                    'roles': task.roles.split(',') if task.roles else [],
+                    'scheduledTime': task.scheduled_time,
+                    'dueTime': task.due_at,
+                    'leaseOwner': self.worker_id
+                })
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+        if tasks:
+            with self._stats_lock:
+                self._stats['claimed'] += len(tasks)
+                self._stats['coalesced'] += len(tasks) - len(groups)
+        return list(groups.values())
+
+    def _capacity(self):
+        """Number of task groups that can be claimed without over-filling the executor.
+
+        Claimed tasks hold a lease, so only about one round of full batches per
+        worker is kept outstanding.
+        """
+        with self._dispatch_lock:
+            outstanding = sum(len(queue) for queue in self._queued.values()) + self._in_flight_groups
+        return self.max_workers * self.ssh_batch_size - outstanding
+
     def _check_and_execute_due_tasks(self):
-        """Check for tasks that are due and execute them."""
+        """Claim tasks that are due and hand them to the executor.
+
+        Returns:
+            The time used as the due cutoff.
+        """
         now = datetime.now()
-        self.logger.debug(f"Checking for due tasks at {now.isoformat()}")
-        
-        session = get_db_session()
+        self.logger.debug("Checking for due tasks at %s", now)
+
         try:
-            # Query for tasks that are scheduled and due
-            due_tasks = session.query(ScheduledTask).filter(
-                and_(
-                    ScheduledTask.status == 'scheduled',
-                    ScheduledTask.scheduled_time <= now
+            # Claim in small batches so other schedulers can share the work
+            while self.running:
+                capacity = self._capacity()
+                if capacity <= 0:
+                    # Resume claiming when a running task finishes
+                    break
+
+                limit = min(self.claim_batch_size, capacity)
+                groups = self._claim_due_tasks(now, limit)
+                if not groups:
+                    break
+                self.logger.info(
+                    "Claimed %d due tasks for %d users to execute", sum(len(group) for group in groups), len(groups)
                 )
-            ).all()
-            
-            if due_tasks:
-                self.logger.info(f"Found {len(due_tasks)} due tasks to execute")
-            
-            # Process each due task
-            for task in due_tasks:
-                self._execute_task(task)
-                
+
+                self._dispatch(groups)
+
         except Exception as e:
-            self.logger.error(f"Error while checking for due tasks: {str(e)}")
+            self.logger.error("Error while checking for due tasks: %s", e)
+        return now
+
+    def _dispatch(self, groups):
+        """Queue claimed task groups and start batches for portals with a free slot."""
+        with self._dispatch_lock:
+            for group in groups:
+                self._queued.setdefault(group[0]['portal'], deque()).append(group)
+                self._held.update(task['taskId'] for task in group)
+            for portal in {group[0]['portal'] for group in groups}:
+                self._fill(portal)
+
+    def _fill(self, portal):
+        """Submit batches of queued groups while the portal is under its concurrency
+        cap. Must be called with _dispatch_lock held."""
+        queue = self._queued.get(portal)
+        while queue and self._in_flight.get(portal, 0) < self.portal_concurrency:
+            batch = [queue.popleft() for _ in range(min(self.ssh_batch_size, len(queue)))]
+            self._in_flight[portal] = self._in_flight.get(portal, 0) + 1
+            self._in_flight_groups += len(batch)
+            future = self._executor.submit(self._run_batch, batch)
+            self._futures.add(future)
+            future.add_done_callback(self._futures.discard)
+        if not queue:
+            self._queued.pop(portal, None)
+
+    def _run_batch(self, batch):
+        """Executor entry point: run a batch of task groups for one portal, then
+        start the next queued batch for that portal."""
+        try:
+            dispatched_at = datetime.now()
+            for group in batch:
+                for task in group:
+                    self._record_dispatch_lag(task, dispatched_at)
+            self._execute_batch(batch)
+        finally:
+            with self._stats_lock:
+                self._stats['completed'] += sum(len(group) for group in batch)
+                self._stats['batches'] += 1
+            self._task_done(batch[0][0]['portal'], batch)
+
+    def _task_done(self, portal, batch):
+        """Free the portal slot and start the next batch waiting for it."""
+        with self._dispatch_lock:
+            self._held.difference_update(task['taskId'] for group in batch for task in group)
+            self._in_flight[portal] -= 1
+            self._in_flight_groups -= len(batch)
+            if not self._in_flight[portal]:
+                del self._in_flight[portal]
+            if self.running:
+                self._fill(portal)
+        # Due tasks may have been left unclaimed while the executor was full,
+        # or skipped because their user had a group running; claim them now
+        self._wakeup.set()
+
+    def _release_claims(self, task_ids):
+        """Return claimed tasks that never started to the queue."""
+        session = get_db_session()
+        try:
+            released = session.query(ScheduledTask).filter(
+                ScheduledTask.id.in_(task_ids),
+                ScheduledTask.status == 'running',
+                ScheduledTask.lease_owner == self.worker_id
+            ).update({
+                'status': 'scheduled',
+                'lease_owner': None,
+                'lease_expires_at': None
+            }, synchronize_session=False)
+            session.commit()
+            self.logger.info("Released %d claimed tasks that had not started", released)
+            with self._stats_lock:
+                self._stats['released'] += released
+        except Exception as e:
+            self.logger.error("Error releasing claimed tasks: %s", e)
+            session.rollback()
         finally:
             session.close()
-    
-    def _execute_task(self, task):
-        """Execute a specific task.
-        
+
+    def _execute_batch(self, batch):
+        """Execute claimed task groups for one portal, as one SSH batch when there are several.
+
+        Each batch is traced on its own, so its log lines share a trace id.
+
         Args:
-            task: The ScheduledTask object to execute.
+            batch: Claimed task groups from _claim_due_tasks, all for the same portal.
         """
-        self.logger.info(f"Executing task {task.id} for user {task.user_name}")
-        
-        session = get_db_session()
+        portal = batch[0][0]['portal']
+        task_ids = [task['taskId'] for group in batch for task in group]
+        with trace('scheduler.batch', portal=portal, users=len(batch), task_ids=task_ids):
+            self._execute_traced_batch(portal, batch)
+
+    def _execute_traced_batch(self, portal, batch):
+        """Body of _execute_batch, run inside the batch's trace."""
+        self.logger.info("Executing tasks for %d users on portal %s", len(batch), portal)
+
+        started = time.monotonic()
         try:
-            # Prepare data for execution
-            data = {
-                'taskId': task.id,
-                'userName': task.user_name,
-                'portal': task.portal,
-                'action': task.action,
-                'roles': task.roles.split(',') if task.roles else []
-            }
-            
             # Call the execute endpoint using internal API call
             # Import here to avoid circular imports
-            from routes.teleport_scheduler import execute_task_internal
-            result = execute_task_internal(data)
-            
+            from routes.teleport_scheduler import execute_task_groups_internal
+            with track_queries(f"Scheduler batch for {len(batch)} users on {portal}") as query_stats:
+                results = execute_task_groups_internal(batch)
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug(query_stats.summary())
+        except Exception as e:
+            self.logger.error("Error executing tasks on portal %s: %s", portal, e)
+            results = [{'success': False, 'message': f"Error: {str(e)}"}] * len(batch)
+        SCHEDULER_EXECUTION_DURATION.labels(portal).observe(time.monotonic() - started)
+
+        for group, result in zip(batch, results):
+            task_ids = [task['taskId'] for task in group]
+            label = ', '.join(task_ids)
             if result.get('success', False):
-                self.logger.info(f"Task {task.id} executed successfully")
+                self.logger.info("Tasks %s executed successfully", label)
             else:
-                self.logger.error(f"Task {task.id} execution failed: {result.get('message')}")
-                
-        except Exception as e:
-            self.logger.error(f"Error executing task {task.id}: {str(e)}")
-            # Update task status to failed
-            try:
-                task.status = 'failed'
-                task.executed_at = datetime.now()
-                task.result = f"Error: {str(e)}"
-                session.commit()
-            except Exception as commit_err:
-                self.logger.error(f"Error updating task status: {str(commit_err)}")
-                session.rollback()
+                self.logger.error("Tasks %s execution failed: %s", label, result.get('message'))
+                self._fail_if_running(task_ids, result.get('message'))
+
+    def _fail_if_running(self, task_ids, message):
+        """Mark tasks failed if execution ended without recording an outcome.
+
+        Otherwise they would stay running until their lease expired and then run again.
+        """
+        session = get_db_session()
+        try:
+            session.query(ScheduledTask).filter(
+                ScheduledTask.id.in_(task_ids),
+                ScheduledTask.status == 'running',
+                ScheduledTask.lease_owner == self.worker_id
+            ).update({
+                'status': 'failed',
+                'executed_at': datetime.now(),
+                'result': message
+            }, synchronize_session=False)
+            session.commit()
+        except Exception as commit_err:
+            self.logger.error("Error updating task status: %s", commit_err)
+            session.rollback()
         finally:
             session.close()
 
 # Create a singleton instance
-scheduler = TaskScheduler()
+scheduler = TaskScheduler(
+    reconcile_interval=SCHEDULER_RECONCILE_INTERVAL,
+    notify_channel=SCHEDULER_NOTIFY_CHANNEL,
+    heap_size=SCHEDULER_HEAP_SIZE,
+    lease_seconds=SCHEDULER_LEASE_SECONDS,
+    claim_batch_size=SCHEDULER_CLAIM_BATCH_SIZE,
+    max_workers=SCHEDULER_MAX_WORKERS,
+    portal_concurrency=SCHEDULER_PORTAL_CONCURRENCY,
+    drain_timeout=SCHEDULER_DRAIN_TIMEOUT,
+    ssh_batch_size=SCHEDULER_SSH_BATCH_SIZE,
+    retention_days=TASK_RETENTION_DAYS,
+    retention_interval=TASK_RETENTION_INTERVAL,
+    retention_batch_size=TASK_RETENTION_BATCH_SIZE
+)
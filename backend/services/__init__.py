@@ -0,0 +1,2 @@
+
+# Services package
@@ -0,0 +1,152 @@
+import uuid
+import logging
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy.exc import IntegrityError
+from models.sync_job import SyncJob
+from utils.db import get_db_session
+from services.user_sync import sync_portal
+from config import SYNC_MAX_WORKERS, SYNC_JOB_STALE_AFTER, SYNC_PORTAL_TIMEOUT
+
+# Background workers that run sync jobs outside of the request thread
+_executor = ThreadPoolExecutor(max_workers=SYNC_MAX_WORKERS, thread_name_prefix='sync-job')
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+def job_to_dict(job):
+    """Convert a SyncJob ORM object to the dictionary shape used by the API."""
+    return {
+        'id': job.id,
+        'portal': job.portal,
+        'status': job.status,
+        'phase': job.phase,
+        'processed': job.processed,
+        'message': job.message,
+        'counts': job.counts,
+        'timings_ms': job.timings,
+        'orphaned_users': job.orphaned_users or [],
+        'createdAt': job.created_at.isoformat() if job.created_at else None,
+        'startedAt': job.started_at.isoformat() if job.started_at else None,
+        'updatedAt': job.updated_at.isoformat() if job.updated_at else None,
+        'finishedAt': job.finished_at.isoformat() if job.finished_at else None
+    }
+
+def _active_job(session, portal):
+    """Return the queued or running job for a portal, expiring it if it has stalled."""
+    job = session.query(SyncJob).filter(
+        SyncJob.portal == portal, SyncJob.status.in_(ACTIVE_STATUSES)
+    ).first()
+    if job is None:
+        return None
+
+    stale_before = datetime.utcnow() - timedelta(seconds=SYNC_JOB_STALE_AFTER)
+    if job.updated_at and job.updated_at < stale_before:
+        # The worker that owned it most likely died; free the portal for a new run
+        logging.warning("Sync job %s for portal %s made no progress since %s, marking failed",
+                        job.id, portal, job.updated_at)
+        job.status = 'failed'
+        job.message = 'Sync job abandoned: no progress reported'
+        job.finished_at = datetime.utcnow()
+        session.commit()
+        return None
+    return job
+
+def start_sync_job(portal, timeout=None):
+    """Queue a background sync for a portal, or attach to the one already running.
+
+    Args:
+        portal: Portal name, must be a key in SSH_HOSTS.
+        timeout: Wall-clock limit for the sync in seconds, defaults to SYNC_PORTAL_TIMEOUT.
+            A job still reading the portal's users when it passes is marked failed.
+
+    Returns:
+        Tuple of (job dictionary, attached) where attached is True when an
+        existing active job was returned instead of starting a new one.
+    """
+    session = get_db_session()
+    try:
+        job = _active_job(session, portal)
+        if job is not None:
+            return job_to_dict(job), True
+
+        now = datetime.utcnow()
+        job = SyncJob(
+            id=str(uuid.uuid4()),
+            portal=portal,
+            status='queued',
+            phase='queued',
+            processed=0,
+            created_at=now,
+            updated_at=now
+        )
+        session.add(job)
+        try:
+            session.commit()
+        except IntegrityError:
+            # Another request created the active job for this portal first
+            session.rollback()
+            job = _active_job(session, portal)
+            if job is None:
+                raise
+            return job_to_dict(job), True
+
+        job_dict = job_to_dict(job)
+    finally:
+        session.close()
+
+    _executor.submit(_run_sync_job, job_dict['id'], portal, timeout or SYNC_PORTAL_TIMEOUT)
+    return job_dict, False
+
+def get_sync_job(job_id):
+    """Return a sync job as a dictionary, or None if it does not exist."""
+    session = get_db_session()
+    try:
+        job = session.query(SyncJob).filter_by(id=job_id).first()
+        return job_to_dict(job) if job else None
+    finally:
+        session.close()
+
+def _update_job(job_id, **fields):
+    session = get_db_session()
+    try:
+        fields['updated_at'] = datetime.utcnow()
+        session.query(SyncJob).filter_by(id=job_id).update(fields, synchronize_session=False)
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        logging.error("Error updating sync job %s: %s", job_id, e)
+    finally:
+        session.close()
+
+def _run_sync_job(job_id, portal, timeout=SYNC_PORTAL_TIMEOUT):
+    """Run a queued sync job and record its progress and outcome."""
+    _update_job(job_id, status='running', started_at=datetime.utcnow())
+
+    def progress(phase, processed=0):
+        _update_job(job_id, phase=phase, processed=processed)
+
+    try:
+        result = sync_portal(portal, timeout=timeout, progress=progress)
+    except Exception as e:
+        logging.error("Unexpected error in sync job %s for portal %s: %s", job_id, portal, e)
+        result = {'success': False, 'message': f"Error: {str(e)}"}
+
+    timings = result.get('timings_ms') or {}
+    if 'duration_ms' in result:
+        timings['total'] = result['duration_ms']
+
+    _update_job(
+        job_id,
+        status='completed' if result['success'] else 'failed',
+        phase='done',
+        processed=result.get('processed', 0),
+        message=result.get('message'),
+        counts={
+            key: result[key]
+            for key in ('snapshot_unchanged', 'unchanged', 'updated', 'inserted', 'orphaned', 'id_fixups')
+            if key in result
+        },
+        timings=timings,
+        orphaned_users=result.get('orphaned_users', []),
+        finished_at=datetime.utcnow()
+    )
@@ -0,0 +1,117 @@
+from datetime import datetime
+from sqlalchemy import select, tuple_
+from models.scheduled_task import ScheduledTask
+from services.user_queries import QueryError, encode_cursor, decode_cursor
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+# Tasks returned by the deprecated unpaginated list before it is cut off
+UNPAGED_MAX = MAX_LIMIT
+
+TASK_STATUSES = ('scheduled', 'running', 'completed', 'failed', 'dead')
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+def task_to_dict(task, include_result=False):
+    """Convert a ScheduledTask (or archived task) to the dictionary shape used by the API.
+
+    The result text can be large, so it is only included for the detail endpoint.
+    """
+    data = {
+        'id': task.id,
+        'userId': task.user_id,
+        'userName': task.user_name,
+        'portal': task.portal,
+        'scheduledTime': task.scheduled_time.isoformat(),
+        'action': task.action,
+        'roles': task.roles.split(',') if task.roles else [],
+        'status': task.status,
+        'createdAt': _isoformat(task.created_at),
+        'executedAt': _isoformat(task.executed_at),
+        'attemptCount': task.attempt_count,
+        'nextAttemptAt': _isoformat(getattr(task, 'next_attempt_at', None)),
+        'lastError': task.last_error
+    }
+    if include_result:
+        data['result'] = task.result
+        data['archived'] = hasattr(task, 'archived_at')
+    return data
+
+def parse_time(value, name):
+    """Parse an ISO 8601 query parameter, raising QueryError if it is invalid."""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise QueryError(f"Invalid {name}; use an ISO 8601 timestamp")
+
+def apply_task_filters(query, status=None, portal=None, user_id=None, user_name=None,
+                       scheduled_from=None, scheduled_to=None):
+    """Apply the jobs list filters to a ScheduledTask select.
+
+    Args:
+        status: Comma-separated list of statuses.
+        scheduled_from, scheduled_to: Inclusive/exclusive bounds on scheduled_time.
+    """
+    if status:
+        statuses = [s for s in status.split(',') if s]
+        unknown = set(statuses) - set(TASK_STATUSES)
+        if unknown:
+            raise QueryError(f"Invalid status. Use one of: {', '.join(TASK_STATUSES)}")
+        query = query.where(ScheduledTask.status.in_(statuses))
+    if portal:
+        query = query.where(ScheduledTask.portal == portal)
+    if user_id:
+        query = query.where(ScheduledTask.user_id == user_id)
+    if user_name:
+        query = query.where(ScheduledTask.user_name == user_name)
+    if scheduled_from:
+        query = query.where(ScheduledTask.scheduled_time >= scheduled_from)
+    if scheduled_to:
+        query = query.where(ScheduledTask.scheduled_time < scheduled_to)
+    return query
+
+def list_tasks(session, order='desc', limit=DEFAULT_LIMIT, cursor=None, **filters):
+    """Return one page of scheduled tasks ordered by scheduled_time, using keyset pagination.
+
+    Args:
+        session: Database session.
+        order: 'asc' or 'desc' (default, newest first).
+        limit: Page size, at most MAX_LIMIT.
+        cursor: Opaque cursor from a previous page's next_cursor.
+        **filters: Filters accepted by apply_task_filters.
+
+    Returns:
+        Tuple of (tasks, next_cursor).
+
+    Raises:
+        QueryError: If a parameter is invalid.
+    """
+    if order not in ('asc', 'desc'):
+        raise QueryError("Invalid order. Use 'asc' or 'desc'")
+    if limit < 1 or limit > MAX_LIMIT:
+        raise QueryError(f"Limit must be between 1 and {MAX_LIMIT}")
+
+    query = apply_task_filters(select(ScheduledTask), **filters)
+
+    key = tuple_(ScheduledTask.scheduled_time, ScheduledTask.id)
+    if cursor:
+        value, task_id = decode_cursor(cursor, 'scheduledTime', order, datetime_sorts={'scheduledTime'})
+        # Row comparison matches the (scheduled_time, id) index
+        query = query.where(key > tuple_(value, task_id) if order == 'asc' else key < tuple_(value, task_id))
+
+    if order == 'asc':
+        query = query.order_by(ScheduledTask.scheduled_time.asc(), ScheduledTask.id.asc())
+    else:
+        query = query.order_by(ScheduledTask.scheduled_time.desc(), ScheduledTask.id.desc())
+
+    # Fetch one extra row to know whether there is a next page
+    tasks = session.execute(query.limit(limit + 1)).scalars().all()
+    next_cursor = None
+    if len(tasks) > limit:
+        tasks = tasks[:limit]
+        last = tasks[-1]
+        next_cursor = encode_cursor('scheduledTime', order, last.scheduled_time, last.id)
+    return tasks, next_cursor
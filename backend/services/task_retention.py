@@ -0,0 +1,73 @@
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from utils.db import get_db_session
+
+# Columns copied from scheduled_tasks into scheduled_tasks_archive
+_ARCHIVE_COLUMNS = (
+    'id, user_id, user_name, portal, scheduled_time, action, roles, role_list, '
+    'status, created_at, executed_at, result, attempt_count, last_error'
+)
+
+# An id already in the archive (e.g. a task restored and finished again) is
+# overwritten with the newer row; skipping it would lose the deleted task
+_ARCHIVE_UPDATE = ', '.join(
+    f"{column} = EXCLUDED.{column}"
+    for column in [name.strip() for name in _ARCHIVE_COLUMNS.split(',')] + ['archived_at']
+    if column != 'id'
+)
+
+# Move one batch in a single statement: the DELETE ... RETURNING feeds the
+# INSERT, so a task is never in both tables or in neither
+_ARCHIVE_BATCH = text(f"""
+    WITH moved AS (
+        DELETE FROM scheduled_tasks
+        WHERE id IN (
+            SELECT id FROM scheduled_tasks
+            WHERE status IN ('completed', 'failed', 'dead')
+              AND coalesce(executed_at, created_at) < :cutoff
+            LIMIT :batch_size
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING {_ARCHIVE_COLUMNS}
+    )
+    INSERT INTO scheduled_tasks_archive ({_ARCHIVE_COLUMNS}, archived_at)
+    SELECT {_ARCHIVE_COLUMNS}, CURRENT_TIMESTAMP FROM moved
+    ON CONFLICT (id) DO UPDATE SET {_ARCHIVE_UPDATE}
+""")
+
+def archive_finished_tasks(retention_days, batch_size=1000, max_batches=None):
+    """Move completed, failed and dead tasks older than retention_days to the archive table.
+
+    Each batch is its own transaction, so the hot table is never locked for
+    long and concurrent runs (e.g. one per worker) skip each other's rows.
+
+    Args:
+        retention_days: Tasks finished more than this many days ago are archived.
+        batch_size: Maximum number of tasks moved per transaction.
+        max_batches: Optional cap on the number of batches in this run.
+
+    Returns:
+        Number of tasks archived.
+    """
+    cutoff = datetime.now() - timedelta(days=retention_days)
+    archived = 0
+    batches = 0
+    session = get_db_session()
+    try:
+        while max_batches is None or batches < max_batches:
+            moved = session.execute(_ARCHIVE_BATCH, {'cutoff': cutoff, 'batch_size': batch_size}).rowcount
+            session.commit()
+            archived += moved
+            batches += 1
+            if moved < batch_size:
+                break
+    except Exception as e:
+        session.rollback()
+        logging.error(f"Error archiving finished tasks: {str(e)}")
+    finally:
+        session.close()
+
+    if archived:
+        logging.info(f"Archived {archived} tasks finished before {cutoff.isoformat()}")
+    return archived
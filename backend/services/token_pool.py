@@ -0,0 +1,446 @@
+import re
+import json
+import time
+import zlib
+import shlex
+import atexit
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import delete, func, text
+from models.join_token import JoinToken
+from utils.db import get_db_session
+from utils.ssh import execute_ssh_command, execute_ssh_batch
+from utils.tracing import trace
+from config import (
+    SSH_HOSTS, TOKEN_POOL_SIZE, TOKEN_POOL_TTL, TOKEN_POOL_MIN_REMAINING, TOKEN_POOL_REFILL_INTERVAL
+)
+
+logger = logging.getLogger(__name__)
+
+# Read-only, so the CA pin and join address are shared by the mints of all
+# threads and cached briefly (SSH_READ_CACHE_TTL)
+_STATUS_COMMAND = 'sudo tctl status'
+_PROXIES_COMMAND = 'sudo tctl get proxies --format=json'
+_AUTH_SERVERS_COMMAND = 'sudo tctl get auth_servers --format=json'
+
+_CA_PIN = re.compile(r'^CA pin\s+(sha256:\S+)', re.MULTILINE)
+# tctl prints nanoseconds; Python parses at most microseconds
+_FRACTION = re.compile(r'(\.\d{6})\d+')
+
+def _token_command(ttl):
+    return f"sudo tctl tokens add --type=node --ttl={int(ttl)}s --format=json"
+
+def _load_json(output, opener):
+    """Decode the first JSON value starting with opener, skipping warnings tctl printed before it."""
+    start = output.find(opener) if output else -1
+    if start < 0:
+        raise ValueError('no JSON in tctl output')
+    return json.JSONDecoder().raw_decode(output[start:])[0]
+
+def _parse_time(value):
+    parsed = datetime.fromisoformat(_FRACTION.sub(r'\1', value).replace('Z', '+00:00'))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def parse_token(output, ttl):
+    """Parse the output of `tctl tokens add --format=json`.
+
+    Returns:
+        Dictionary with token, roles and expires_at.
+    """
+    data = _load_json(output, '{')
+    if not data.get('token'):
+        raise ValueError('tctl returned no token')
+    expires = data.get('expires')
+    return {
+        'token': data['token'],
+        'roles': [role.lower() for role in data.get('roles') or ['node']],
+        'expires_at': _parse_time(expires) if expires else datetime.now(timezone.utc) + timedelta(seconds=ttl)
+    }
+
+def parse_ca_pin(output):
+    """Return the CA pin from `tctl status` output, or None."""
+    match = _CA_PIN.search(output or '')
+    return match.group(1) if match else None
+
+def parse_join_address(proxies_output, auth_servers_output):
+    """Return the address nodes join through: a proxy's public address, else an auth server.
+
+    This is the address tctl itself puts in the join command it prints.
+    """
+    try:
+        for proxy in _load_json(proxies_output, '['):
+            spec = proxy.get('spec') or {}
+            public_addrs = spec.get('public_addrs') or [spec.get('public_addr')]
+            if public_addrs[0]:
+                return public_addrs[0]
+    except (ValueError, AttributeError, TypeError):
+        pass
+    try:
+        for auth_server in _load_json(auth_servers_output, '['):
+            addr = (auth_server.get('spec') or {}).get('addr')
+            if addr:
+                return addr
+    except (ValueError, AttributeError, TypeError):
+        pass
+    return None
+
+def token_to_dict(token):
+    """Convert a pooled token to the response shape of /teleport/tkgen."""
+    remaining = (token['expires_at'] - datetime.now(timezone.utc)).total_seconds()
+    options = {'roles': ','.join(token['roles']), 'token': token['token']}
+    if token['ca_pin']:
+        options['ca_pin'] = token['ca_pin']
+    if token['auth_server']:
+        options['auth_server'] = token['auth_server']
+    return {
+        'invite_token': token['token'],
+        'expiry': f"{max(0, int(remaining // 60))} minutes",
+        'expires_at': token['expires_at'].isoformat(),
+        'join_command': {'command': 'teleport start', 'options': options},
+        'notes': []
+    }
+
+class JoinTokenPool:
+    """Keeps unexpired node join tokens minted ahead of time for each portal.
+
+    Pooled tokens live in the join_tokens table, so every backend process
+    shares one pool of `size` tokens per portal. take() deletes the token it
+    returns, skipping rows another process has locked, so each token is handed
+    out once. A background thread tops the pools up, minting in one SSH batch;
+    an advisory lock lets only one process refill a portal at a time. Tokens
+    with less than `min_remaining` seconds left are never handed out; the refill
+    revokes them and keeps them in the table until tctl has confirmed.
+
+    Refills follow consumption: a portal whose pool nobody drew from for a
+    whole token lifetime is left to drain, so an idle portal is not reminted
+    every `ttl - min_remaining` seconds. The next request mints on the spot
+    and the pool fills up again.
+    """
+
+    def __init__(self, portals, size, ttl, min_remaining, refill_interval):
+        if min_remaining >= ttl:
+            # Every token would be stale as soon as it was minted
+            logger.warning("TOKEN_POOL_MIN_REMAINING (%ss) is not below TOKEN_POOL_TTL (%ss), using half the TTL",
+                           min_remaining, ttl)
+            min_remaining = ttl / 2
+        self.portals = list(portals)
+        self.size = size
+        self.ttl = ttl
+        self.min_remaining = min_remaining
+        self.refill_interval = refill_interval
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        # Per portal: when this process last saw a token taken, and how many
+        # tokens its last refill left in the table (None until it refilled)
+        self._last_demand = {portal: time.monotonic() for portal in self.portals}
+        self._left = dict.fromkeys(self.portals)
+        self._stats = {
+            portal: {'minted': 0, 'handed_out': 0, 'misses': 0, 'revoked': 0, 'last_refill_at': None, 'last_error': None}
+            for portal in self.portals
+        }
+
+    def start(self):
+        """Start the background refill thread, if it is not running yet."""
+        with self._lock:
+            if self._thread is not None or self.size <= 0:
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='token-pool', daemon=True)
+            self._thread.start()
+        # Let a refill in progress record what it minted before the process exits
+        atexit.register(self.stop)
+        logger.info("Join token pool refill started: %d tokens per portal", self.size)
+
+    def stop(self, revoke=False):
+        """Stop the refill thread.
+
+        Args:
+            revoke: Also revoke every pooled token. Only the process that owns
+                the pool (python -m scheduler) should do this; web workers come
+                and go and leave the shared pool to the others.
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stopping.set()
+            self._wakeup.set()
+            thread.join(timeout=30)
+        if revoke:
+            for portal in self.portals:
+                try:
+                    self._revoke_all(portal)
+                except Exception as e:
+                    logger.error("Error revoking pooled join tokens for portal %s: %s", portal, e)
+
+    def take(self, portal):
+        """Hand out a token for the portal, minting one on the spot if the pool is empty.
+
+        Returns:
+            Tuple of (token, error).
+        """
+        token = None
+        if portal in self._stats:
+            # Refilling starts with the first request rather than at startup
+            self.start()
+            try:
+                token = self._pop(portal)
+            except Exception as e:
+                logger.error("Error taking a pooled join token for portal %s: %s", portal, e)
+            with self._lock:
+                self._stats[portal]['handed_out' if token is not None else 'misses'] += 1
+                self._last_demand[portal] = time.monotonic()
+            self._wakeup.set()
+        if token is not None:
+            return token, None
+
+        tokens, _, error = self._mint(portal, 1)
+        if error:
+            return None, error
+        return tokens[0], None
+
+    def stats(self):
+        """Return per-portal pool sizes and this process's counters."""
+        usable_until = datetime.utcnow() + timedelta(seconds=self.min_remaining)
+        session = get_db_session()
+        try:
+            available = dict(session.query(JoinToken.portal, func.count()).filter(
+                JoinToken.expires_at > usable_until
+            ).group_by(JoinToken.portal).all())
+        finally:
+            session.close()
+        with self._lock:
+            return {
+                'size': self.size,
+                'refilling': self._thread is not None,
+                'portals': {
+                    portal: dict(stats, available=available.get(portal, 0))
+                    for portal, stats in self._stats.items()
+                }
+            }
+
+    def _pop(self, portal):
+        """Remove and return the usable pooled token that expires first, or None."""
+        usable_until = datetime.utcnow() + timedelta(seconds=self.min_remaining)
+        session = get_db_session()
+        try:
+            next_token = session.query(JoinToken.token).filter(
+                JoinToken.portal == portal, JoinToken.expires_at > usable_until
+            ).order_by(JoinToken.expires_at).limit(1).with_for_update(skip_locked=True).scalar_subquery()
+            row = session.execute(
+                delete(JoinToken).where(JoinToken.token == next_token).returning(
+                    JoinToken.token, JoinToken.roles, JoinToken.ca_pin, JoinToken.auth_server, JoinToken.expires_at
+                )
+            ).first()
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        if row is None:
+            return None
+        return {
+            'token': row.token,
+            'roles': row.roles.split(','),
+            'ca_pin': row.ca_pin,
+            'auth_server': row.auth_server,
+            'expires_at': row.expires_at.replace(tzinfo=timezone.utc)
+        }
+
+    def _mint(self, portal, count, revoke=()):
+        """Mint count tokens on the portal in one SSH batch, revoking the given ones.
+
+        Returns:
+            Tuple of (tokens, revoked, error). revoked lists the tokens tctl no
+            longer knows; error is set only when nothing could be minted.
+        """
+        commands = [f"sudo tctl tokens rm {shlex.quote(token)}" for token in revoke]
+        first_token = len(commands)
+        commands += [_token_command(self.ttl)] * count
+
+        results, error = execute_ssh_batch(portal, commands)
+        if error:
+            return None, [], error
+
+        # A token that expired meanwhile is reported as not found, which is just as good
+        revoked = [
+            token for token, (_, command_error) in zip(revoke, results)
+            if command_error is None or 'not found' in command_error.lower()
+        ]
+        if len(revoked) < len(revoke):
+            logger.warning("Could not revoke %d join tokens on portal %s, retrying on the next refill",
+                           len(revoke) - len(revoked), portal)
+
+        ca_pin, auth_server = self._join_parameters(portal) if count else (None, None)
+
+        tokens = []
+        errors = []
+        for output, command_error in results[first_token:]:
+            if command_error:
+                errors.append(command_error)
+                continue
+            try:
+                token = parse_token(output, self.ttl)
+            except ValueError as e:
+                errors.append(f"Unexpected tctl output: {e}")
+                continue
+            token.update(ca_pin=ca_pin, auth_server=auth_server)
+            tokens.append(token)
+
+        if errors:
+            logger.error("Minting join tokens on portal %s failed: %s", portal, errors[0])
+        if count and not tokens:
+            return None, revoked, errors[0]
+        if portal in self._stats:
+            with self._lock:
+                self._stats[portal]['minted'] += len(tokens)
+                self._stats[portal]['revoked'] += len(revoked)
+        return tokens, revoked, None
+
+    def _join_parameters(self, portal):
+        """Return the portal's (CA pin, join address); either is None if it could not be read."""
+        status, _ = execute_ssh_command(portal, _STATUS_COMMAND, read_only=True)
+        proxies, _ = execute_ssh_command(portal, _PROXIES_COMMAND, read_only=True)
+        auth_servers = None
+        if parse_join_address(proxies, None) is None:
+            auth_servers, _ = execute_ssh_command(portal, _AUTH_SERVERS_COMMAND, read_only=True)
+        ca_pin = parse_ca_pin(status)
+        auth_server = parse_join_address(proxies, auth_servers)
+        if ca_pin is None or auth_server is None:
+            logger.warning("Could not read the join parameters of portal %s (CA pin %s, address %s)",
+                           portal, ca_pin, auth_server)
+        return ca_pin, auth_server
+
+    def _locked_session(self, portal):
+        """Return a session holding the portal's refill lock, or None if another process holds it.
+
+        The lock is released when the session's transaction ends.
+        """
+        session = get_db_session()
+        try:
+            locked = session.execute(
+                text("SELECT pg_try_advisory_xact_lock(:key)"),
+                {'key': zlib.crc32(f"join_tokens:{portal}".encode())}
+            ).scalar()
+        except Exception:
+            session.close()
+            raise
+        if not locked:
+            session.close()
+            return None
+        return session
+
+    def _store(self, session, portal, tokens, revoked):
+        """Record minted tokens and forget revoked ones, in the session's transaction.
+
+        Tokens that were minted but could not be recorded are revoked again, so
+        no valid token is left untracked.
+        """
+        try:
+            session.add_all(
+                JoinToken(
+                    token=token['token'],
+                    portal=portal,
+                    roles=','.join(token['roles']),
+                    ca_pin=token['ca_pin'],
+                    auth_server=token['auth_server'],
+                    expires_at=token['expires_at'].astimezone(timezone.utc).replace(tzinfo=None)
+                )
+                for token in tokens or ()
+            )
+            if revoked:
+                session.query(JoinToken).filter(JoinToken.token.in_(revoked)).delete(synchronize_session=False)
+            session.commit()
+        except Exception:
+            session.rollback()
+            if tokens:
+                self._mint(portal, 0, [token['token'] for token in tokens])
+            raise
+
+    def _in_demand(self, portal, pooled):
+        """Whether the portal's pool was drawn from within the last token lifetime.
+
+        Besides this process's own take() calls, fewer rows than its last
+        refill left behind means another process took tokens.
+        """
+        with self._lock:
+            left = self._left[portal]
+            if left is not None and pooled < left:
+                self._last_demand[portal] = time.monotonic()
+            return time.monotonic() - self._last_demand[portal] < self.ttl
+
+    def _refill(self, portal):
+        """Revoke stale tokens and, while the pool is in use, top it up to size."""
+        session = self._locked_session(portal)
+        if session is None:
+            # Another process is refilling this portal
+            return
+        try:
+            usable_until = datetime.utcnow() + timedelta(seconds=self.min_remaining)
+            pooled = session.query(JoinToken.token, JoinToken.expires_at).filter(JoinToken.portal == portal).all()
+            stale = [row.token for row in pooled if row.expires_at <= usable_until]
+            needed = max(self.size - (len(pooled) - len(stale)), 0)
+            if needed and not self._in_demand(portal, len(pooled)):
+                needed = 0
+            if not needed and not stale:
+                session.commit()
+                with self._lock:
+                    self._left[portal] = len(pooled)
+                return
+
+            with trace('token_pool.refill', portal=portal, tokens=needed):
+                tokens, revoked, error = self._mint(portal, needed, stale)
+            # Stale tokens that could not be revoked stay in the table for the next refill
+            self._store(session, portal, tokens, revoked)
+            with self._lock:
+                self._left[portal] = len(pooled) - len(revoked) + len(tokens or ())
+                stats = self._stats[portal]
+                stats['last_refill_at'] = datetime.now().isoformat()
+                stats['last_error'] = error
+            if tokens:
+                logger.debug("Added %d join tokens to the pool of portal %s", len(tokens), portal)
+        finally:
+            session.close()
+
+    def _revoke_all(self, portal):
+        """Revoke and forget every pooled token of the portal."""
+        session = self._locked_session(portal)
+        if session is None:
+            return
+        try:
+            pooled = [row.token for row in session.query(JoinToken.token).filter(JoinToken.portal == portal)]
+            if not pooled:
+                session.commit()
+                return
+            _, revoked, error = self._mint(portal, 0, pooled)
+            self._store(session, portal, None, revoked)
+            logger.info("Revoked %d of %d pooled join tokens for portal %s", len(revoked), len(pooled), portal)
+        finally:
+            session.close()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            # Cleared before refilling, so a take() during the refill triggers another round
+            self._wakeup.clear()
+            for portal in self.portals:
+                if self._stopping.is_set():
+                    break
+                try:
+                    self._refill(portal)
+                except Exception as e:
+                    logger.error("Error refilling join tokens for portal %s: %s", portal, e)
+                    with self._lock:
+                        self._stats[portal]['last_error'] = str(e)
+            self._wakeup.wait(self.refill_interval)
+
+token_pool = JoinTokenPool(
+    SSH_HOSTS,
+    size=TOKEN_POOL_SIZE,
+    ttl=TOKEN_POOL_TTL,
+    min_remaining=TOKEN_POOL_MIN_REMAINING,
+    refill_interval=TOKEN_POOL_REFILL_INTERVAL
+)
@@ -0,0 +1,163 @@
+import json
+import base64
+from datetime import datetime
+from sqlalchemy import and_, func, select, tuple_
+from models.user import User
+
+# Columns the user list can be sorted by; id is always the tie-breaker
+SORT_COLUMNS = {
+    'name': User.name,
+    'createdDate': User.created_date,
+    'lastLogin': User.last_login,
+    'status': User.status,
+    'manager': User.manager,
+    'portal': User.portal,
+    'id': User.id
+}
+DATETIME_SORTS = {'createdDate', 'lastLogin'}
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+# Rows returned by the deprecated unpaginated list before it is cut off
+UNPAGED_MAX = MAX_LIMIT
+
+class QueryError(ValueError):
+    """Raised for invalid list parameters; the message is safe to return to the client."""
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def encode_cursor(sort, order, value, user_id):
+    """Encode the position after a row as an opaque cursor string."""
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    payload = json.dumps([sort, order, value, user_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, sort, order, datetime_sorts=DATETIME_SORTS):
+    """Decode a cursor into (value, row_id), checking it matches the requested ordering."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_sort, cursor_order, value, user_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        raise QueryError('Invalid cursor')
+    if cursor_sort != sort or cursor_order != order:
+        raise QueryError('Cursor does not match the requested sort order')
+    if value is not None and sort in datetime_sorts:
+        try:
+            value = datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            raise QueryError('Invalid cursor')
+    return value, user_id
+
+def apply_user_filters(query, portal=None, status=None, manager=None, role=None, roles=None, name_prefix=None):
+    """Apply the list filters to a User query or select.
+
+    role keeps users holding that role; roles, a comma-separated list, keeps
+    users holding any of them.
+    """
+    if portal:
+        query = query.where(User.portal == portal)
+    if status:
+        query = query.where(User.status == status)
+    if manager:
+        query = query.where(User.manager == manager)
+    if role:
+        # role_list @> ARRAY[role] is served by the GIN index
+        query = query.where(User.role_list.contains([role]))
+    if roles:
+        # role_list && ARRAY[...] is served by the GIN index as well
+        query = query.where(User.role_list.overlap([r for r in roles.split(',') if r]))
+    if name_prefix:
+        query = query.where(func.lower(User.name).like(f"{_escape_like(name_prefix.lower())}%", escape='\\'))
+    return query
+
+def _keyset_segments(column, order, value, user_id):
+    """Conditions selecting the rows after (value, user_id), one per index range in sort order.
+
+    Rows are ordered by column NULLS LAST, then id. The non-NULL rows after the cursor are a
+    single row-value range and the NULL rows a second one; keeping them as separate queries
+    lets each be served by an index seek instead of an OR that forces a filtered scan.
+    """
+    if value is None:
+        # NULLs sort last, so only the remaining NULL rows can follow
+        after_id = User.id > user_id if order == 'asc' else User.id < user_id
+        return [and_(column.is_(None), after_id)]
+    key = tuple_(column, User.id)
+    after = key > tuple_(value, user_id) if order == 'asc' else key < tuple_(value, user_id)
+    # A row comparison against a NULL column is never true, so NULL rows need their own range
+    return [after, column.is_(None)]
+
+def estimate_count(session, query):
+    """Return the planner's row estimate for a query instead of running count(*)."""
+    compiled = query.compile(dialect=session.get_bind().dialect)
+    plan = session.connection().exec_driver_sql(
+        f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params
+    ).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+def list_users(session, sort='name', order='asc', limit=DEFAULT_LIMIT, cursor=None, count='exact', **filters):
+    """Return one page of users using keyset pagination.
+
+    Args:
+        session: Database session.
+        sort: Key of SORT_COLUMNS to order by.
+        order: 'asc' or 'desc'.
+        limit: Page size, at most MAX_LIMIT.
+        cursor: Opaque cursor from a previous page's next_cursor.
+        count: 'exact', 'estimate' (planner estimate) or 'none'.
+        **filters: portal, status, manager, role, roles and name_prefix filters.
+
+    Returns:
+        Tuple of (users, next_cursor, total) where total is None when count is 'none'.
+
+    Raises:
+        QueryError: If a parameter is invalid.
+    """
+    if sort not in SORT_COLUMNS:
+        raise QueryError(f"Invalid sort column. Use one of: {', '.join(SORT_COLUMNS)}")
+    if order not in ('asc', 'desc'):
+        raise QueryError("Invalid order. Use 'asc' or 'desc'")
+    if count not in ('exact', 'estimate', 'none'):
+        raise QueryError("Invalid count. Use 'exact', 'estimate' or 'none'")
+    if limit < 1 or limit > MAX_LIMIT:
+        raise QueryError(f"Limit must be between 1 and {MAX_LIMIT}")
+
+    column = SORT_COLUMNS[sort]
+    filtered = apply_user_filters(select(User), **filters)
+
+    if order == 'asc':
+        ordering = (column.asc().nulls_last(), User.id.asc())
+    else:
+        ordering = (column.desc().nulls_last(), User.id.desc())
+
+    if cursor:
+        value, user_id = decode_cursor(cursor, sort, order)
+        segments = _keyset_segments(column, order, value, user_id)
+    else:
+        segments = [None]
+
+    # Fetch one extra row to know whether there is a next page
+    users = []
+    for condition in segments:
+        query = filtered if condition is None else filtered.where(condition)
+        query = query.order_by(*ordering).limit(limit + 1 - len(users))
+        users.extend(session.execute(query).scalars().all())
+        if len(users) > limit:
+            break
+
+    next_cursor = None
+    if len(users) > limit:
+        users = users[:limit]
+        last = users[-1]
+        next_cursor = encode_cursor(sort, order, getattr(last, column.key), last.id)
+
+    total = None
+    if count == 'exact':
+        total = session.execute(select(func.count()).select_from(filtered.subquery())).scalar()
+    elif count == 'estimate':
+        total = estimate_count(session, filtered)
+
+    return users, next_cursor, total
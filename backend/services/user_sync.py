@@ -0,0 +1,320 @@
+import json
+import time
+import hashlib
+import logging
+from datetime import datetime
+from sqlalchemy import select, update, values, column, String
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from models.user import User, user_fingerprint, split_roles
+from models.portal_sync_state import PortalSyncState
+from utils.db import get_db_session
+from utils.ssh import stream_ssh_command, SSHCommandError
+from utils.json_stream import iter_json_array, iter_batches
+from utils.metrics import SYNC_DURATION, SYNC_USERS
+from config import SYNC_PORTAL_TIMEOUT, SYNC_BATCH_SIZE
+
+FETCH_USERS_COMMAND = 'sudo tctl users ls --format=json'
+
+def user_to_dict(user):
+    """Convert a User ORM object to the dictionary shape used by the API."""
+    return {
+        'id': user.id,
+        'name': user.name,
+        'roles': user.roles.split(',') if user.roles else [],
+        'createdDate': user.created_date.isoformat() if user.created_date else None,
+        'lastLogin': user.last_login.isoformat() if user.last_login else None,
+        'status': user.status,
+        'manager': user.manager,
+        'portal': user.portal
+    }
+
+def make_user_id(name, client):
+    """Build the database id for a Teleport user in a portal."""
+    return f"{name.replace('@', '_at_')}_{client}"
+
+def _parse_created_date(created_date):
+    try:
+        return datetime.strptime(created_date, "%Y-%m-%dT%H:%M:%S.%fZ") if created_date else datetime.utcnow()
+    except ValueError:
+        return datetime.utcnow()
+
+def _iter_user_rows(client, users_data):
+    """Convert tctl user resources into user rows one at a time."""
+    for user_data in users_data:
+        if not isinstance(user_data, dict) or user_data.get('kind') != 'user':
+            continue
+        name = user_data.get('metadata', {}).get('name')
+        if not name:
+            continue
+
+        spec = user_data.get('spec', {})
+        created_by = spec.get('created_by', {})
+        roles = ','.join(spec.get('roles', []))
+        yield {
+            'id': make_user_id(name, client),
+            'name': name,
+            'roles': roles,
+            'role_list': split_roles(roles),
+            'created_date': _parse_created_date(created_by.get('time')),
+            'last_login': None,
+            'status': 'active',  # Mark as active since they exist in portal
+            'manager': created_by.get('user', {}).get('name'),
+            'portal': client,
+            'spec_fingerprint': user_fingerprint(name, roles, 'active', client)
+        }
+
+class SnapshotHash:
+    """Order-independent hash of a portal snapshot, built one fingerprint at a time.
+
+    Fingerprints are summed modulo 2**256, so the snapshot never has to be held
+    in memory or sorted.
+    """
+
+    def __init__(self):
+        self._total = 0
+        self.count = 0
+
+    def add(self, fingerprint):
+        self._total = (self._total + int(fingerprint, 16)) % (1 << 256)
+        self.count += 1
+
+    def hexdigest(self):
+        return hashlib.sha256(f"{self.count}:{self._total:064x}".encode()).hexdigest()
+
+def _elapsed_ms(started):
+    return round((time.monotonic() - started) * 1000, 1)
+
+def _upsert_users(db_session, rows):
+    """Write user rows with a batched INSERT ... ON CONFLICT DO UPDATE."""
+    if not rows:
+        return
+    # Executing with a parameter list lets SQLAlchemy batch the rows into
+    # multi-row VALUES statements with a cached compiled form
+    stmt = pg_insert(User)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[User.id],
+        set_={
+            'name': stmt.excluded.name,
+            'roles': stmt.excluded.roles,
+            'role_list': stmt.excluded.role_list,
+            'status': stmt.excluded.status,
+            'portal': stmt.excluded.portal,
+            'spec_fingerprint': stmt.excluded.spec_fingerprint
+        }
+    )
+    db_session.execute(stmt, rows)
+
+def apply_portal_users(db_session, client, users_data, batch_size=None, on_batch=None):
+    """Write the Teleport users of one portal to the database session.
+
+    users_data can be any iterable of tctl user resources, including a lazy
+    stream; it is consumed in batches of batch_size so memory stays bounded by
+    the batch and the existing-user index rather than the whole payload.
+
+    Only new users and users whose fingerprint changed are written, with one
+    INSERT ... ON CONFLICT DO UPDATE per batch, so an identical snapshot results
+    in no writes at all. Legacy ids are fixed up with one UPDATE. Does not
+    commit; the caller owns the transaction.
+
+    Args:
+        on_batch: Optional callable invoked with the number of users processed so far.
+
+    Returns:
+        Dictionary with user counts, the list of orphaned users and per-phase timings.
+    """
+    batch_size = batch_size or SYNC_BATCH_SIZE
+    apply_started = time.monotonic()
+    timings = {'load_index': 0.0, 'lookup': 0.0, 'upsert': 0.0, 'legacy_fixups': 0.0}
+
+    # Index the portal's existing users by id, and by name for legacy rows whose id predates the current format
+    started = time.monotonic()
+    existing_rows = db_session.execute(
+        select(User.id, User.name, User.spec_fingerprint).where(User.portal == client)
+    ).all()
+    fingerprints_by_id = {row.id: row.spec_fingerprint for row in existing_rows}
+    portal_ids_by_name = {}
+    for row in existing_rows:
+        portal_ids_by_name.setdefault(row.name, row.id)
+    sync_state = db_session.get(PortalSyncState, client)
+    timings['load_index'] = _elapsed_ms(started)
+
+    snapshot = SnapshotHash()
+    seen_names = set()
+    counts = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+    id_fixups = []
+    legacy_rows = []
+
+    for batch in iter_batches(_iter_user_rows(client, users_data), batch_size):
+        # Look up ids that are not in this portal's index, e.g. rows with no portal set
+        started = time.monotonic()
+        unknown_ids = [row['id'] for row in batch if row['id'] not in fingerprints_by_id]
+        if unknown_ids:
+            for row in db_session.execute(
+                select(User.id, User.spec_fingerprint).where(User.id.in_(unknown_ids))
+            ):
+                fingerprints_by_id[row.id] = row.spec_fingerprint
+        timings['lookup'] += _elapsed_ms(started)
+
+        rows_to_write = []
+        for row in batch:
+            if row['name'] in seen_names:
+                continue
+            seen_names.add(row['name'])
+            snapshot.add(row['spec_fingerprint'])
+
+            user_id = row['id']
+            if user_id not in fingerprints_by_id:
+                legacy_id = portal_ids_by_name.get(row['name'])
+                if legacy_id is not None and legacy_id != user_id:
+                    # Rename the legacy row once all batches are in, then write it
+                    id_fixups.append((legacy_id, user_id))
+                    legacy_rows.append(row)
+                    continue
+                counts['inserted'] += 1
+                rows_to_write.append(row)
+            elif fingerprints_by_id[user_id] != row['spec_fingerprint']:
+                counts['updated'] += 1
+                rows_to_write.append(row)
+            else:
+                counts['unchanged'] += 1
+
+        started = time.monotonic()
+        _upsert_users(db_session, rows_to_write)
+        timings['upsert'] += _elapsed_ms(started)
+
+        if on_batch:
+            on_batch(snapshot.count)
+
+    # Rewrite legacy ids in one statement, then write the rows that changed
+    if id_fixups:
+        started = time.monotonic()
+        fixups = values(
+            column('old_id', String), column('new_id', String), name='id_fixups'
+        ).data(id_fixups)
+        db_session.execute(
+            update(User)
+            .where(User.id == fixups.c.old_id)
+            .values(id=fixups.c.new_id)
+            .execution_options(synchronize_session=False)
+        )
+        changed_legacy_rows = [
+            row for (legacy_id, _), row in zip(id_fixups, legacy_rows)
+            if fingerprints_by_id.get(legacy_id) != row['spec_fingerprint']
+        ]
+        for offset in range(0, len(changed_legacy_rows), batch_size):
+            _upsert_users(db_session, changed_legacy_rows[offset:offset + batch_size])
+        counts['updated'] += len(changed_legacy_rows)
+        counts['unchanged'] += len(legacy_rows) - len(changed_legacy_rows)
+        timings['legacy_fixups'] = _elapsed_ms(started)
+
+    # Remember the snapshot; an identical one needs no write
+    incoming_hash = snapshot.hexdigest()
+    snapshot_unchanged = sync_state is not None and sync_state.snapshot_hash == incoming_hash
+    if not snapshot_unchanged:
+        stmt = pg_insert(PortalSyncState).values(
+            portal=client, snapshot_hash=incoming_hash,
+            user_count=snapshot.count, synced_at=datetime.utcnow()
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[PortalSyncState.portal],
+            set_={
+                'snapshot_hash': stmt.excluded.snapshot_hash,
+                'user_count': stmt.excluded.user_count,
+                'synced_at': stmt.excluded.synced_at
+            }
+        )
+        db_session.execute(stmt)
+
+    # Identify orphaned users (in DB but not in portal)
+    orphaned_ids = [row.id for row in existing_rows if row.name not in seen_names]
+    orphaned_users = []
+    if orphaned_ids:
+        orphaned_users = [
+            user_to_dict(user) for user in
+            db_session.query(User).filter(User.id.in_(orphaned_ids)).all()
+        ]
+
+    # Whatever was not spent in the database was spent receiving and parsing users
+    timings['fetch_and_parse'] = max(0.0, round(_elapsed_ms(apply_started) - sum(timings.values()), 1))
+
+    return {
+        'processed': snapshot.count,
+        'snapshot_unchanged': snapshot_unchanged,
+        'inserted': counts['inserted'],
+        'updated': counts['updated'],
+        'unchanged': counts['unchanged'],
+        'orphaned': len(orphaned_users),
+        'id_fixups': len(id_fixups),
+        'orphaned_users': orphaned_users,
+        'timings_ms': {phase: round(ms, 1) for phase, ms in timings.items()}
+    }
+
+def sync_portal(client, timeout=None, progress=None):
+    """Stream the users of one portal over SSH and apply them in their own transaction.
+
+    The tctl JSON output is parsed incrementally and applied in batches, so
+    memory use does not grow with the size of the portal. The transaction is
+    only committed once the command has finished successfully.
+
+    Args:
+        client: Portal name, must be a key in SSH_HOSTS.
+        timeout: Optional limit in seconds for fetching and applying the portal's
+            users, measured in wall-clock time rather than per read.
+        progress: Optional callable invoked as progress(phase, processed) when
+            the sync enters a new phase or finishes a batch.
+
+    Returns:
+        Dictionary with success status, message, counts, orphaned users and duration.
+    """
+    started = time.monotonic()
+    result = {'portal': client, 'success': False}
+    report = progress or (lambda phase, processed=0: None)
+
+    report('fetching')
+    chunks = stream_ssh_command(client, FETCH_USERS_COMMAND, total_timeout=timeout)
+    db_session = get_db_session()
+    try:
+        counts = apply_portal_users(
+            db_session, client, iter_json_array(chunks),
+            on_batch=lambda processed: report('applying', processed)
+        )
+        timings = counts.pop('timings_ms')
+
+        report('committing', counts['processed'])
+        phase_started = time.monotonic()
+        db_session.commit()
+        timings['commit'] = _elapsed_ms(phase_started)
+
+        result.update(counts)
+        result['timings_ms'] = timings
+        result['success'] = True
+        if counts['snapshot_unchanged']:
+            result['message'] = f"No changes in {client} portal since the last sync ({counts['processed']} users)."
+        else:
+            result['message'] = (
+                f"Successfully processed {counts['processed']} users from {client} portal. "
+                f"Added {counts['inserted']} new users, updated {counts['updated']} and left "
+                f"{counts['unchanged']} unchanged."
+            )
+    except SSHCommandError as e:
+        db_session.rollback()
+        result['message'] = f"Error executing command: {e}"
+    except json.JSONDecodeError:
+        db_session.rollback()
+        result['message'] = "Error parsing JSON output from SSH command"
+    except Exception as e:
+        db_session.rollback()
+        logging.error(f"Error processing users for portal {client}: {str(e)}")
+        result['message'] = f"Error processing users: {str(e)}"
+    finally:
+        chunks.close()
+        db_session.close()
+
+    result['duration_ms'] = _elapsed_ms(started)
+    SYNC_DURATION.labels(client, 'success' if result['success'] else 'failure').observe(
+        time.monotonic() - started
+    )
+    if result['success']:
+        for change in ('inserted', 'updated', 'unchanged', 'orphaned'):
+            SYNC_USERS.labels(client, change).inc(result.get(change, 0))
+    return result
@@ -1,40 +1,356 @@
 
+import re
+import time
+import threading
 import psycopg2
 import psycopg2.extras
+import psycopg2.pool
 import logging
-from config import DB_CONFIG
-from sqlalchemy import create_engine
+import atexit
+from contextlib import contextmanager
+from config import (
+    DB_CONFIG, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+    DB_POOL_PRE_PING, DB_POOL_RECYCLE, DB_RAW_POOL_SIZE,
+    DB_REPLICA_URLS, DB_REPLICA_MAX_LAG, DB_REPLICA_LAG_CHECK_INTERVAL, DB_READ_YOUR_WRITES_SECONDS
+)
+from flask import g, request, has_request_context
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.pool import QueuePool
+from utils.metrics import DB_POOL_CHECKOUT_WAIT, DB_POOL_CHECKOUT_TIMEOUTS
+
+class PoolWaitStats:
+    """Thread-safe counters for how long callers waited to check out a connection."""
+
+    def __init__(self, name='primary'):
+        self.name = name
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.last_wait_seconds = None
+
+    def record(self, waited, timed_out=False):
+        if timed_out:
+            DB_POOL_CHECKOUT_TIMEOUTS.labels(self.name).inc()
+        else:
+            DB_POOL_CHECKOUT_WAIT.labels(self.name).observe(waited)
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.total_wait_seconds += waited
+            self.last_wait_seconds = waited
+            if waited > self.max_wait_seconds:
+                self.max_wait_seconds = waited
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'last_wait_seconds': self.last_wait_seconds,
+                'max_wait_seconds': self.max_wait_seconds,
+                'avg_wait_seconds': self.total_wait_seconds / self.checkouts if self.checkouts else None
+            }
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_stats = PoolWaitStats()
+
+    def _do_get(self):
+        started = time.monotonic()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.wait_stats.record(time.monotonic() - started, timed_out=True)
+            raise
+        self.wait_stats.record(time.monotonic() - started)
+        return connection
+
+    def recreate(self):
+        # Keep the counters when the engine replaces the pool after a disconnect
+        pool = super().recreate()
+        pool.wait_stats = self.wait_stats
+        return pool
+
+def database_url():
+    """Return the SQLAlchemy URL for DB_CONFIG, with credentials escaped."""
+    return URL.create(
+        'postgresql',
+        username=DB_CONFIG['user'],
+        password=DB_CONFIG['password'],
+        host=DB_CONFIG['host'],
+        port=DB_CONFIG['port'],
+        database=DB_CONFIG['database']
+    )
 
 # Create SQLAlchemy engine for ORM operations
-def create_sqlalchemy_engine():
-    """Create and return a SQLAlchemy engine."""
+def create_sqlalchemy_engine(url=None, name='primary'):
+    """Create and return a SQLAlchemy engine using the configured pool settings.
+
+    Args:
+        url: Database URL; defaults to the primary described by DB_CONFIG.
+        name: Pool name used in metrics.
+    """
     try:
-        connection_string = f"postgresql://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}/{DB_CONFIG['database']}"
-        engine = create_engine(connection_string)
+        engine = create_engine(
+            url or database_url(),
+            poolclass=TimedQueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_pre_ping=DB_POOL_PRE_PING,
+            pool_recycle=DB_POOL_RECYCLE
+        )
+        engine.pool.wait_stats.name = name
         return engine
     except Exception as e:
-        logging.error(f"Database engine creation error: {e}")
+        logging.error("Database engine creation error: %s", e)
         raise
 
-# Create session factory
-engine = create_sqlalchemy_engine()
-SessionFactory = sessionmaker(bind=engine)
+# Create session factory; it is bound to the engine when the engine is created
+SessionFactory = sessionmaker()
 Session = scoped_session(SessionFactory)
 
+_engine = None
+_init_lock = threading.Lock()
+_engine_events = {'invalidated': 0}
+
+def _count_invalidated(dbapi_connection, connection_record, exception):
+    _engine_events['invalidated'] += 1
+
+# Statements that cannot modify data; anything else marks the request as a writer
+_READ_STATEMENT = re.compile(r'\s*(SELECT|SHOW|EXPLAIN)\b', re.IGNORECASE)
+
+def _track_writes(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and not _READ_STATEMENT.match(statement):
+        g.db_wrote = True
+
+def get_engine():
+    """Return the primary engine, creating it on first use.
+
+    Nothing is created at import time, so processes that never touch the
+    database (or not yet) do not pay for it.
+    """
+    global _engine
+    if _engine is None:
+        with _init_lock:
+            if _engine is None:
+                engine = create_sqlalchemy_engine()
+                event.listen(engine, 'invalidate', _count_invalidated)
+                event.listen(engine, 'before_cursor_execute', _track_writes)
+                SessionFactory.configure(bind=engine)
+                _engine = engine
+    return _engine
+
 def get_db_session():
     """Create and return a database session using SQLAlchemy."""
     try:
+        get_engine()
         return Session()
     except Exception as e:
-        logging.error(f"Database session error: {e}")
+        logging.error("Database session error: %s", e)
         raise
 
-def get_db_connection():
-    """Create and return a database connection using psycopg2 (for raw SQL operations)."""
+# Replication lag in seconds. A replica that is streaming from the primary and
+# has replayed everything it received is caught up, so an idle primary does not
+# make it look stale. Otherwise the lag is the age of the last replayed
+# transaction: a replica that lost its primary also has nothing left to replay,
+# and only this bounds how stale it may get. pg_stat_wal_receiver shows the
+# status only to roles with pg_read_all_stats; without it every replica is
+# judged by the replay age.
+_REPLICA_LAG_SQL = text(
+    "SELECT CASE "
+    "WHEN NOT pg_is_in_recovery() THEN 0 "
+    "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() "
+    "AND EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+class ReplicaRouter:
+    """Picks a read replica for read-only sessions.
+
+    Replicas are used round robin. Each replica's lag is measured at most every
+    `check_interval` seconds, by one thread at a time while the others use the
+    previous result; one that is unreachable or more than `max_lag` seconds
+    behind is skipped until it catches up.
+    """
+
+    def __init__(self, urls, max_lag=10, check_interval=5):
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._next = 0
+        self._replicas = []
+        for url in urls:
+            url = make_url(url)
+            name = f"{url.host}:{url.port or 5432}/{url.database}"
+            self._replicas.append({
+                'name': name,
+                'engine': create_sqlalchemy_engine(url, name=name),
+                'lag_seconds': None,
+                'checked_at': None,
+                'last_error': None,
+                'reads': 0,
+                'probe_lock': threading.Lock()
+            })
+        self._stats = {'replica_reads': 0, 'primary_reads': 0, 'forced_primary': 0, 'lag_fallbacks': 0}
+
+    def _usable(self, replica):
+        """Return True if the replica's (possibly cached) lag is within max_lag."""
+        if self._probe_due(replica) and replica['probe_lock'].acquire(blocking=False):
+            try:
+                # Another thread may have probed between the check and the lock
+                if self._probe_due(replica):
+                    self._probe(replica)
+            finally:
+                replica['probe_lock'].release()
+        lag = replica['lag_seconds']
+        return lag is not None and lag <= self.max_lag
+
+    def _probe_due(self, replica):
+        checked_at = replica['checked_at']
+        return checked_at is None or time.monotonic() - checked_at >= self.check_interval
+
+    def _probe(self, replica):
+        """Measure the replica's lag; the caller holds its probe lock."""
+        try:
+            with replica['engine'].connect() as connection:
+                lag = connection.execute(_REPLICA_LAG_SQL).scalar()
+            replica['lag_seconds'] = float(lag) if lag is not None else None
+            replica['last_error'] = None
+            if lag is not None and lag > self.max_lag:
+                logging.warning("Read replica %s is %.1fs behind, skipping it", replica['name'], lag)
+        except Exception as e:
+            replica['lag_seconds'] = None
+            replica['last_error'] = str(e)
+            logging.warning("Read replica %s unavailable: %s", replica['name'], e)
+        finally:
+            replica['checked_at'] = time.monotonic()
+
+    def choose(self):
+        """Return the next usable replica, or None if all are lagging or down."""
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % len(self._replicas)
+        for offset in range(len(self._replicas)):
+            replica = self._replicas[(start + offset) % len(self._replicas)]
+            if self._usable(replica):
+                with self._lock:
+                    replica['reads'] += 1
+                    self._stats['replica_reads'] += 1
+                return replica
+        with self._lock:
+            self._stats['lag_fallbacks'] += 1
+            self._stats['primary_reads'] += 1
+        return None
+
+    def record_forced_primary(self):
+        with self._lock:
+            self._stats['forced_primary'] += 1
+            self._stats['primary_reads'] += 1
+
+    def stats(self):
+        """Return routing counters and per-replica lag and pool statistics."""
+        with self._lock:
+            replicas = {}
+            for replica in self._replicas:
+                pool = replica['engine'].pool
+                replicas[replica['name']] = {
+                    'lag_seconds': replica['lag_seconds'],
+                    'last_error': replica['last_error'],
+                    'reads': replica['reads'],
+                    'checked_out': pool.checkedout(),
+                    'checked_in': pool.checkedin(),
+                    **pool.wait_stats.snapshot()
+                }
+            return dict(self._stats, max_lag_seconds=self.max_lag, replicas=replicas)
+
+_replica_router = None
+
+def get_replica_router():
+    """Return the replica router, creating it on first use, or None without replicas."""
+    global _replica_router
+    if _replica_router is None and DB_REPLICA_URLS:
+        with _init_lock:
+            if _replica_router is None:
+                _replica_router = ReplicaRouter(
+                    DB_REPLICA_URLS,
+                    max_lag=DB_REPLICA_MAX_LAG,
+                    check_interval=DB_REPLICA_LAG_CHECK_INTERVAL
+                )
+    return _replica_router
+
+ReadSessionFactory = sessionmaker()
+
+# A client can ask for primary reads explicitly with this header; after a
+# request writes, the cookie keeps its follow-up reads on the primary
+PRIMARY_READ_HEADER = 'X-Read-Primary'
+PRIMARY_READ_COOKIE = 'db_primary_until'
+
+def _primary_read_required():
+    """Return True if the current request must read its own (or recent) writes."""
+    if not has_request_context():
+        return False
+    if g.get('db_wrote'):
+        return True
+    if request.headers.get(PRIMARY_READ_HEADER, '').lower() in ('1', 'true', 'yes'):
+        return True
+    try:
+        return float(request.cookies.get(PRIMARY_READ_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+def get_read_session():
+    """Return a session for read-only route handlers.
+
+    The session is bound to a read replica when one is configured and within
+    DB_REPLICA_MAX_LAG, and to the primary otherwise or when the request has
+    to see recent writes. Never write through it.
+    """
+    replica_router = get_replica_router()
+    if replica_router is None:
+        return get_db_session()
+    if _primary_read_required():
+        replica_router.record_forced_primary()
+        return get_db_session()
+    replica = replica_router.choose()
+    if replica is None:
+        return get_db_session()
+    session = ReadSessionFactory(bind=replica['engine'])
+    session.info['replica'] = replica['name']
+    return session
+
+def remember_primary_reads(response):
+    """after_request hook: keep a client on the primary for a while after it writes."""
+    if DB_REPLICA_URLS and DB_READ_YOUR_WRITES_SECONDS > 0 and g.get('db_wrote'):
+        response.set_cookie(
+            PRIMARY_READ_COOKIE,
+            str(time.time() + DB_READ_YOUR_WRITES_SECONDS),
+            max_age=DB_READ_YOUR_WRITES_SECONDS,
+            httponly=True,
+            samesite='Lax'
+        )
+    return response
+
+def create_db_connection():
+    """Open a new, unpooled psycopg2 connection.
+
+    Use this for connections held for the life of a thread (e.g. LISTEN);
+    the caller closes it.
+    """
     try:
         conn = psycopg2.connect(
             host=DB_CONFIG['host'],
+            port=DB_CONFIG['port'],
             database=DB_CONFIG['database'],
             user=DB_CONFIG['user'],
             password=DB_CONFIG['password']
@@ -42,5 +358,189 @@ def get_db_connection():
         conn.autocommit = True
         return conn
     except Exception as e:
-        logging.error(f"Database connection error: {e}")
+        logging.error("Database connection error: %s", e)
+        raise
+
+class RawConnectionPool:
+    """Thread-safe pool of autocommit psycopg2 connections for raw SQL.
+
+    Connections are opened on demand up to `size`; callers beyond that wait up
+    to `timeout` for one to be returned. Idle connections are pinged on
+    checkout and replaced once older than `recycle` seconds.
+    """
+
+    def __init__(self, size, timeout=30, pre_ping=True, recycle=-1):
+        self.size = size
+        self.timeout = timeout
+        self.pre_ping = pre_ping
+        self.recycle = recycle
+        self.wait_stats = PoolWaitStats('raw')
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._idle = []
+        self._created = {}
+        self._in_use = 0
+        self._opened = 0
+        self._discarded = 0
+
+    def _usable(self, conn):
+        """Return False for connections that are closed, too old or fail a ping."""
+        if conn.closed:
+            return False
+        created = self._created.get(id(conn))
+        if self.recycle >= 0 and created is not None and time.monotonic() - created > self.recycle:
+            return False
+        if self.pre_ping:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+            except psycopg2.Error:
+                return False
+        return True
+
+    def _close(self, conn):
+        with self._lock:
+            self._created.pop(id(conn), None)
+            self._discarded += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def getconn(self):
+        """Check out a connection, waiting up to the pool timeout for a free one.
+
+        Raises:
+            psycopg2.pool.PoolError: If no connection was freed in time.
+        """
+        started = time.monotonic()
+        if not self._slots.acquire(timeout=self.timeout):
+            self.wait_stats.record(time.monotonic() - started, timed_out=True)
+            raise psycopg2.pool.PoolError(f"No database connection available after {self.timeout}s")
+        try:
+            conn = None
+            while conn is None:
+                with self._lock:
+                    idle = self._idle.pop() if self._idle else None
+                if idle is None:
+                    conn = create_db_connection()
+                    with self._lock:
+                        self._created[id(conn)] = time.monotonic()
+                        self._opened += 1
+                elif self._usable(idle):
+                    conn = idle
+                else:
+                    self._close(idle)
+        except Exception:
+            self._slots.release()
+            raise
+        self.wait_stats.record(time.monotonic() - started)
+        with self._lock:
+            self._in_use += 1
+        return conn
+
+    def putconn(self, conn, close=False):
+        """Return a connection, closing it if it is broken or close is set."""
+        try:
+            if close or conn.closed or conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                self._close(conn)
+            else:
+                with self._lock:
+                    self._idle.append(conn)
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    def close_all(self):
+        """Close every idle connection."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._close(conn)
+
+    def stats(self):
+        """Return utilisation and checkout wait statistics."""
+        with self._lock:
+            stats = {
+                'size': self.size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'opened': self._opened,
+                'discarded': self._discarded,
+                'utilisation': self._in_use / self.size if self.size else None
+            }
+        stats.update(self.wait_stats.snapshot())
+        return stats
+
+# Shared pool for raw SQL, one per process
+raw_pool = RawConnectionPool(
+    DB_RAW_POOL_SIZE,
+    timeout=DB_POOL_TIMEOUT,
+    pre_ping=DB_POOL_PRE_PING,
+    recycle=DB_POOL_RECYCLE
+)
+atexit.register(raw_pool.close_all)
+
+def get_db_connection():
+    """Check out a pooled psycopg2 connection (for raw SQL operations).
+
+    Return it with release_db_connection(), or use db_connection() instead.
+    """
+    try:
+        return raw_pool.getconn()
+    except Exception as e:
+        logging.error("Database connection error: %s", e)
+        raise
+
+def release_db_connection(conn, close=False):
+    """Return a connection from get_db_connection() to the pool."""
+    raw_pool.putconn(conn, close=close)
+
+@contextmanager
+def db_connection():
+    """Context manager that checks out a pooled connection and always returns it."""
+    conn = get_db_connection()
+    try:
+        yield conn
+    except psycopg2.Error:
+        # The connection may be broken; do not hand it to the next caller
+        release_db_connection(conn, close=True)
+        raise
+    except Exception:
+        release_db_connection(conn)
         raise
+    else:
+        release_db_connection(conn)
+
+def get_db_pool_stats():
+    """Return utilisation and checkout wait statistics for both pools.
+
+    The engine section is None until something has used the database; asking
+    for statistics does not create the engine.
+    """
+    if _engine is None:
+        return {
+            'engine': None,
+            'raw': raw_pool.stats(),
+            'replicas': _replica_router.stats() if _replica_router is not None else None
+        }
+    pool = _engine.pool
+    # max_overflow of -1 means no limit, so utilisation is undefined
+    capacity = pool.size() + DB_MAX_OVERFLOW if DB_MAX_OVERFLOW >= 0 else 0
+    checked_out = pool.checkedout()
+    engine_stats = {
+        'size': pool.size(),
+        'max_overflow': DB_MAX_OVERFLOW,
+        'checked_out': checked_out,
+        'checked_in': pool.checkedin(),
+        'overflow': max(0, pool.overflow()),
+        'utilisation': checked_out / capacity if capacity > 0 else None,
+        'invalidated': _engine_events['invalidated']
+    }
+    engine_stats.update(pool.wait_stats.snapshot())
+    return {
+        'engine': engine_stats,
+        'raw': raw_pool.stats(),
+        'replicas': _replica_router.stats() if _replica_router is not None else None
+    }
@@ -0,0 +1,111 @@
+import json
+import codecs
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+
+def iter_json_array(chunks):
+    """Incrementally parse a top-level JSON array from an iterable of chunks.
+
+    Yields each element as soon as it has been fully received, so only the
+    element being parsed (plus one chunk) is held in memory rather than the
+    whole document.
+
+    Args:
+        chunks: Iterable of bytes or str fragments of a JSON array.
+
+    Raises:
+        json.JSONDecodeError: If the input is not a well-formed JSON array.
+    """
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    chunks = iter(chunks)
+    buffer = ''
+    pos = 0
+    exhausted = False
+    # start: expect '[', first: value or ']', value: value, separator: ',' or ']'
+    state = 'start'
+
+    def more():
+        """Append the next chunk, dropping the consumed prefix. Returns False at EOF."""
+        nonlocal buffer, pos, exhausted
+        if exhausted:
+            return False
+        try:
+            chunk = next(chunks)
+            if isinstance(chunk, bytes):
+                chunk = utf8.decode(chunk)
+        except StopIteration:
+            exhausted = True
+            chunk = utf8.decode(b'', final=True)
+            if not chunk:
+                return False
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        return True
+
+    while True:
+        while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+            pos += 1
+        if pos == len(buffer):
+            if not more():
+                raise json.JSONDecodeError(
+                    "Expecting '['" if state == 'start' else "Unterminated array", buffer, pos
+                )
+            continue
+
+        char = buffer[pos]
+        if state == 'start':
+            if char != '[':
+                raise json.JSONDecodeError("Expecting '['", buffer, pos)
+            state = 'first'
+            pos += 1
+            continue
+
+        if state in ('first', 'separator') and char == ']':
+            # Drain the rest of the input so the producer can finish (and report errors)
+            pos += 1
+            while True:
+                if buffer[pos:].strip(_WHITESPACE):
+                    raise json.JSONDecodeError("Extra data", buffer, pos)
+                pos = len(buffer)
+                if not more():
+                    return
+
+        if state == 'separator':
+            if char != ',':
+                raise json.JSONDecodeError("Expecting ',' delimiter", buffer, pos)
+            state = 'value'
+            pos += 1
+            continue
+
+        try:
+            value, end = _decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # Most likely the element continues in the next chunk
+            if not more():
+                raise
+            continue
+
+        if not isinstance(value, (dict, list, str)):
+            # A number such as 12 or 1.5e3 may continue in the next chunk, so only
+            # accept it once the following delimiter has been received
+            next_pos = end
+            while next_pos < len(buffer) and buffer[next_pos] in _WHITESPACE:
+                next_pos += 1
+            if (next_pos == len(buffer) or buffer[next_pos] not in ',]') and more():
+                continue
+
+        yield value
+        pos = end
+        state = 'separator'
+
+def iter_batches(iterable, size):
+    """Group an iterable into lists of at most size items."""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
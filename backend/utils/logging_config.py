@@ -1,18 +1,128 @@
 
+import os
+import copy
+import json
+import queue
+import atexit
 import logging
+import threading
+import logging.handlers
+from datetime import datetime, timezone
+from utils.tracing import TraceIdFilter
+from utils.metrics import LOG_RECORDS_DROPPED
+from config import (
+    LOG_LEVEL, LOG_LEVELS, LOG_FILE, LOG_FORMAT, LOG_MAX_BYTES,
+    LOG_BACKUP_COUNT, LOG_ROTATE_WHEN, LOG_QUEUE_SIZE
+)
 
-def setup_logging():
-    """Configure application logging."""
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s [%(levelname)s] %(message)s',
-        handlers=[
-            logging.StreamHandler(),
-            logging.FileHandler('app.log')
-        ]
+TEXT_FORMAT = '%(asctime)s [%(levelname)s] [%(trace_id)s] %(name)s: %(message)s'
+
+class JsonFormatter(logging.Formatter):
+    """Formats each record as one JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'trace_id': getattr(record, 'trace_id', None),
+            'message': record.getMessage()
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+def _file_handler():
+    """Return a rotating handler for LOG_FILE, by time if LOG_ROTATE_WHEN is set, else by size.
+
+    Rotation is per process; with several gunicorn workers put {pid} in
+    LOG_FILE so each worker rotates its own file.
+    """
+    path = LOG_FILE.format(pid=os.getpid())
+    if LOG_ROTATE_WHEN:
+        return logging.handlers.TimedRotatingFileHandler(
+            path, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT
+        )
+    return logging.handlers.RotatingFileHandler(
+        path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT
     )
-    
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full.
+
+    Drops are counted in `dropped` and in log_records_dropped_total, since
+    they cannot be logged.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self._dropped_lock = threading.Lock()
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Merge the arguments now, in case they change before the listener runs,
+        # but keep exc_info so each formatter renders the traceback itself
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+            LOG_RECORDS_DROPPED.inc()
+
+_listener = None
+_queue_handler = None
+
+def get_logging_stats():
+    """Return the log queue's size, backlog and dropped record count."""
+    if _queue_handler is None:
+        return {'queue_size': LOG_QUEUE_SIZE, 'queued': 0, 'dropped': 0}
+    return {
+        'queue_size': LOG_QUEUE_SIZE,
+        'queued': _queue_handler.queue.qsize(),
+        'dropped': _queue_handler.dropped
+    }
+
+def setup_logging():
+    """Configure application logging.
+
+    Log calls only put the record on a queue; a background listener thread
+    formats it and does the file and console I/O, so a slow disk does not
+    stall request threads.
+    """
+    global _listener, _queue_handler
+    if _listener is not None:
+        return logging
+
+    formatter = JsonFormatter() if LOG_FORMAT == 'json' else logging.Formatter(TEXT_FORMAT)
+    handlers = [logging.StreamHandler(), _file_handler()]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    # Bounded so a stalled disk cannot grow memory without limit; see _DroppingQueueHandler
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    queue_handler = _DroppingQueueHandler(log_queue)
+    # The trace id lives in the calling thread, so add it before the record is queued
+    queue_handler.addFilter(TraceIdFilter())
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    _queue_handler = queue_handler
+    root.setLevel(LOG_LEVEL)
+    for name, level in LOG_LEVELS.items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    # Flush what is still queued on exit
+    atexit.register(_listener.stop)
+
     # Log that logging has been configured
     logging.info("Logging configured.")
-    
+
     return logging
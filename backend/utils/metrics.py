@@ -0,0 +1,153 @@
+import os
+import time
+import logging
+import threading
+from flask import g, request
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, REGISTRY,
+    CONTENT_TYPE_LATEST, generate_latest, multiprocess
+)
+from config import METRICS_SAMPLE_INTERVAL, SSH_HOSTS
+
+# With several gunicorn workers, PROMETHEUS_MULTIPROC_DIR must point at a
+# directory shared by the workers (emptied on startup, see run.sh). Each worker
+# then writes its samples there and /metrics aggregates all of them, whichever
+# worker serves the scrape.
+MULTIPROCESS = bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+
+# Buckets in seconds, from fast queries up to long SSH commands and syncs
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+HTTP_REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'HTTP request latency',
+    ['method', 'endpoint', 'status'], buckets=_LATENCY_BUCKETS
+)
+
+SSH_CONNECT_DURATION = Histogram(
+    'ssh_connect_duration_seconds', 'Time to open an SSH connection to a portal',
+    ['portal'], buckets=_LATENCY_BUCKETS
+)
+SSH_COMMAND_DURATION = Histogram(
+    'ssh_command_duration_seconds', 'SSH command latency, including channel setup',
+    ['portal'], buckets=_LATENCY_BUCKETS
+)
+SSH_ERRORS = Counter(
+    'ssh_errors_total', 'SSH errors by category (connect, timeout, connection, permission, command)',
+    ['portal', 'category']
+)
+
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    'db_pool_checkout_wait_seconds', 'Time spent waiting for a pooled database connection',
+    ['pool'], buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30)
+)
+DB_POOL_CHECKOUT_TIMEOUTS = Counter(
+    'db_pool_checkout_timeouts_total', 'Checkouts that gave up waiting for a connection', ['pool']
+)
+DB_POOL_CONNECTIONS = Gauge(
+    'db_pool_connections', 'Pooled database connections by state, summed over live workers',
+    ['pool', 'state'], multiprocess_mode='livesum'
+)
+DB_REPLICA_LAG = Gauge(
+    'db_replica_lag_seconds', 'Last measured replication lag of each read replica',
+    ['replica'], multiprocess_mode='livemax'
+)
+
+SCHEDULER_QUEUE_DEPTH = Gauge(
+    'scheduler_queue_depth', 'Claimed task groups waiting for a worker',
+    ['portal'], multiprocess_mode='livesum'
+)
+SCHEDULER_IN_FLIGHT = Gauge(
+    'scheduler_in_flight', 'Task groups currently executing',
+    ['portal'], multiprocess_mode='livesum'
+)
+SCHEDULER_DISPATCH_LAG = Histogram(
+    'scheduler_dispatch_lag_seconds', 'Delay between a task being due and starting',
+    buckets=(0.1, 0.5, 1, 2, 5, 10, 30, 60, 300, 900)
+)
+SCHEDULER_EXECUTION_DURATION = Histogram(
+    'scheduler_execution_duration_seconds', 'Time to execute one batch of task groups',
+    ['portal'], buckets=_LATENCY_BUCKETS
+)
+
+SYNC_DURATION = Histogram(
+    'sync_duration_seconds', 'Duration of a portal user sync',
+    ['portal', 'outcome'], buckets=_LATENCY_BUCKETS
+)
+SYNC_USERS = Counter(
+    'sync_users_total', 'Users processed by portal syncs, by change', ['portal', 'change']
+)
+
+LOG_RECORDS_DROPPED = Counter(
+    'log_records_dropped_total', 'Log records dropped because the log writer fell behind'
+)
+
+def start_request_timer():
+    """before_request hook: remember when the request started."""
+    g.request_started = time.perf_counter()
+
+def observe_request(response):
+    """after_request hook: record the request's latency under its route endpoint."""
+    started = g.get('request_started')
+    if started is not None:
+        # Unmatched URLs share one label so scanners cannot blow up cardinality
+        endpoint = request.endpoint or 'unmatched'
+        HTTP_REQUEST_DURATION.labels(request.method, endpoint, str(response.status_code)).observe(
+            time.perf_counter() - started
+        )
+    return response
+
+def metrics_response():
+    """Return (body, content_type) for the /metrics endpoint."""
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+def _sample():
+    """Copy the current pool and scheduler state into this worker's gauges."""
+    # Imported here: both modules record into the metrics defined above
+    from utils.db import get_db_pool_stats
+    from scheduler import scheduler
+
+    pools = get_db_pool_stats()
+    engine_stats, raw_stats = pools['engine'], pools['raw']
+    if engine_stats is not None:
+        DB_POOL_CONNECTIONS.labels('primary', 'checked_out').set(engine_stats['checked_out'])
+        DB_POOL_CONNECTIONS.labels('primary', 'idle').set(engine_stats['checked_in'])
+    DB_POOL_CONNECTIONS.labels('raw', 'checked_out').set(raw_stats['in_use'])
+    DB_POOL_CONNECTIONS.labels('raw', 'idle').set(raw_stats['idle'])
+    for name, replica in ((pools['replicas'] or {}).get('replicas') or {}).items():
+        DB_POOL_CONNECTIONS.labels(name, 'checked_out').set(replica['checked_out'])
+        DB_POOL_CONNECTIONS.labels(name, 'idle').set(replica['checked_in'])
+        if replica['lag_seconds'] is not None:
+            DB_REPLICA_LAG.labels(name).set(replica['lag_seconds'])
+
+    # Every configured portal is set, so one whose queue drained reads 0
+    portals = scheduler.stats()['portals']
+    for portal in set(SSH_HOSTS) | set(portals):
+        counts = portals.get(portal, {})
+        SCHEDULER_QUEUE_DEPTH.labels(portal).set(counts.get('queued', 0))
+        SCHEDULER_IN_FLIGHT.labels(portal).set(counts.get('in_flight', 0))
+
+def _sampler_loop(interval):
+    while True:
+        try:
+            _sample()
+        except Exception as e:
+            logging.warning("Error sampling metrics: %s", e)
+        time.sleep(interval)
+
+_sampler = None
+
+def start_metrics_sampler(interval=METRICS_SAMPLE_INTERVAL):
+    """Start the background thread that keeps the pool and scheduler gauges current.
+
+    Gauges are sampled in every worker rather than computed at scrape time,
+    because a scrape is served by a single worker.
+    """
+    global _sampler
+    if _sampler is None:
+        _sampler = threading.Thread(target=_sampler_loop, args=(interval,), name='metrics-sampler', daemon=True)
+        _sampler.start()
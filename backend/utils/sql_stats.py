@@ -0,0 +1,148 @@
+import re
+import time
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from config import SQL_REPEATED_QUERY_THRESHOLD, SQL_REPEATED_QUERY_STRICT
+
+logger = logging.getLogger('sql_stats')
+
+class RepeatedQueryError(RuntimeError):
+    """Raised in strict mode when a request repeats a statement too often."""
+
+class QueryStats:
+    """Statement count, DB time and the slowest statement for one unit of work.
+
+    Recording never raises, since it runs inside SQLAlchemy's cursor events in
+    the middle of the caller's transaction. In strict mode the first repeated
+    statement is kept in `repeated` for the owner to raise once its work is
+    done; otherwise it is logged as a warning.
+    """
+
+    def __init__(self, label, threshold=SQL_REPEATED_QUERY_THRESHOLD, strict=False):
+        self.label = label
+        self.threshold = threshold
+        self.strict = strict
+        self.count = 0
+        self.total_seconds = 0.0
+        self.slowest_seconds = 0.0
+        self.slowest_statement = None
+        self.repeated = None
+        self._shapes = {}
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.total_seconds += seconds
+        if seconds >= self.slowest_seconds:
+            self.slowest_seconds = seconds
+            self.slowest_statement = statement
+
+        shape = statement_shape(statement)
+        repeats = self._shapes.get(shape, 0) + 1
+        self._shapes[shape] = repeats
+        # Report once, when the threshold is first crossed
+        if self.threshold and repeats == self.threshold + 1:
+            message = (
+                f"{self.label} ran the same statement more than {self.threshold} times "
+                f"(likely N+1): {shape[:300]}"
+            )
+            if self.strict:
+                self.repeated = self.repeated or message
+            else:
+                logger.warning(message)
+
+    def server_timing(self):
+        """Return the value for a Server-Timing header."""
+        return (
+            f'db;dur={self.total_seconds * 1000:.1f};desc="{self.count} queries", '
+            f'db-slowest;dur={self.slowest_seconds * 1000:.1f}'
+        )
+
+    def summary(self):
+        """Return a one-line description for debug logs."""
+        text = f"{self.label}: {self.count} queries, {self.total_seconds * 1000:.1f}ms in DB"
+        if self.slowest_statement:
+            slowest = ' '.join(self.slowest_statement.split())[:200]
+            text += f", slowest {self.slowest_seconds * 1000:.1f}ms: {slowest}"
+        return text
+
+# Literals and bind placeholders, so statements differing only in values match
+_IN_LIST = re.compile(r"\(\s*(?:%\(\w+\)s|\?|'[^']*'|\d+)(?:\s*,\s*(?:%\(\w+\)s|\?|'[^']*'|\d+))*\s*\)")
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%\(\w+\)s")
+
+def statement_shape(statement):
+    """Normalise a statement so near-identical ones compare equal."""
+    shape = _IN_LIST.sub('(?)', statement)
+    shape = _LITERAL.sub('?', shape)
+    return ' '.join(shape.split())
+
+_current = ContextVar('sql_query_stats', default=None)
+
+def current_query_stats():
+    """Return the QueryStats being collected in this context, if any."""
+    return _current.get()
+
+@contextmanager
+def track_queries(label):
+    """Collect statistics for the statements run inside the block.
+
+    Used for background work, so repeated statements are only ever logged.
+    Nested blocks collect separately; the outer block does not see their queries.
+    """
+    stats = QueryStats(label)
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+def start_request_tracking():
+    """before_request hook: collect query statistics for this request."""
+    g.query_stats = QueryStats(f"{request.method} {request.path}", strict=SQL_REPEATED_QUERY_STRICT)
+    g.query_stats_token = _current.set(g.query_stats)
+
+def add_server_timing(response):
+    """after_request hook: report the request's query statistics.
+
+    In strict mode a request that repeated a statement fails here with
+    RepeatedQueryError, after its handler finished. Queries run while a
+    streamed body is sent happen after this and are not included.
+    """
+    stats = g.get('query_stats')
+    if stats is not None:
+        response.headers.add('Server-Timing', stats.server_timing())
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(stats.summary())
+        if stats.repeated:
+            # Cleared first, since the 500 response passes through this hook too
+            message, stats.repeated = stats.repeated, None
+            raise RepeatedQueryError(message)
+    return response
+
+def stop_request_tracking(exception=None):
+    """teardown_request hook: stop collecting for this request."""
+    token = g.pop('query_stats_token', None)
+    if token is not None:
+        _current.reset(token)
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    started = conn.info.get('query_started')
+    if stats is not None and started:
+        stats.record(statement, time.perf_counter() - started.pop())
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(exception_context):
+    # after_cursor_execute is not called for a failed statement
+    connection = exception_context.connection
+    if connection is not None and connection.info.get('query_started'):
+        connection.info['query_started'].pop()
@@ -1,52 +1,632 @@
-
-import paramiko
+import socket
 import logging
-from config import SSH_HOSTS, SSH_PORT, SSH_USER, SSH_KEY_PATH
+import threading
+import atexit
+import uuid
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from config import (
+    SSH_HOSTS, SSH_PORT, SSH_USER, SSH_KEY_PATH,
+    SSH_CONNECT_TIMEOUT, SSH_COMMAND_TIMEOUT, SSH_KEEPALIVE_INTERVAL, SSH_STREAM_CHUNK_SIZE,
+    SSH_READ_CACHE_TTL, SSH_READ_CACHE_MAX_ENTRIES
+)
+from utils.metrics import SSH_CONNECT_DURATION, SSH_COMMAND_DURATION, SSH_ERRORS
+from utils.tracing import span, current_span
 
-def execute_ssh_command(client, command):
-    """Execute command via SSH on the specified client."""
-    if client not in SSH_HOSTS:
-        logging.error(f"Client {client} not recognized")
-        return None, f"Client {client} not recognized"
+logger = logging.getLogger(__name__)
 
-    ssh_host = SSH_HOSTS[client]
-    logging.info(f"Attempting to execute command via SSH on {ssh_host}: {command}")
+_paramiko = None
 
-    try:
-        # Establish SSH connection
+def _load_paramiko():
+    """Import paramiko on first use.
+
+    paramiko (and the cryptography stack behind it) is slow to import and only
+    needed once a command is actually run, so web workers and the scheduler
+    start without it.
+    """
+    global _paramiko
+    if _paramiko is None:
+        import paramiko
+        _paramiko = paramiko
+    return _paramiko
+
+def _connection_errors():
+    """Return the exception types that mean the SSH connection itself failed."""
+    return (_load_paramiko().SSHException, EOFError, socket.error)
+
+class SSHConnectionManager:
+    """Keeps one long-lived SSH transport per portal and opens a channel per command."""
+
+    def __init__(self, hosts, port, username, key_path,
+                 connect_timeout=10, command_timeout=120, keepalive_interval=30):
+        self.hosts = hosts
+        self.port = port
+        self.username = username
+        self.key_path = key_path
+        self.connect_timeout = connect_timeout
+        self.command_timeout = command_timeout
+        self.keepalive_interval = keepalive_interval
+
+        self._lock = threading.Lock()
+        self._portal_locks = {}
+        self._clients = {}
+        self._private_key = None
+        self._stats = {}
+
+    def _portal_state(self, portal):
+        """Return the (connect lock, stats) pair for a portal, creating it on first use."""
+        with self._lock:
+            if portal not in self._portal_locks:
+                self._portal_locks[portal] = threading.Lock()
+                self._stats[portal] = {
+                    'connects': 0,
+                    'reconnects': 0,
+                    'commands': 0,
+                    'command_errors': 0,
+                    'in_flight': 0,
+                    'last_connected_at': None,
+                    'last_error': None
+                }
+            return self._portal_locks[portal], self._stats[portal]
+
+    def load_private_key(self):
+        """Load the RSA key once and reuse it for every connection."""
+        if self._private_key is None:
+            self._private_key = _load_paramiko().RSAKey.from_private_key_file(self.key_path)
+        return self._private_key
+
+    def _connect(self, portal):
+        """Open a new SSH connection to the portal and enable keepalives."""
+        ssh_host = self.hosts[portal]
+        paramiko = _load_paramiko()
         ssh_client = paramiko.SSHClient()
         ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        ssh_client.connect(
+            ssh_host,
+            port=self.port,
+            username=self.username,
+            pkey=self.load_private_key(),
+            timeout=self.connect_timeout,
+            banner_timeout=self.connect_timeout,
+            auth_timeout=self.connect_timeout,
+            look_for_keys=False,
+            allow_agent=False
+        )
+        ssh_client.get_transport().set_keepalive(self.keepalive_interval)
+        logger.info("SSH connection established to %s:%s", ssh_host, self.port)
+        return ssh_client
 
-        # Load the private key
+    def _get_transport(self, portal):
+        """Return a live transport for the portal, reconnecting if the old one died."""
+        portal_lock, stats = self._portal_state(portal)
+        with portal_lock:
+            ssh_client = self._clients.get(portal)
+            transport = ssh_client.get_transport() if ssh_client else None
+            if transport is not None and transport.is_active():
+                return transport
+
+            if ssh_client is not None:
+                logger.warning("SSH connection to portal %s is no longer active, reconnecting", portal)
+                ssh_client.close()
+                stats['reconnects'] += 1
+
+            started = time.monotonic()
+            connect_span = current_span()
+            if connect_span is not None:
+                connect_span.set('new_connection', True)
+            try:
+                ssh_client = self._connect(portal)
+            except Exception:
+                SSH_ERRORS.labels(portal, 'connect').inc()
+                raise
+            SSH_CONNECT_DURATION.labels(portal).observe(time.monotonic() - started)
+            self._clients[portal] = ssh_client
+            stats['connects'] += 1
+            stats['last_connected_at'] = datetime.now().isoformat()
+            return ssh_client.get_transport()
+
+    def _drop(self, portal):
+        """Close and forget the portal's connection so the next call reconnects."""
+        portal_lock, _ = self._portal_state(portal)
+        with portal_lock:
+            ssh_client = self._clients.pop(portal, None)
+            if ssh_client is not None:
+                ssh_client.close()
+
+    def _open_channel(self, portal):
+        """Open a session channel, reconnecting once if the pooled transport is dead."""
+        try:
+            return self._get_transport(portal).open_session(timeout=self.connect_timeout)
+        except _connection_errors() as e:
+            # The transport may have died between the liveness check and opening
+            # the channel. Nothing has run remotely yet, so it is safe to retry.
+            logger.warning("SSH channel to portal %s failed (%s), retrying on a new connection", portal, e)
+            self._drop(portal)
+            return self._get_transport(portal).open_session(timeout=self.connect_timeout)
+
+    @contextmanager
+    def _track(self, portal):
+        """Count a command against the portal's stats while it runs."""
+        _, stats = self._portal_state(portal)
+        with self._lock:
+            stats['commands'] += 1
+            stats['in_flight'] += 1
+        started = time.monotonic()
         try:
-            private_key = paramiko.RSAKey.from_private_key_file(SSH_KEY_PATH)
+            yield
         except Exception as e:
-            logging.error(f"Error loading private key: {e}")
-            return None, f"Error loading SSH private key: {e}"
-
-        ssh_client.connect(ssh_host, port=SSH_PORT, username=SSH_USER, pkey=private_key)
-        logging.info(f"SSH connection established to {ssh_host}:{SSH_PORT}")
-
-        # Execute command
-        stdin, stdout, stderr = ssh_client.exec_command(command)
-        output = stdout.read().decode()
-        error = stderr.read().decode()
-
-        ssh_client.close()
-        logging.info("SSH connection closed")
-
-        if error:
-            # Check if the error message contains specific warnings that can be ignored
-            if "A security patch is available for Teleport" in error:
-                logging.info("Ignoring security patch warning: No action needed.")
-            elif "permission denied" in error.lower() or "teleport does not have permission" in error.lower():
-                logging.error(f"Permission error: {error}")
-                return None, f"Permission error executing command. Please ensure the SSH user has the required permissions: {error}"
+            with self._lock:
+                stats['command_errors'] += 1
+                stats['last_error'] = str(e)
+            SSH_ERRORS.labels(portal, 'timeout' if isinstance(e, socket.timeout) else 'connection').inc()
+            raise
+        finally:
+            SSH_COMMAND_DURATION.labels(portal).observe(time.monotonic() - started)
+            with self._lock:
+                stats['in_flight'] -= 1
+
+    def run(self, portal, command, timeout=None):
+        """Run a command on a new channel of the portal's pooled transport.
+
+        Returns:
+            Tuple of (stdout, stderr, exit_status).
+        """
+        with self._track(portal):
+            # Connect covers the handshake when the pooled transport had to be
+            # (re)opened, otherwise just opening the channel
+            with span('ssh.connect', portal=portal):
+                channel = self._open_channel(portal)
+            try:
+                with span('ssh.exec', portal=portal) as exec_span:
+                    channel.settimeout(timeout or self.command_timeout)
+                    channel.exec_command(command)
+                    output = channel.makefile('rb').read().decode()
+                    error = channel.makefile_stderr('rb').read().decode()
+                    exit_status = channel.recv_exit_status()
+                    if exec_span is not None:
+                        exec_span.set('exit_status', exit_status)
+                return output, error, exit_status
+            finally:
+                channel.close()
+
+    def stream(self, portal, command, timeout=None, chunk_size=65536, deadline=None):
+        """Run a command and yield its stdout in chunks as they arrive.
+
+        Generator; its return value (available through ``yield from``) is the
+        tuple (stderr, exit_status). Closing the generator early closes the channel.
+        timeout bounds each read; deadline, a time.monotonic() value, bounds
+        the whole command including the time the caller spends between reads.
+        Both raise socket.timeout.
+        """
+        read_timeout = timeout or self.command_timeout
+        with self._track(portal):
+            with span('ssh.connect', portal=portal):
+                channel = self._open_channel(portal)
+            try:
+                channel.settimeout(read_timeout)
+                channel.exec_command(command)
+                while True:
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise socket.timeout('Command deadline exceeded')
+                        channel.settimeout(min(read_timeout, remaining))
+                    chunk = channel.recv(chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
+                error = channel.makefile_stderr('rb').read().decode()
+                exit_status = channel.recv_exit_status()
+                return error, exit_status
+            finally:
+                channel.close()
+
+    def close_all(self):
+        """Close every pooled connection."""
+        for portal in list(self._clients):
+            self._drop(portal)
+
+    def stats(self):
+        """Return per-portal pool statistics."""
+        with self._lock:
+            portals = {}
+            for portal, stats in self._stats.items():
+                ssh_client = self._clients.get(portal)
+                transport = ssh_client.get_transport() if ssh_client else None
+                portals[portal] = dict(stats, connected=bool(transport and transport.is_active()))
+            return {
+                'configured_portals': list(self.hosts.keys()),
+                'open_connections': sum(1 for p in portals.values() if p['connected']),
+                'portals': portals
+            }
+
+# Create a singleton instance shared by all callers
+ssh_manager = SSHConnectionManager(
+    SSH_HOSTS, SSH_PORT, SSH_USER, SSH_KEY_PATH,
+    connect_timeout=SSH_CONNECT_TIMEOUT,
+    command_timeout=SSH_COMMAND_TIMEOUT,
+    keepalive_interval=SSH_KEEPALIVE_INTERVAL
+)
+atexit.register(ssh_manager.close_all)
+
+class _InFlightRead:
+    """One running read-only command that identical calls wait for."""
+
+    __slots__ = ('done', 'result', 'generation')
+
+    def __init__(self, generation):
+        self.done = threading.Event()
+        self.result = (None, 'Command did not complete')
+        self.generation = generation
+
+class ReadCache:
+    """Shares read-only command results between callers.
+
+    Identical (portal, command) calls made while one is running wait for it
+    instead of opening their own channel, and successful results are reused
+    for `ttl` seconds. A user or role change on a portal drops its cached
+    results, and a read that overlapped one is returned to its callers but
+    not cached.
+    """
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        # (portal, command) -> (expires at, result), least recently used first
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._generations = {}
+        self._stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'invalidations': 0, 'evictions': 0}
+
+    def get_or_run(self, portal, command, run):
+        """Return the cached or in-flight result for the command, otherwise call run()."""
+        key = (portal, command)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return entry[1]
+                del self._entries[key]
+
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self._in_flight[key] = _InFlightRead(self._generations.get(portal, 0))
+                self._stats['misses'] += 1
             else:
-                logging.error(f"Error while executing command: {error}")
-                return None, error
+                self._stats['coalesced'] += 1
+        if not leader:
+            call.done.wait()
+            return call.result
+
+        try:
+            call.result = run()
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+                # Errors are not cached, nor results a concurrent write may have changed
+                if (self.ttl > 0 and call.result[1] is None
+                        and call.generation == self._generations.get(portal, 0)):
+                    self._entries[key] = (time.monotonic() + self.ttl, call.result)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+                        self._stats['evictions'] += 1
+            call.done.set()
+        return call.result
+
+    def invalidate(self, portal):
+        """Drop the portal's cached reads and stop in-flight ones from being cached."""
+        with self._lock:
+            self._generations[portal] = self._generations.get(portal, 0) + 1
+            for key in [key for key in self._entries if key[0] == portal]:
+                del self._entries[key]
+            self._stats['invalidations'] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries), in_flight=len(self._in_flight), ttl=self.ttl)
+
+read_cache = ReadCache(SSH_READ_CACHE_TTL, SSH_READ_CACHE_MAX_ENTRIES)
+
+def get_ssh_pool_stats():
+    """Return statistics for the pooled SSH connections and the read cache."""
+    return dict(ssh_manager.stats(), read_cache=read_cache.stats())
+
+class SSHCommandError(Exception):
+    """Raised by stream_ssh_command when the remote command fails."""
+
+PERMISSION_ERROR = "Permission error executing command"
+CONNECTION_ERROR = "SSH connection error"
+
+# Lower-case fragments of errors caused by the portal or its auth server being
+# unreachable rather than by the command itself
+_TRANSIENT_ERRORS = (
+    CONNECTION_ERROR.lower(),
+    'timed out',
+    'no result returned',
+    'connection refused',
+    'connection reset',
+    'broken pipe',
+    'unexpected eof',
+    'context deadline exceeded',
+    'i/o timeout',
+    'temporarily unavailable',
+    'network is unreachable',
+    'no route to host'
+)
+
+def is_transient_error(error):
+    """Return True if an error from execute_ssh_command is worth retrying.
+
+    Permission errors and command failures (e.g. an unknown role) are final;
+    connection problems and timeouts are transient.
+    """
+    if not error or error.startswith(PERMISSION_ERROR):
+        return False
+    lowered = error.lower()
+    return any(fragment in lowered for fragment in _TRANSIENT_ERRORS)
+
+def _check_client(client):
+    """Return an error message if the client cannot be used, otherwise None."""
+    if client not in SSH_HOSTS:
+        logger.error("Client %s not recognized", client)
+        return f"Client {client} not recognized"
+
+    # Load the private key (cached after the first successful load)
+    try:
+        ssh_manager.load_private_key()
+    except Exception as e:
+        logger.error("Error loading private key: %s", e)
+        return f"Error loading SSH private key: {e}"
+    return None
+
+def _command_error(error):
+    """Return an error message for the command's stderr, or None if it can be ignored."""
+    if not error:
+        return None
+    # Check if the error message contains specific warnings that can be ignored
+    if "A security patch is available for Teleport" in error:
+        logger.debug("Ignoring security patch warning: No action needed.")
+        return None
+    if "permission denied" in error.lower() or "teleport does not have permission" in error.lower():
+        logger.error("Permission error: %s", error)
+        return f"{PERMISSION_ERROR}. Please ensure the SSH user has the required permissions: {error}"
+    logger.error("Error while executing command: %s", error)
+    return error
+
+def _count_command_error(client, error_message):
+    """Count an error reported by the remote command itself."""
+    category = 'permission' if error_message.startswith(PERMISSION_ERROR) else 'command'
+    SSH_ERRORS.labels(client, category).inc()
+
+def execute_ssh_command(client, command, timeout=None, read_only=False, invalidate_reads=False):
+    """Execute command via SSH on the specified client.
+
+    Args:
+        client: Portal name, must be a key in SSH_HOSTS.
+        command: Shell command to run on the portal.
+        timeout: Optional command timeout in seconds, defaults to SSH_COMMAND_TIMEOUT.
+        read_only: The command does not change the portal. Identical concurrent
+            calls then share one execution and the result is cached for
+            SSH_READ_CACHE_TTL seconds.
+        invalidate_reads: The command changes users or roles, so drop the
+            portal's cached reads afterwards. Other writes, such as minting
+            join tokens, leave the cache alone.
+    """
+    if read_only:
+        return read_cache.get_or_run(client, command, lambda: _execute_ssh_command(client, command, timeout))
+    try:
+        return _execute_ssh_command(client, command, timeout)
+    finally:
+        if invalidate_reads:
+            read_cache.invalidate(client)
+
+def _execute_ssh_command(client, command, timeout):
+    client_error = _check_client(client)
+    if client_error:
+        return None, client_error
+
+    ssh_host = SSH_HOSTS[client]
+    # Full commands only at debug level; they can be long and run on every task
+    logger.debug("Executing command via SSH on %s: %s", ssh_host, command)
+
+    try:
+        with span('ssh.command', portal=client, command=command[:200]):
+            output, error, _ = ssh_manager.run(client, command, timeout=timeout)
+
+        error_message = _command_error(error)
+        if error_message:
+            _count_command_error(client, error_message)
+            return None, error_message
 
         return output, None
+    except socket.timeout:
+        logger.error("SSH command timed out on %s", ssh_host)
+        return None, f"Command timed out after {timeout or ssh_manager.command_timeout}s"
+    except _connection_errors() as e:
+        logger.error("SSH exception occurred: %s", e)
+        return None, f"{CONNECTION_ERROR}: {str(e)}"
     except Exception as e:
-        logging.error(f"SSH exception occurred: {str(e)}")
+        logger.error("SSH exception occurred: %s", e)
         return None, str(e)
+
+def stream_ssh_command(client, command, timeout=None, chunk_size=None, total_timeout=None):
+    """Execute command via SSH and yield its stdout in bytes chunks.
+
+    Use this instead of execute_ssh_command for large outputs so they are never
+    held in memory as a single string. Errors are raised as SSHCommandError,
+    including stderr errors, which are only known once all output was read.
+
+    Streams bypass the read cache and its coalescing: sharing one would mean
+    buffering the whole output for every waiter, which is what streaming
+    avoids. The one streamed read, tctl users ls during a sync, is already
+    deduplicated per portal because concurrent syncs attach to the portal's
+    single active sync job.
+
+    Args:
+        client: Portal name, must be a key in SSH_HOSTS.
+        command: Shell command to run on the portal.
+        timeout: Optional timeout in seconds for each read, defaults to SSH_COMMAND_TIMEOUT.
+        chunk_size: Maximum bytes per chunk, defaults to SSH_STREAM_CHUNK_SIZE.
+        total_timeout: Optional wall-clock limit in seconds for the whole command,
+            counted from this call, so output that trickles in cannot run forever.
+    """
+    client_error = _check_client(client)
+    if client_error:
+        raise SSHCommandError(client_error)
+
+    ssh_host = SSH_HOSTS[client]
+    logger.debug("Streaming command via SSH on %s: %s", ssh_host, command)
+
+    deadline = time.monotonic() + total_timeout if total_timeout else None
+    try:
+        error, _ = yield from ssh_manager.stream(
+            client, command, timeout=timeout, chunk_size=chunk_size or SSH_STREAM_CHUNK_SIZE,
+            deadline=deadline
+        )
+    except socket.timeout:
+        logger.error("SSH command timed out on %s", ssh_host)
+        if deadline is not None and time.monotonic() >= deadline:
+            raise SSHCommandError(f"Command did not finish within {total_timeout}s")
+        raise SSHCommandError(f"Command timed out after {timeout or ssh_manager.command_timeout}s")
+    except _connection_errors() as e:
+        logger.error("SSH exception occurred: %s", e)
+        raise SSHCommandError(str(e))
+
+    error_message = _command_error(error)
+    if error_message:
+        _count_command_error(client, error_message)
+        raise SSHCommandError(error_message)
+
+def _batch_script(commands, marker):
+    """Build a remote script that runs each command and frames its output.
+
+    Each command's stdout is written between a begin line and a stderr line,
+    followed by its stderr (captured in a temporary file so the two streams
+    stay apart) and an end line carrying its exit code, so results can be
+    split back per command and judged like a single execute_ssh_command.
+    """
+    lines = [
+        'tuf_err=$(mktemp) || exit 1',
+        'trap \'rm -f "$tuf_err"\' EXIT'
+    ]
+    for index, command in enumerate(commands):
+        lines.append(f"echo '{marker} BEGIN {index}'")
+        # Subshell so an exit in one command does not end the whole script
+        lines.append(f'( {command} ) 2>"$tuf_err"')
+        lines.append('tuf_status=$?')
+        # printf on its own line keeps the markers separate from unterminated output
+        lines.append(f"printf '\\n{marker} STDERR {index}\\n'")
+        lines.append('cat "$tuf_err"')
+        lines.append(f"printf '\\n{marker} END {index} %d\\n' \"$tuf_status\"")
+    return '\n'.join(lines) + '\n'
+
+def _parse_batch_output(output, marker, count):
+    """Split framed batch output into a list of (stdout, stderr, exit_status) per command.
+
+    Commands that produced no end marker (e.g. the script was cut short) get an
+    exit status of None.
+    """
+    results = [(None, None, None)] * count
+    current = None
+    stdout = stderr = buffer = None
+
+    def finish(lines):
+        # Drop the newline the following marker added after the stream's output
+        if lines and lines[-1] == '':
+            lines.pop()
+        return '\n'.join(lines)
+
+    for line in output.splitlines():
+        if line.startswith(f"{marker} BEGIN "):
+            current = int(line.split()[-1])
+            stdout, stderr = [], []
+            buffer = stdout
+        elif line.startswith(f"{marker} STDERR ") and current is not None:
+            buffer = stderr
+        elif line.startswith(f"{marker} END ") and current is not None:
+            _, _, index, exit_status = line.split()
+            results[int(index)] = (finish(stdout), finish(stderr), int(exit_status))
+            current = None
+        elif current is not None:
+            buffer.append(line)
+    return results
+
+def execute_ssh_batch(client, commands, timeout=None, invalidate_reads=False):
+    """Execute several commands in one remote script over a single channel.
+
+    This avoids a channel and remote shell startup per command when many
+    updates go to the same portal. A failing command does not stop the ones
+    after it.
+
+    Args:
+        client: Portal name, must be a key in SSH_HOSTS.
+        commands: List of shell commands to run in order.
+        timeout: Optional timeout in seconds for the whole batch, defaults to
+            SSH_COMMAND_TIMEOUT.
+        invalidate_reads: The commands change users or roles, so drop the
+            portal's cached read-only results afterwards.
+
+    Returns:
+        Tuple of (results, error). results is a list with one (output, error)
+        tuple per command, in order; error is set instead when the batch as a
+        whole could not run.
+    """
+    try:
+        return _execute_ssh_batch(client, commands, timeout)
+    finally:
+        if invalidate_reads:
+            read_cache.invalidate(client)
+
+def _execute_ssh_batch(client, commands, timeout):
+    client_error = _check_client(client)
+    if client_error:
+        return None, client_error
+
+    ssh_host = SSH_HOSTS[client]
+    marker = f"__TUF_BATCH_{uuid.uuid4().hex}__"
+    logger.debug("Executing a batch of %d commands via SSH on %s", len(commands), ssh_host)
+
+    try:
+        with span('ssh.batch', portal=client, commands=len(commands)):
+            output, error, _ = ssh_manager.run(client, _batch_script(commands, marker), timeout=timeout)
+    except socket.timeout:
+        logger.error("SSH batch timed out on %s", ssh_host)
+        return None, f"Command timed out after {timeout or ssh_manager.command_timeout}s"
+    except _connection_errors() as e:
+        logger.error("SSH exception occurred: %s", e)
+        return None, f"{CONNECTION_ERROR}: {str(e)}"
+    except Exception as e:
+        logger.error("SSH exception occurred: %s", e)
+        return None, str(e)
+
+    if error:
+        # Per-command stderr is captured in the framed output; anything here
+        # comes from the remote shell itself
+        logger.warning("SSH batch on %s wrote to stderr: %s", ssh_host, error)
+
+    results = []
+    for command_output, command_error, exit_status in _parse_batch_output(output, marker, len(commands)):
+        if exit_status is None:
+            results.append((None, 'No result returned for command'))
+            continue
+        # stderr is judged as in execute_ssh_command, so a warning such as
+        # "permission denied" fails the command even when it exits 0
+        error_message = _command_error(command_error)
+        if not error_message and exit_status != 0:
+            error_message = f"Command exited with status {exit_status}"
+            if command_output:
+                error_message = f"{error_message}: {command_output}"
+        if error_message:
+            _count_command_error(client, error_message)
+            results.append((None, error_message))
+        else:
+            results.append((command_output, None))
+    return results, None
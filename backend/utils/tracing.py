@@ -0,0 +1,266 @@
+import re
+import json
+import time
+import uuid
+import random
+import logging
+import threading
+import importlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from config import TRACE_SAMPLE_RATE, TRACE_EXPORTER, TRACE_FILE
+
+class Span:
+    """One timed operation within a trace."""
+
+    __slots__ = ('trace', 'span_id', 'parent_id', 'name', 'attributes', 'start', '_started', 'duration', 'error')
+
+    def __init__(self, trace, name, parent_id=None, attributes=None):
+        self.trace = trace
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.start = time.time()
+        self._started = time.perf_counter()
+        self.duration = None
+        self.error = None
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def end(self, error=None):
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self._started
+        if error is not None:
+            self.error = str(error)
+        self.trace.spans.append(self)
+
+    def to_dict(self):
+        return {
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start': self.start,
+            'duration_ms': round(self.duration * 1000, 3),
+            'attributes': self.attributes,
+            'error': self.error
+        }
+
+class Trace:
+    """Spans of one request or scheduler batch.
+
+    Every trace has an id, used in log lines; spans are only recorded when the
+    trace was sampled.
+    """
+
+    def __init__(self, trace_id=None, sampled=False):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.sampled = sampled
+        self.spans = []
+
+    def to_dict(self):
+        return {'trace_id': self.trace_id, 'spans': [span.to_dict() for span in self.spans]}
+
+class JsonLinesExporter:
+    """Appends each finished trace to a file as one JSON line."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, trace):
+        line = json.dumps(trace.to_dict(), default=str)
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(line + '\n')
+
+class LogExporter:
+    """Writes each finished trace to the application log at debug level."""
+
+    def export(self, trace):
+        logging.getLogger('tracing').debug(json.dumps(trace.to_dict(), default=str))
+
+def load_exporter(name):
+    """Return the exporter for TRACE_EXPORTER.
+
+    Args:
+        name: 'jsonl', 'log', 'none', or 'package.module:ClassName' for a custom
+            exporter; any object with an export(trace) method works.
+    """
+    if name == 'jsonl':
+        return JsonLinesExporter(TRACE_FILE)
+    if name == 'log':
+        return LogExporter()
+    if not name or name == 'none':
+        return None
+    module_name, _, class_name = name.partition(':')
+    return getattr(importlib.import_module(module_name), class_name)()
+
+_exporter = load_exporter(TRACE_EXPORTER)
+_current_trace = ContextVar('trace', default=None)
+_current_span = ContextVar('span', default=None)
+
+def set_exporter(exporter):
+    """Replace the exporter finished traces are sent to (None disables export)."""
+    global _exporter
+    _exporter = exporter
+
+def current_trace_id():
+    """Return the id of the trace active in this context, or None."""
+    trace = _current_trace.get()
+    return trace.trace_id if trace else None
+
+def current_span():
+    """Return the span active in this context, or None when not sampled."""
+    return _current_span.get()
+
+def begin_trace(name, trace_id=None, **attributes):
+    """Start a trace and its root span; returns a token for end_trace.
+
+    Use this where start and end happen in separate hooks, otherwise trace().
+    """
+    sampled = _exporter is not None and random.random() < TRACE_SAMPLE_RATE
+    new_trace = Trace(trace_id, sampled)
+    root = Span(new_trace, name, attributes=attributes) if sampled else None
+    return new_trace, root, _current_trace.set(new_trace), _current_span.set(root)
+
+def end_trace(token, error=None):
+    """Finish the trace started by begin_trace and export it if sampled."""
+    new_trace, root, trace_token, span_token = token
+    _current_span.reset(span_token)
+    _current_trace.reset(trace_token)
+    if root is None:
+        return
+    root.end(error)
+    try:
+        _exporter.export(new_trace)
+    except Exception as e:
+        logging.warning(f"Error exporting trace {new_trace.trace_id}: {e}")
+
+@contextmanager
+def trace(name, **attributes):
+    """Run the block as a new trace (e.g. one scheduler batch)."""
+    token = begin_trace(name, **attributes)
+    error = None
+    try:
+        yield token[1]
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        end_trace(token, error)
+
+def start_span(name, **attributes):
+    """Start a child of the current span without making it current; call .end() on it.
+
+    Returns None when the trace is not sampled.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return None
+    return Span(parent.trace, name, parent.span_id, attributes)
+
+@contextmanager
+def span(name, **attributes):
+    """Run the block as a child span of the current one.
+
+    Yields the span, or None when the trace is not sampled, so this costs
+    almost nothing outside sampled traces.
+    """
+    child = start_span(name, **attributes)
+    if child is None:
+        yield None
+        return
+    token = _current_span.set(child)
+    error = None
+    try:
+        yield child
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        _current_span.reset(token)
+        child.end(error)
+
+class TraceIdFilter(logging.Filter):
+    """Adds the current trace id to log records as %(trace_id)s."""
+
+    def filter(self, record):
+        record.trace_id = current_trace_id() or '-'
+        return True
+
+# Trace ids accepted from callers, e.g. a proxy that already started a trace
+_TRACE_ID = re.compile(r'^[0-9a-f]{16,32}$')
+
+def start_request_trace():
+    """before_request hook: trace this request."""
+    incoming = request.headers.get('X-Trace-Id', '').lower()
+    route = request.url_rule.rule if request.url_rule else request.path
+    g.trace_token = begin_trace(
+        f"{request.method} {route}",
+        trace_id=incoming if _TRACE_ID.match(incoming) else None,
+        endpoint=request.endpoint
+    )
+
+def add_trace_header(response):
+    """after_request hook: return the trace id so a slow request can be found in the traces."""
+    token = g.get('trace_token')
+    if token is not None:
+        response.headers['X-Trace-Id'] = token[0].trace_id
+        if token[1] is not None:
+            token[1].set('status', response.status_code)
+    return response
+
+def end_request_trace(exception=None):
+    """teardown_request hook: finish and export the request's trace."""
+    token = g.pop('trace_token', None)
+    if token is not None:
+        end_trace(token, exception)
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_query_span(conn, cursor, statement, parameters, context, executemany):
+    query_span = start_span('db.query', statement=' '.join(statement.split())[:500])
+    if query_span is not None:
+        conn.info.setdefault('trace_spans', []).append(query_span)
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _end_query_span(conn, cursor, statement, parameters, context, executemany):
+    spans = conn.info.get('trace_spans')
+    if spans and current_span() is not None:
+        query_span = spans.pop()
+        query_span.set('rows', cursor.rowcount)
+        query_span.end()
+
+@event.listens_for(Engine, 'handle_error')
+def _fail_query_span(exception_context):
+    connection = exception_context.connection
+    spans = connection.info.get('trace_spans') if connection is not None else None
+    if spans and current_span() is not None:
+        spans.pop().end(exception_context.original_exception)
+
+# Commit spans cover the final flush and the COMMIT itself
+@event.listens_for(Session, 'before_commit')
+def _start_commit_span(session):
+    commit_span = start_span('db.commit')
+    if commit_span is not None:
+        session.info['trace_commit'] = (commit_span, _current_span.set(commit_span))
+
+@event.listens_for(Session, 'after_commit')
+def _end_commit_span(session):
+    pending = session.info.pop('trace_commit', None)
+    if pending is not None:
+        _current_span.reset(pending[1])
+        pending[0].end()
+
+@event.listens_for(Session, 'after_rollback')
+def _fail_commit_span(session):
+    pending = session.info.pop('trace_commit', None)
+    if pending is not None:
+        _current_span.reset(pending[1])
+        pending[0].end('rolled back')
@@ -1,6 +1,6 @@
 
-import React, { useState, useMemo } from 'react';
-import { User } from '@/types/user';
+import React, { useState } from 'react';
+import { UserFacets } from '@/types/user';
 import { Search, X, Filter, ChevronDown, Check } from 'lucide-react';
 import { Input } from '@/components/ui/input';
 import { Button } from '@/components/ui/button';
@@ -21,7 +21,7 @@ import {
 import { cn } from '@/lib/utils';
 
 interface FilterBarProps {
-  users: User[];
+  facets: UserFacets;
   searchTerm: string;
   setSearchTerm: (term: string) => void;
   selectedPortal: string | null;
@@ -32,12 +32,12 @@ interface FilterBarProps {
   includedRoles: string[];
   onRoleInclusionChange: (role: string, included: boolean) => void;
   onSelectAllRoles: (type: 'include' | 'exclude', selected: boolean) => void;
-  totalCount: number;
-  filteredCount: number;
+  loadedCount: number;
+  totalCount: number | null;
 }
 
 export const FilterBar = ({
-  users,
+  facets,
   searchTerm,
   setSearchTerm,
   selectedPortal,
@@ -48,28 +48,15 @@ export const FilterBar = ({
   includedRoles,
   onRoleInclusionChange,
   onSelectAllRoles,
+  loadedCount,
   totalCount,
-  filteredCount,
 }: FilterBarProps) => {
   const [portalOpen, setPortalOpen] = useState(false);
   const [managerOpen, setManagerOpen] = useState(false);
   const [rolesOpen, setRolesOpen] = useState(false);
 
-  // Extract unique values
-  const portals = useMemo(() => 
-    [...new Set(users.map(u => u.portal).filter(Boolean))] as string[],
-    [users]
-  );
-
-  const managers = useMemo(() => 
-    [...new Set(users.map(u => u.manager).filter(Boolean))] as string[],
-    [users]
-  );
-
-  const allRoles = useMemo(() => 
-    [...new Set(users.flatMap(u => u.roles))].sort(),
-    [users]
-  );
+  // Filter options cover every user, not just the pages loaded so far
+  const { portals, managers, roles: allRoles } = facets;
 
   const activeFilters = [
     selectedPortal && { type: 'portal', value: selectedPortal, label: `Portal: ${selectedPortal}` },
@@ -112,7 +99,7 @@ export const FilterBar = ({
         <div className="relative flex-1">
           <Search className="absolute left-3 top-1/2 -translate-y-1/2 h-4 w-4 text-muted-foreground" />
           <Input
-            placeholder="Search users by name, role, or manager..."
+            placeholder="Search users by name..."
             value={searchTerm}
             onChange={(e) => setSearchTerm(e.target.value)}
             className="pl-10 bg-secondary border-border"
@@ -290,10 +277,10 @@ export const FilterBar = ({
         </div>
 
         <div className="text-sm text-muted-foreground shrink-0">
-          {filteredCount === totalCount ? (
-            <span>{totalCount} users</span>
+          {totalCount === null || loadedCount >= totalCount ? (
+            <span>{loadedCount} users</span>
           ) : (
-            <span>{filteredCount} of {totalCount} users</span>
+            <span>Showing {loadedCount} of {totalCount} users</span>
           )}
         </div>
       </div>
@@ -1,6 +1,6 @@
 
 import React, { useState } from 'react';
-import { User } from '@/types/user';
+import { User, UserSortField } from '@/types/user';
 import { UserCard } from '@/components/UserCard';
 import { UserEditDialog } from '@/components/UserEditDialog';
 import { Card } from '@/components/ui/card';
@@ -13,13 +13,17 @@ interface UserListProps {
   onUserUpdate: (updatedUser: User) => void;
   viewMode: ViewMode;
   onDeleteSelected?: (userIds: string[]) => void;
+  sort?: { field: UserSortField; direction: 'asc' | 'desc' };
+  onSortChange?: (field: UserSortField, direction: 'asc' | 'desc') => void;
 }
 
 export const UserList = ({ 
   users, 
   onUserUpdate,
   viewMode,
-  onDeleteSelected
+  onDeleteSelected,
+  sort,
+  onSortChange
 }: UserListProps) => {
   const [selectedUser, setSelectedUser] = useState<User | null>(null);
   const [dialogOpen, setDialogOpen] = useState(false);
@@ -109,6 +113,8 @@ export const UserList = ({
           onExportSelected={handleExportSelected}
           onDeleteSelected={handleDeleteSelected}
           onManagerUpdate={handleManagerUpdate}
+          sort={sort}
+          onSortChange={onSortChange}
         />
       )}
 
@@ -1,6 +1,6 @@
 
 import React, { useState } from 'react';
-import { User } from '@/types/user';
+import { User, UserSortField } from '@/types/user';
 import { UpdateManagerDialog } from '@/components/UpdateManagerDialog';
 import { UserActions } from './UserActions';
 import { UserTableHeader } from './UserTableHeader';
@@ -12,9 +12,12 @@ interface UserListTableProps {
   onExportSelected: (users: User[]) => void;
   onDeleteSelected: (userIds: string[]) => void;
   onManagerUpdate?: (userId: string, manager: string | null) => void;
+  // When given, users arrive sorted by the server and sorting is delegated to it
+  sort?: { field: UserSortField; direction: SortDirection };
+  onSortChange?: (field: UserSortField, direction: SortDirection) => void;
 }
 
-type SortField = 'name' | 'status' | 'portal' | 'manager' | 'createdDate';
+type SortField = UserSortField;
 type SortDirection = 'asc' | 'desc';
 
 export const UserListTable = ({
@@ -23,17 +26,21 @@ export const UserListTable = ({
   onExportSelected,
   onDeleteSelected,
   onManagerUpdate,
+  sort,
+  onSortChange,
 }: UserListTableProps) => {
   const [selectedUserIds, setSelectedUserIds] = useState<string[]>([]);
   const [managerDialogOpen, setManagerDialogOpen] = useState(false);
-  const [sortField, setSortField] = useState<SortField>('name');
-  const [sortDirection, setSortDirection] = useState<SortDirection>('asc');
+  const [localSortField, setSortField] = useState<SortField>('name');
+  const [localSortDirection, setSortDirection] = useState<SortDirection>('asc');
+  const sortField = sort?.field ?? localSortField;
+  const sortDirection = sort?.direction ?? localSortDirection;
 
   const allManagers = users
     .map(user => user.manager)
     .filter((manager): manager is string => Boolean(manager));
 
-  const sortedUsers = [...users].sort((a, b) => {
+  const sortedUsers = onSortChange ? users : [...users].sort((a, b) => {
     let aValue: string | number;
     let bValue: string | number;
 
@@ -68,7 +75,9 @@ export const UserListTable = ({
   });
 
   const handleSort = (field: SortField) => {
-    if (sortField === field) {
+    if (onSortChange) {
+      onSortChange(field, sortField === field && sortDirection === 'asc' ? 'desc' : 'asc');
+    } else if (sortField === field) {
       setSortDirection(sortDirection === 'asc' ? 'desc' : 'asc');
     } else {
       setSortField(field);
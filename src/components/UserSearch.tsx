@@ -1,13 +1,10 @@
-
 import React from 'react';
-import { User } from '@/types/user';
+import { UserFacets } from '@/types/user';
 import { FilterBar } from '@/components/FilterBar';
 import { ViewModeToggle, ViewMode } from '@/components/ViewModeToggle';
 
 interface UserSearchProps {
-  allUsers: User[] | undefined;
-  isLoading: boolean;
-  error: Error | null;
+  facets: UserFacets | undefined;
   searchTerm: string;
   setSearchTerm: React.Dispatch<React.SetStateAction<string>>;
   selectedPortal: string | null;
@@ -24,13 +21,12 @@ interface UserSearchProps {
   onRoleExclusionChange: (role: string, excluded: boolean) => void;
   onRoleInclusionChange: (role: string, included: boolean) => void;
   onSelectAllRoles: (type: 'include' | 'exclude', selected: boolean) => void;
-  filteredCount?: number;
+  loadedCount?: number;
+  totalCount?: number | null;
 }
 
 export const UserSearch = ({
-  allUsers,
-  isLoading,
-  error,
+  facets,
   searchTerm,
   setSearchTerm,
   viewMode,
@@ -45,9 +41,10 @@ export const UserSearch = ({
   onRoleExclusionChange,
   onRoleInclusionChange,
   onSelectAllRoles,
-  filteredCount = 0
+  loadedCount = 0,
+  totalCount = null
 }: UserSearchProps) => {
-  if (isLoading || error || !allUsers) {
+  if (!facets) {
     return null;
   }
 
@@ -59,7 +56,7 @@ export const UserSearch = ({
       </div>
       
       <FilterBar
-        users={allUsers}
+        facets={facets}
         searchTerm={searchTerm}
         setSearchTerm={setSearchTerm}
         selectedPortal={selectedPortal}
@@ -70,9 +67,9 @@ export const UserSearch = ({
         includedRoles={includedRoles}
         onRoleInclusionChange={onRoleInclusionChange}
         onSelectAllRoles={onSelectAllRoles}
-        totalCount={allUsers.length}
-        filteredCount={filteredCount}
+        loadedCount={loadedCount}
+        totalCount={totalCount}
       />
     </div>
   );
-};
\ No newline at end of file
+};
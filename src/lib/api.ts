@@ -1,22 +1,31 @@
 
-import { User } from '@/types/user';
-import { RoleChangeSchedule } from '@/types/schedule';
+import { User, UserFacets, UsersPage, UsersQuery } from '@/types/user';
+import { RoleChangeSchedule, ScheduledJobsPage, ScheduledJobsQuery } from '@/types/schedule';
 
 // API URL paths adjusted for the new base path structure
 const API_URL = '/teleportui/api';
 
-export async function fetchUsers(portal?: string): Promise<User[]> {
+// Function to fetch one page of users, filtered and sorted on the server
+export async function fetchUsersPage(query: UsersQuery = {}): Promise<UsersPage> {
   const token = localStorage.getItem('token');
   
   if (!token) {
     throw new Error('Token is missing! Please login first.');
   }
   
-  const url = portal 
-    ? `${API_URL}/users?portal=${encodeURIComponent(portal)}` 
-    : `${API_URL}/users`;
-  
-  const response = await fetch(url, {
+  const params = new URLSearchParams({
+    limit: String(query.limit ?? 50),
+    count: query.count ?? 'exact',
+  });
+  if (query.portal) params.set('portal', query.portal);
+  if (query.manager) params.set('manager', query.manager);
+  if (query.roles && query.roles.length > 0) params.set('roles', query.roles.join(','));
+  if (query.namePrefix) params.set('name_prefix', query.namePrefix);
+  if (query.sort) params.set('sort', query.sort);
+  if (query.order) params.set('order', query.order);
+  if (query.cursor) params.set('cursor', query.cursor);
+  
+  const response = await fetch(`${API_URL}/users?${params}`, {
     headers: {
       'x-access-token': token,
     },
@@ -37,6 +46,49 @@ export async function fetchUsers(portal?: string): Promise<User[]> {
   return response.json();
 }
 
+// Function to fetch every user matching a query, for CSV export only; lists page instead
+export async function fetchAllUsers(query: UsersQuery = {}): Promise<User[]> {
+  const users: User[] = [];
+  let cursor: string | null = null;
+  
+  do {
+    const page: UsersPage = await fetchUsersPage({ ...query, cursor, limit: 1000, count: 'none' });
+    users.push(...page.users);
+    cursor = page.next_cursor;
+  } while (cursor);
+  
+  return users;
+}
+
+// Function to fetch the portals, managers and roles offered as user list filters
+export async function fetchUserFacets(): Promise<UserFacets> {
+  const token = localStorage.getItem('token');
+  
+  if (!token) {
+    throw new Error('Token is missing! Please login first.');
+  }
+  
+  const response = await fetch(`${API_URL}/users/facets`, {
+    headers: {
+      'x-access-token': token,
+    },
+  });
+  
+  if (response.status === 403) {
+    const errorData = await response.json();
+    if (errorData.message?.includes('Token has expired')) {
+      localStorage.removeItem('token');
+      throw new Error('Token has expired! Please login again.');
+    }
+    throw new Error(errorData.message || 'Authentication failed');
+  }
+  
+  if (!response.ok) {
+    throw new Error('Failed to fetch user filters');
+  }
+  return response.json();
+}
+
 export async function updateUser(user: User): Promise<{ success: boolean }> {
   const token = localStorage.getItem('token');
   
@@ -131,6 +183,7 @@ export async function fetchUsersFromSSH(client: string): Promise<{ success: bool
     throw new Error('Token is missing! Please login first.');
   }
   
+  // Start (or attach to) a background sync job for the portal
   const response = await fetch('/teleportui/teleport/fetch-users', {
     method: 'POST',
     headers: {
@@ -145,7 +198,31 @@ export async function fetchUsersFromSSH(client: string): Promise<{ success: bool
     throw new Error(errorData.message || 'Failed to fetch users from SSH');
   }
   
-  return response.json();
+  const { job_id: jobId } = await response.json();
+  
+  // Poll the job until it finishes
+  while (true) {
+    await new Promise((resolve) => setTimeout(resolve, 1000));
+    
+    const jobResponse = await fetch(`/teleportui/teleport/sync-jobs/${encodeURIComponent(jobId)}`, {
+      headers: {
+        'x-access-token': token,
+      },
+    });
+    
+    if (!jobResponse.ok) {
+      const errorData = await jobResponse.json();
+      throw new Error(errorData.message || 'Failed to fetch sync job status');
+    }
+    
+    const job = await jobResponse.json();
+    if (job.status === 'failed') {
+      throw new Error(job.message || 'Failed to fetch users from SSH');
+    }
+    if (job.status === 'completed') {
+      return { success: true, message: job.message, orphaned_users: job.orphaned_users };
+    }
+  }
 }
 
 export async function manageOrphanedUsers(
@@ -218,15 +295,21 @@ export async function scheduleRoleChange(schedule: RoleChangeSchedule): Promise<
   return response.json();
 }
 
-// Function to fetch all scheduled role changes
-export async function fetchScheduledJobs(): Promise<RoleChangeSchedule[]> {
+// Function to fetch one page of scheduled role changes, filtered on the server
+export async function fetchScheduledJobs(query: ScheduledJobsQuery = {}): Promise<ScheduledJobsPage> {
   const token = localStorage.getItem('token');
   
   if (!token) {
     throw new Error('Token is missing! Please login first.');
   }
   
-  const response = await fetch('/teleportui/teleport/scheduled-jobs', {
+  const params = new URLSearchParams({ limit: String(query.limit ?? 50) });
+  if (query.status) params.set('status', query.status);
+  if (query.portal) params.set('portal', query.portal);
+  if (query.order) params.set('order', query.order);
+  if (query.cursor) params.set('cursor', query.cursor);
+  
+  const response = await fetch(`/teleportui/teleport/scheduled-jobs?${params}`, {
     method: 'GET',
     headers: {
       'Content-Type': 'application/json',
@@ -253,6 +336,41 @@ export async function fetchScheduledJobs(): Promise<RoleChangeSchedule[]> {
   return response.json();
 }
 
+// Function to fetch one scheduled role change, including its result
+export async function fetchScheduledJob(id: string): Promise<RoleChangeSchedule> {
+  const token = localStorage.getItem('token');
+  
+  if (!token) {
+    throw new Error('Token is missing! Please login first.');
+  }
+  
+  const response = await fetch(`/teleportui/teleport/scheduled-jobs/${encodeURIComponent(id)}`, {
+    method: 'GET',
+    headers: {
+      'Content-Type': 'application/json',
+      'x-access-token': token,
+    }
+  });
+  
+  if (response.status === 403) {
+    // Handle token expiration
+    const errorData = await response.json();
+    if (errorData.message?.includes('Token has expired')) {
+      // Clear the invalid token
+      localStorage.removeItem('token');
+      throw new Error('Token has expired! Please login again.');
+    }
+    throw new Error(errorData.message || 'Authentication failed');
+  }
+  
+  if (!response.ok) {
+    const errorData = await response.json();
+    throw new Error(errorData.message || 'Failed to fetch scheduled job');
+  }
+  
+  return response.json();
+}
+
 // Function to execute a role change immediately
 export async function executeRoleChange(userId: string, userName: string, portal: string, action: 'add' | 'remove', roles: string[]): Promise<{ success: boolean; message: string }> {
   const token = localStorage.getItem('token');
@@ -3,15 +3,19 @@ import React, { useState, useEffect } from 'react';
 import { UserList } from '@/components/UserList';
 import { Header } from '@/components/Header';
 import { Sidebar } from '@/components/Sidebar';
-import { useQuery } from '@tanstack/react-query';
-import { fetchUsers, updateUser, deleteUsers } from '@/lib/api';
+import { keepPreviousData, useInfiniteQuery, useQuery } from '@tanstack/react-query';
+import { fetchUsersPage, fetchAllUsers, fetchUserFacets, updateUser, deleteUsers } from '@/lib/api';
 import { Loader } from '@/components/Loader';
 import { ErrorDisplay } from '@/components/ErrorDisplay';
-import { User } from '@/types/user';
+import { User, UserSortField } from '@/types/user';
+import { Button } from '@/components/ui/button';
 import { useToast } from '@/hooks/use-toast';
 import { ViewMode } from '@/components/ViewModeToggle';
 import { UserSearch } from '@/components/UserSearch';
 
+// Users fetched per request; more pages load on demand
+const PAGE_SIZE = 50;
+
 const Index = () => {
   const [searchTerm, setSearchTerm] = useState('');
   const [sidebarOpen, setSidebarOpen] = useState(false);
@@ -22,34 +26,67 @@ const Index = () => {
   const [viewMode, setViewMode] = useState<ViewMode>('table'); // Default to table
   const { toast } = useToast();
   
-  const { data: allUsers, isLoading, error, refetch } = useQuery({
-    queryKey: ['users'],
-    queryFn: () => fetchUsers(),
+  const [debouncedSearch, setDebouncedSearch] = useState('');
+  const [sort, setSort] = useState<{ field: UserSortField; direction: 'asc' | 'desc' }>({ field: 'name', direction: 'asc' });
+
+  // Wait for typing to pause before querying the server
+  useEffect(() => {
+    const timer = setTimeout(() => setDebouncedSearch(searchTerm.trim()), 300);
+    return () => clearTimeout(timer);
+  }, [searchTerm]);
+
+  const { data: facets, refetch: refetchFacets } = useQuery({
+    queryKey: ['user-facets'],
+    queryFn: () => fetchUserFacets(),
   });
 
   useEffect(() => {
-    if (allUsers && allUsers.length > 0) {
-      const allAvailableRoles = Array.from(
-        new Set(allUsers.flatMap(user => user.roles))
-      );
-      setIncludedRoles(allAvailableRoles);
+    if (facets) {
+      setIncludedRoles(facets.roles);
     }
-  }, [allUsers]);
+  }, [facets]);
 
-  const filteredUsers = (allUsers || []).filter(user => {
-    const matchesSearch = 
-      user.name.toLowerCase().includes(searchTerm.toLowerCase()) ||
-      user.roles.some(role => role.toLowerCase().includes(searchTerm.toLowerCase())) ||
-      (user.manager && user.manager.toLowerCase().includes(searchTerm.toLowerCase()));
-    
-    const matchesPortal = !selectedPortal || user.portal === selectedPortal;
-    const matchesManager = !selectedManager || user.manager === selectedManager;
-    const hasExcludedRole = user.roles.some(role => excludedRoles.includes(role));
-    const hasIncludedRole = includedRoles.length === 0 || user.roles.some(role => includedRoles.includes(role));
-    
-    return matchesSearch && matchesPortal && matchesManager && !hasExcludedRole && hasIncludedRole;
+  // Roles are only sent when the selection actually narrows the list
+  const roleFilter = facets && includedRoles.length > 0 && includedRoles.length < facets.roles.length
+    ? includedRoles
+    : undefined;
+
+  // Filtering, sorting and paging all happen on the server
+  const {
+    data,
+    isLoading,
+    error,
+    refetch: refetchUsers,
+    fetchNextPage,
+    hasNextPage,
+    isFetchingNextPage,
+  } = useInfiniteQuery({
+    queryKey: ['users', selectedPortal, selectedManager, roleFilter, debouncedSearch, sort],
+    queryFn: ({ pageParam }) => fetchUsersPage({
+      portal: selectedPortal,
+      manager: selectedManager,
+      roles: roleFilter,
+      namePrefix: debouncedSearch || undefined,
+      sort: sort.field,
+      order: sort.direction,
+      limit: PAGE_SIZE,
+      cursor: pageParam,
+      // Count once per query; later pages reuse the first page's total
+      count: pageParam ? 'none' : 'exact',
+    }),
+    initialPageParam: null as string | null,
+    getNextPageParam: (lastPage) => lastPage.next_cursor ?? undefined,
+    placeholderData: keepPreviousData,
   });
 
+  const users = data?.pages.flatMap(page => page.users) ?? [];
+  const totalCount = data?.pages[0]?.total ?? null;
+
+  const refetch = () => {
+    refetchFacets();
+    return refetchUsers();
+  };
+
   const handleUserUpdate = async (updatedUser: User) => {
     try {
       await updateUser(updatedUser);
@@ -81,8 +118,8 @@ const Index = () => {
   };
 
   const handleSelectAllRoles = (type: 'include' | 'exclude', selected: boolean) => {
-    if (!allUsers) return;
-    const allAvailableRoles = Array.from(new Set(allUsers.flatMap(user => user.roles)));
+    if (!facets) return;
+    const allAvailableRoles = facets.roles;
     if (type === 'include') setIncludedRoles(selected ? allAvailableRoles : []);
     else setExcludedRoles(selected ? allAvailableRoles : []);
   };
@@ -104,8 +141,16 @@ const Index = () => {
     }
   };
 
-  const handleExportAllUsers = () => {
-    if (!allUsers || allUsers.length === 0) {
+  const handleExportAllUsers = async () => {
+    // Export walks every page on demand; the list itself only holds loaded pages
+    let allUsers: User[];
+    try {
+      allUsers = await fetchAllUsers();
+    } catch (error) {
+      toast({ title: "Export failed", description: "Failed to load users for export.", variant: "destructive" });
+      return;
+    }
+    if (allUsers.length === 0) {
       toast({ title: "No Data", description: "No users to export.", variant: "destructive" });
       return;
     }
@@ -137,7 +182,7 @@ const Index = () => {
       <Sidebar 
         isOpen={sidebarOpen} 
         setIsOpen={setSidebarOpen} 
-        users={allUsers || []} 
+        users={users} 
         onFetchData={refetch}
         onExportCsv={handleExportAllUsers}
       />
@@ -145,9 +190,7 @@ const Index = () => {
         <Header />
         <main className="p-6">
           <UserSearch
-            allUsers={allUsers}
-            isLoading={isLoading}
-            error={error as Error | null}
+            facets={facets}
             searchTerm={searchTerm}
             setSearchTerm={setSearchTerm}
             selectedPortal={selectedPortal}
@@ -164,7 +207,8 @@ const Index = () => {
             onRoleExclusionChange={handleRoleExclusionChange}
             onRoleInclusionChange={handleRoleInclusionChange}
             onSelectAllRoles={handleSelectAllRoles}
-            filteredCount={filteredUsers.length}
+            loadedCount={users.length}
+            totalCount={totalCount}
           />
           
           {isLoading ? (
@@ -172,12 +216,23 @@ const Index = () => {
           ) : error ? (
             <ErrorDisplay message="Failed to load users." />
           ) : (
-            <UserList 
-              users={filteredUsers} 
-              onUserUpdate={handleUserUpdate} 
-              viewMode={viewMode}
-              onDeleteSelected={handleDeleteUsers}
-            />
+            <>
+              <UserList 
+                users={users} 
+                onUserUpdate={handleUserUpdate} 
+                viewMode={viewMode}
+                onDeleteSelected={handleDeleteUsers}
+                sort={sort}
+                onSortChange={(field, direction) => setSort({ field, direction })}
+              />
+              {hasNextPage && (
+                <div className="flex justify-center pt-4">
+                  <Button variant="outline" size="sm" onClick={() => fetchNextPage()} disabled={isFetchingNextPage}>
+                    {isFetchingNextPage ? 'Loading...' : 'Load more'}
+                  </Button>
+                </div>
+              )}
+            </>
           )}
         </main>
       </div>
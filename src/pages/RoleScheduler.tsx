@@ -1,10 +1,10 @@
 
-import React, { useState } from 'react';
+import React, { useEffect, useState } from 'react';
 import { Header } from '@/components/Header';
 import { Sidebar } from '@/components/Sidebar';
 import { UserRoleScheduler } from '@/components/UserRoleScheduler';
-import { useQuery } from '@tanstack/react-query';
-import { fetchUsers } from '@/lib/api';
+import { keepPreviousData, useQuery } from '@tanstack/react-query';
+import { fetchUsersPage } from '@/lib/api';
 import { Loader } from '@/components/Loader';
 import { ErrorDisplay } from '@/components/ErrorDisplay';
 import { User } from '@/types/user';
@@ -19,15 +19,23 @@ const RoleScheduler = () => {
   const [sidebarOpen, setSidebarOpen] = useState(false);
   const [selectedUser, setSelectedUser] = useState<User | null>(null);
 
-  const { data: allUsers, isLoading, error } = useQuery({
-    queryKey: ['users'],
-    queryFn: () => fetchUsers(),
+  const [debouncedSearch, setDebouncedSearch] = useState('');
+
+  // Wait for typing to pause before querying the server
+  useEffect(() => {
+    const timer = setTimeout(() => setDebouncedSearch(searchTerm.trim()), 300);
+    return () => clearTimeout(timer);
+  }, [searchTerm]);
+
+  // Only the top matches are fetched, by name prefix on the server
+  const { data, isLoading, error } = useQuery({
+    queryKey: ['users', 'search', debouncedSearch],
+    queryFn: () => fetchUsersPage({ namePrefix: debouncedSearch, limit: 10, count: 'none' }),
+    enabled: debouncedSearch.length > 0,
+    placeholderData: keepPreviousData,
   });
 
-  const filteredUsers = (allUsers || []).filter(user => 
-    user.name.toLowerCase().includes(searchTerm.toLowerCase()) ||
-    user.portal?.toLowerCase().includes(searchTerm.toLowerCase())
-  ).slice(0, 10);
+  const filteredUsers = debouncedSearch ? data?.users ?? [] : [];
 
   const getPortalColor = (portal: string | null) => {
     switch (portal) {
@@ -43,7 +51,7 @@ const RoleScheduler = () => {
       <Sidebar 
         isOpen={sidebarOpen} 
         setIsOpen={setSidebarOpen} 
-        users={allUsers || []}
+        users={filteredUsers}
         currentPage="scheduler" 
       />
       <div className={`transition-all duration-300 ${sidebarOpen ? 'ml-60' : 'ml-16'}`}>
@@ -81,7 +89,7 @@ const RoleScheduler = () => {
                 <Search className="absolute left-3 top-1/2 -translate-y-1/2 h-4 w-4 text-muted-foreground" />
                 <Input
                   type="text"
-                  placeholder="Search by name or portal..."
+                  placeholder="Search by name..."
                   value={searchTerm}
                   onChange={(e) => setSearchTerm(e.target.value)}
                   className="pl-10 bg-background border-input"
@@ -1,6 +1,6 @@
 
-import React, { useState } from 'react';
-import { useQuery } from '@tanstack/react-query';
+import React, { useEffect, useState } from 'react';
+import { useInfiniteQuery, useQuery } from '@tanstack/react-query';
 import { Header } from '@/components/Header';
 import { Sidebar } from '@/components/Sidebar';
 import { Loader } from '@/components/Loader';
@@ -16,7 +16,7 @@ import {
   ChevronDown, ChevronUp, User, Building2, Shield
 } from 'lucide-react';
 import { format } from 'date-fns';
-import { fetchScheduledJobs } from '@/lib/api';
+import { fetchScheduledJobs, fetchScheduledJob } from '@/lib/api';
 import { RoleChangeSchedule } from '@/types/schedule';
 import { cn } from '@/lib/utils';
 import {
@@ -33,40 +33,50 @@ const ScheduledJobs = () => {
   const [sortBy, setSortBy] = useState<'time-asc' | 'time-desc'>('time-desc');
   const [expandedJob, setExpandedJob] = useState<string | null>(null);
   
-  const { data: allJobs, isLoading, error, refetch } = useQuery({
-    queryKey: ['scheduled-jobs'],
-    queryFn: () => fetchScheduledJobs(),
+  // Status, portal and ordering are applied by the server; pages load on demand
+  const {
+    data,
+    isLoading,
+    error,
+    refetch,
+    fetchNextPage,
+    hasNextPage,
+    isFetchingNextPage,
+  } = useInfiniteQuery({
+    queryKey: ['scheduled-jobs', portalFilter, statusFilter, sortBy],
+    queryFn: ({ pageParam }) => fetchScheduledJobs({
+      portal: portalFilter !== 'all' ? portalFilter : undefined,
+      status: statusFilter !== 'all' ? statusFilter : undefined,
+      order: sortBy === 'time-asc' ? 'asc' : 'desc',
+      cursor: pageParam,
+    }),
+    initialPageParam: null as string | null,
+    getNextPageParam: (lastPage) => lastPage.next_cursor ?? undefined,
   });
 
-  const getFilteredAndSortedJobs = () => {
-    if (!allJobs) return [];
-    
-    let filtered = allJobs;
-    
-    if (searchTerm) {
-      filtered = filtered.filter(job => 
-        job.userName.toLowerCase().includes(searchTerm.toLowerCase())
-      );
-    }
-    
-    if (portalFilter && portalFilter !== 'all') {
-      filtered = filtered.filter(job => job.portal === portalFilter);
-    }
+  const allJobs = data?.pages.flatMap(page => page.jobs) ?? [];
 
-    if (statusFilter && statusFilter !== 'all') {
-      filtered = filtered.filter(job => job.status === statusFilter);
-    }
-    
-    return filtered.sort((a, b) => {
-      const timeA = new Date(a.scheduledTime).getTime();
-      const timeB = new Date(b.scheduledTime).getTime();
-      return sortBy === 'time-asc' ? timeA - timeB : timeB - timeA;
+  // The list omits command output; load it for the expanded job only
+  const { data: expandedDetail } = useQuery({
+    queryKey: ['scheduled-job', expandedJob],
+    queryFn: () => fetchScheduledJob(expandedJob as string),
+    enabled: !!expandedJob,
+  });
+
+  // Remember every portal seen so the filter keeps its options once one is selected
+  const [uniquePortals, setUniquePortals] = useState<string[]>([]);
+  useEffect(() => {
+    setUniquePortals(previous => {
+      const portals = new Set(previous);
+      allJobs.forEach(job => portals.add(job.portal));
+      return portals.size === previous.length ? previous : [...portals].sort();
     });
-  };
-  
-  const filteredJobs = getFilteredAndSortedJobs();
-  
-  const uniquePortals = allJobs ? [...new Set(allJobs.map(job => job.portal))] : [];
+  }, [data]);
+
+  // User name search matches substrings, so it filters the loaded pages
+  const filteredJobs = searchTerm
+    ? allJobs.filter(job => job.userName.toLowerCase().includes(searchTerm.toLowerCase()))
+    : allJobs;
   
   const getStatusConfig = (status: string) => {
     switch (status) {
@@ -84,6 +94,13 @@ const ScheduledJobs = () => {
           bg: 'bg-status-error/10',
           label: 'Failed'
         };
+      case 'dead': 
+        return { 
+          icon: XCircle, 
+          color: 'text-status-error', 
+          bg: 'bg-status-error/10',
+          label: 'Dead'
+        };
       case 'scheduled': 
         return { 
           icon: Timer, 
@@ -91,6 +108,13 @@ const ScheduledJobs = () => {
           bg: 'bg-status-warning/10',
           label: 'Pending'
         };
+      case 'running': 
+        return { 
+          icon: RefreshCw, 
+          color: 'text-status-warning', 
+          bg: 'bg-status-warning/10',
+          label: 'Running'
+        };
       default: 
         return { 
           icon: Clock, 
@@ -101,11 +125,12 @@ const ScheduledJobs = () => {
     }
   };
 
+  // Counts cover the pages loaded so far
   const stats = {
-    total: allJobs?.length || 0,
-    pending: allJobs?.filter(j => j.status === 'scheduled').length || 0,
-    completed: allJobs?.filter(j => j.status === 'completed').length || 0,
-    failed: allJobs?.filter(j => j.status === 'failed').length || 0,
+    total: allJobs.length,
+    pending: allJobs.filter(j => j.status === 'scheduled').length,
+    completed: allJobs.filter(j => j.status === 'completed').length,
+    failed: allJobs.filter(j => j.status === 'failed' || j.status === 'dead').length,
   };
 
   return (
@@ -145,8 +170,8 @@ const ScheduledJobs = () => {
               <CardContent className="p-4">
                 <div className="flex items-center justify-between">
                   <div>
-                    <p className="text-sm text-muted-foreground">Total Jobs</p>
-                    <p className="text-2xl font-semibold">{stats.total}</p>
+                    <p className="text-sm text-muted-foreground">{hasNextPage ? 'Loaded Jobs' : 'Total Jobs'}</p>
+                    <p className="text-2xl font-semibold">{stats.total}{hasNextPage ? '+' : ''}</p>
                   </div>
                   <div className="p-2 rounded-lg bg-muted">
                     <CalendarDays className="h-5 w-5 text-muted-foreground" />
@@ -229,7 +254,9 @@ const ScheduledJobs = () => {
                     <SelectItem value="all">All Status</SelectItem>
                     <SelectItem value="scheduled">Pending</SelectItem>
                     <SelectItem value="completed">Completed</SelectItem>
+                    <SelectItem value="running">Running</SelectItem>
                     <SelectItem value="failed">Failed</SelectItem>
+                    <SelectItem value="dead">Dead</SelectItem>
                   </SelectContent>
                 </Select>
                 <Button 
@@ -257,6 +284,7 @@ const ScheduledJobs = () => {
                 const statusConfig = getStatusConfig(job.status);
                 const StatusIcon = statusConfig.icon;
                 const isExpanded = expandedJob === job.id;
+                const result = isExpanded && expandedDetail?.id === job.id ? expandedDetail.result : undefined;
 
                 return (
                   <Collapsible key={job.id} open={isExpanded} onOpenChange={() => setExpandedJob(isExpanded ? null : job.id)}>
@@ -334,15 +362,23 @@ const ScheduledJobs = () => {
                             </div>
 
                             {/* Result (if exists) */}
-                            {job.result && (
+                            {result && (
                               <div>
                                 <p className="text-xs font-medium text-muted-foreground mb-2">Result</p>
                                 <p className="text-sm text-foreground bg-muted p-2 rounded-md font-mono">
-                                  {job.result}
+                                  {result}
                                 </p>
                               </div>
                             )}
 
+                            {/* Pending retry after a transient failure */}
+                            {job.status === 'scheduled' && job.nextAttemptAt && (
+                              <div className="flex items-center gap-2 text-xs text-status-warning">
+                                <RefreshCw className="h-3 w-3" />
+                                Attempt {job.attemptCount} failed{job.lastError ? `: ${job.lastError}` : ''}. Retrying at {format(new Date(job.nextAttemptAt), 'PPpp')}
+                              </div>
+                            )}
+
                             {/* Executed At */}
                             {job.executedAt && (
                               <div className="flex items-center gap-2 text-xs text-muted-foreground">
@@ -361,7 +397,7 @@ const ScheduledJobs = () => {
                             )}
 
                             {/* Actions for failed jobs */}
-                            {job.status === 'failed' && (
+                            {(job.status === 'failed' || job.status === 'dead') && (
                               <div className="flex gap-2 pt-2">
                                 <Button variant="outline" size="sm">
                                   <RefreshCw className="h-3 w-3 mr-1" />
@@ -376,12 +412,24 @@ const ScheduledJobs = () => {
                   </Collapsible>
                 );
               })}
+              {hasNextPage && (
+                <div className="flex justify-center pt-2">
+                  <Button variant="outline" size="sm" onClick={() => fetchNextPage()} disabled={isFetchingNextPage}>
+                    {isFetchingNextPage ? 'Loading...' : 'Load more'}
+                  </Button>
+                </div>
+              )}
             </div>
           ) : (
             <Card className="border-border bg-card">
               <CardContent className="py-12 text-center">
                 <CalendarDays className="h-12 w-12 text-muted-foreground mx-auto mb-4" />
                 <p className="text-muted-foreground">No scheduled jobs found matching your filters</p>
+                {hasNextPage && (
+                  <Button variant="outline" size="sm" className="mt-4" onClick={() => fetchNextPage()} disabled={isFetchingNextPage}>
+                    {isFetchingNextPage ? 'Loading...' : 'Load more'}
+                  </Button>
+                )}
               </CardContent>
             </Card>
           )}
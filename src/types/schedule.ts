@@ -10,4 +10,20 @@ export interface RoleChangeSchedule {
   status?: string;
   executedAt?: string;
   result?: string;
+  attemptCount?: number;
+  nextAttemptAt?: string;
+  lastError?: string;
+}
+
+export interface ScheduledJobsQuery {
+  status?: string;
+  portal?: string;
+  order?: 'asc' | 'desc';
+  limit?: number;
+  cursor?: string | null;
+}
+
+export interface ScheduledJobsPage {
+  jobs: RoleChangeSchedule[];
+  next_cursor: string | null;
 }
@@ -9,3 +9,30 @@ export interface User {
   manager?: string | null;
   portal: 'kocharsoft' | 'igzy' | 'maxicus' | null;
 }
+
+export interface UsersPage {
+  users: User[];
+  next_cursor: string | null;
+  total: number | null;
+  total_is_estimate: boolean;
+}
+
+export type UserSortField = 'name' | 'status' | 'portal' | 'manager' | 'createdDate';
+
+export interface UsersQuery {
+  portal?: string | null;
+  manager?: string | null;
+  roles?: string[];
+  namePrefix?: string;
+  sort?: UserSortField;
+  order?: 'asc' | 'desc';
+  limit?: number;
+  cursor?: string | null;
+  count?: 'exact' | 'estimate' | 'none';
+}
+
+export interface UserFacets {
+  portals: string[];
+  managers: string[];
+  roles: string[];
+}